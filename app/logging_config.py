@@ -1,38 +1,130 @@
- (cd "$(git rev-parse --show-toplevel)" && git apply --3way <<'EOF' 
-diff --git a/app/logging_config.py b/app/logging_config.py
-new file mode 100644
-index 0000000000000000000000000000000000000000..39af44a18442d5f4f749e292012dce55a7eae26c
---- /dev/null
-+++ b/app/logging_config.py
-@@ -0,0 +1,28 @@
-+"""Configuração centralizada de logging para a aplicação DriveMaps."""
-+
-+import logging
-+from pathlib import Path
-+
-+
-+LOG_FILE = Path('app.log')
-+
-+
-+def configure_logging(level: int = logging.INFO) -> None:
-+    """Configura o logging apenas uma vez, evitando handlers duplicados."""
-+    root_logger = logging.getLogger()
-+    if root_logger.handlers:
-+        return
-+
-+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-+
-+    logging.basicConfig(
-+        level=level,
-+        format='%(asctime)s - %(levelname)s - %(message)s',
-+        handlers=[
-+            logging.StreamHandler(),
-+            logging.FileHandler(LOG_FILE)
-+        ]
-+    )
-+
-+
-+__all__ = ["configure_logging"]
- 
-EOF
-)
+"""
+Configuração centralizada de logging para a aplicação DriveMaps.
+
+Os pedidos só colocam os registos numa fila em memória; a formatação e a escrita na
+consola e em `app.log` são feitas por uma thread própria (QueueListener). A mensagem
+é formatada apenas nessa thread, por isso os argumentos devem ser passados ao estilo
+`logger.info("... %s", valor)` e não já interpolados.
+
+O ficheiro recebe uma linha JSON por registo, com os campos passados em `extra=`
+(ex.: o `span` de cada geocodificação, ver `app.utils.rastreio`). A consola mantém
+texto legível, exceto com LOG_FORMATO=json (ex.: quando os logs são recolhidos do stdout).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime
+from pathlib import Path
+
+
+LOG_FILE = Path(os.environ.get('LOG_FICHEIRO', 'app.log'))
+LOG_FORMATO = os.environ.get('LOG_FORMATO', 'texto').lower()   # formato da consola: texto | json
+LOG_FILA_MAX = int(os.environ.get('LOG_FILA_MAX', '10000'))    # registos em espera antes de descartar
+FORMATO_TEXTO = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Atributos próprios de um LogRecord: o que sobra veio de `extra=`
+_ATRIBUTOS_REGISTO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_fila_handler = None
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registo, com os campos de `extra=` ao nível de topo."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for nome, valor in vars(record).items():
+            if nome not in _ATRIBUTOS_REGISTO and not nome.startswith('_'):
+                dados[nome] = valor
+        if record.exc_info:
+            dados['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            dados['exc'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class _FilaHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler sem formatação na thread que regista (o `prepare` da biblioteca
+    formata a mensagem antes de a pôr na fila). Com a fila cheia o registo é
+    descartado em vez de bloquear o pedido; o total descartado é reportado a seguir.
+    """
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.descartados:
+                aviso = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                          'Fila de logging cheia: %d registos descartados.', (self.descartados,), None)
+                self.queue.put_nowait(aviso)
+                self.descartados = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+def _handlers_saida() -> list:
+    consola = logging.StreamHandler()
+    consola.setFormatter(FormatadorJSON() if LOG_FORMATO == 'json' else logging.Formatter(FORMATO_TEXTO))
+    ficheiro = logging.FileHandler(LOG_FILE, encoding='utf-8')
+    ficheiro.setFormatter(FormatadorJSON())
+    return [consola, ficheiro]
+
+
+def _iniciar_listener() -> None:
+    global _listener
+    fila = queue.Queue(maxsize=LOG_FILA_MAX)
+    _fila_handler.queue = fila
+    _listener = logging.handlers.QueueListener(fila, *_handlers_saida(), respect_handler_level=True)
+    _listener.start()
+
+
+def _apos_fork() -> None:
+    """A thread do listener não sobrevive ao fork (gunicorn com preload): cada worker arranca a sua."""
+    if _fila_handler is not None:
+        _iniciar_listener()
+
+
+def parar_logging() -> None:
+    """Escreve os registos ainda na fila e para a thread de escrita."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Configura o logging apenas uma vez, evitando handlers duplicados."""
+    global _fila_handler
+    root_logger = logging.getLogger()
+    if root_logger.handlers:
+        return
+
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+    _fila_handler = _FilaHandler(None)
+    _iniciar_listener()
+    root_logger.addHandler(_fila_handler)
+    root_logger.setLevel(level)
+    atexit.register(parar_logging)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_apos_fork)
+
+
+__all__ = ["configure_logging", "parar_logging", "FormatadorJSON"]
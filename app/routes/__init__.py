@@ -4,9 +4,13 @@ from .importacao import importacao_bp as importacao_routes
 from .preview import preview_bp as preview_routes
 from .gerar import gerar_bp as gerar_routes
 from .api import api_routes
+from .metricas import metricas_bp as metricas_routes
+from .perfil import perfil_bp as perfil_routes
 
 def register_routes(app):
     app.register_blueprint(importacao_routes)
     app.register_blueprint(preview_routes)
     app.register_blueprint(gerar_routes)
     app.register_blueprint(api_routes)
+    app.register_blueprint(metricas_routes)
+    app.register_blueprint(perfil_routes)
@@ -1,16 +1,21 @@
 # app/routes/api.py
 
-from flask import Blueprint, request, jsonify, session
-from app.utils.geocoder import valida_rua, obter_endereco_por_coordenadas
+from flask import Blueprint, request, jsonify, session, make_response
+from app.utils.geocoder import valida_rua, valida_ruas_em_lote, obter_endereco_por_coordenadas
 from app.utils.helpers import normalizar, sanitizar_endereco, validar_cep, cor_por_tipo
+from app.utils import lista_enderecos, limite_taxa, saude_provedores
 import logging
-from typing import Dict, Any
+import os
+from typing import Dict, Any, List
 
 api_routes = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
 
 # Fallback numérico para garantir que as coordenadas são sempre floats
 FALLBACK_LAT, FALLBACK_LNG = 39.3999, -8.2245
+# Máximo de endereços por pedido de validação em lote
+VALIDAR_LOTE_MAX = int(os.environ.get('VALIDAR_LOTE_MAX', '500'))
+_NAO_ENCONTRADO = "Endereço não encontrado."
 
 def _comparar_ruas(rua1: str, rua2: str) -> bool:
     if not rua1 or not rua2: return False
@@ -33,6 +38,48 @@ def _update_item_com_geo_resultado(item: Dict, resultado: Dict, endereco: str, c
         "locality": resultado.get('locality', '')
     })
 
+def _lista_id():
+    """Id da lista de endereços da sessão (os itens estão em `lista_enderecos`)."""
+    return lista_enderecos.id_da_sessao(session)
+
+def _etag(lista_id: str, versao: int) -> str:
+    return f"{lista_id}-{versao}"
+
+def _resposta_mutacao(lista_id: str, versao: int, **dados):
+    """
+    Resposta de uma alteração: o item afetado, a nova versão e, se o cliente indicar a
+    versão que tem (`versao` no corpo), o delta desde essa versão — inclui também
+    alterações feitas noutro separador entretanto.
+    """
+    resposta = {"success": True, "lista_id": lista_id, "versao": versao, **dados}
+    desde = (request.get_json(silent=True) or {}).get('versao')
+    if desde is not None:
+        resposta["delta"] = lista_enderecos.alteracoes(lista_id, int(desde))
+    return jsonify(resposta)
+
+@api_routes.route('/api/lista', methods=['GET'])
+def obter_lista():
+    """
+    Lista da sessão. Com `?desde=N&lista=<id>` devolve só o delta desde a versão N
+    (adicionados, alterados, removidos); sem isso devolve a lista completa com ETag,
+    respondendo 304 a um If-None-Match que corresponda à versão atual.
+    """
+    lista_id = _lista_id()
+    if not lista_id: return jsonify({"lista_id": None, "versao": 0, "itens": []})
+    desde = request.args.get('desde', type=int)
+    if desde is not None and request.args.get('lista') == lista_id:
+        return jsonify({"lista_id": lista_id, **lista_enderecos.alteracoes(lista_id, desde)})
+    versao = lista_enderecos.versao(lista_id)
+    if _etag(lista_id, versao) in request.if_none_match:
+        resposta = make_response('', 304)
+        resposta.set_etag(_etag(lista_id, versao))
+        return resposta
+    versao, linhas = lista_enderecos.listar_com_seq(lista_id)
+    resposta = jsonify({"lista_id": lista_id, "versao": versao,
+                        "itens": [{"seq": seq, "item": item} for seq, item in linhas]})
+    resposta.set_etag(_etag(lista_id, versao))
+    return resposta
+
 @api_routes.route('/api/validar-por-id', methods=['POST'])
 def validar_por_id():
     """Valida um endereço a partir do seu order_number (ID)."""
@@ -45,39 +92,144 @@ def validar_por_id():
         if not order_number or not endereco: return jsonify({"success": False, "msg": "ID e endereço obrigatórios."}), 400
         if cep and not validar_cep(cep): return jsonify({"success": False, "msg": "Código Postal inválido."}), 400
 
-        lista = session.get('lista', [])
-        idx = next((i for i, item in enumerate(lista) if str(item.get('order_number')) == order_number), None)
-        if idx is None: return jsonify({"success": False, "msg": "Endereço não encontrado."}), 404
+        lista_id = _lista_id()
+        encontrado = lista_enderecos.procurar(lista_id, order_number) if lista_id else None
+        if encontrado is None: return jsonify({"success": False, "msg": "Endereço não encontrado."}), 404
+        seq, item = encontrado
 
         resultado_geo = valida_rua(endereco, cep)
-        _update_item_com_geo_resultado(lista[idx], resultado_geo, endereco, cep)
-        
-        session['lista'] = lista
-        session.modified = True
-        return jsonify({"success": True, "item": lista[idx]})
+        _update_item_com_geo_resultado(item, resultado_geo, endereco, cep)
+        versao = lista_enderecos.atualizar(lista_id, seq, item)
+        if not versao: return jsonify({"success": False, "msg": "Endereço não encontrado."}), 404
+        return _resposta_mutacao(lista_id, versao, seq=seq, item=item)
     except Exception as e:
         logger.error(f"Erro ao validar por ID: {str(e)}", exc_info=True)
         return jsonify({"success": False, "msg": "Erro interno ao validar."}), 500
 
+def _validar_itens(lista_id: str, pedidos: List[Dict]) -> tuple:
+    """
+    Valida várias edições `{seq | order_number, endereco, cep}`: as linhas são localizadas,
+    os endereços geocodificados em paralelo (`valida_ruas_em_lote`, que usa `valida_rua`)
+    e todas as linhas gravadas numa única escrita.
+    Devolve (resultados por pedido, na mesma ordem, versão da lista).
+    """
+    resultados: List[Dict] = [None] * len(pedidos)
+    aceites = []  # (posição no pedido, seq, item, endereço, CEP)
+    for i, pedido in enumerate(pedidos):
+        pedido = pedido if isinstance(pedido, dict) else {}
+        order_number = str(pedido.get('order_number', '') or '').strip()
+        endereco = sanitizar_endereco(pedido.get('endereco', ''))
+        cep = str(pedido.get('cep', '') or '').strip()
+        if not endereco:
+            resultados[i] = {"success": False, "order_number": order_number, "msg": "Endereço obrigatório."}
+            continue
+        if cep and not validar_cep(cep):
+            resultados[i] = {"success": False, "order_number": order_number, "msg": "Código Postal inválido."}
+            continue
+        encontrado = None
+        if lista_id and pedido.get('seq') is not None:
+            seq = int(pedido['seq'])
+            item = lista_enderecos.obter(lista_id, seq)
+            encontrado = (seq, item) if item is not None else None
+        elif lista_id and order_number:
+            encontrado = lista_enderecos.procurar(lista_id, order_number)
+        if encontrado is None:
+            resultados[i] = {"success": False, "seq": pedido.get('seq'), "order_number": order_number,
+                             "msg": _NAO_ENCONTRADO}
+            continue
+        aceites.append((i, encontrado[0], encontrado[1], endereco, cep))
+
+    if not aceites:
+        return resultados, lista_enderecos.versao(lista_id) if lista_id else 0
+
+    geo = valida_ruas_em_lote([a[3] for a in aceites], [a[4] for a in aceites])
+    alterados = {}
+    for (i, seq, item, endereco, cep), resultado_geo in zip(aceites, geo):
+        _update_item_com_geo_resultado(item, resultado_geo, endereco, cep)
+        alterados[seq] = item  # o mesmo seq repetido no pedido: vale a última edição
+    gravados, versao = lista_enderecos.atualizar_varios(lista_id, alterados)
+    gravados = set(gravados)
+    for i, seq, _, _, _ in aceites:
+        item = alterados[seq]
+        if seq in gravados:
+            resultados[i] = {"success": True, "seq": seq, "order_number": item.get("order_number"),
+                             "status": item.get("status_google"), "item": item}
+        else:  # removida entretanto (noutro separador)
+            resultados[i] = {"success": False, "seq": seq, "order_number": item.get("order_number"),
+                             "msg": _NAO_ENCONTRADO}
+    return resultados, versao
+
+@api_routes.route('/api/validar-lote', methods=['POST'])
+def validar_lote():
+    """
+    Valida vários endereços num só pedido: `{"itens": [{seq | order_number, endereco, cep}, ...]}`.
+    Responde com um resultado por item (pela mesma ordem) e com o delta da lista.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        pedidos = data.get('itens')
+        if not isinstance(pedidos, list) or not pedidos:
+            return jsonify({"success": False, "msg": "Nenhum endereço para validar."}), 400
+        if len(pedidos) > VALIDAR_LOTE_MAX:
+            return jsonify({"success": False, "msg": f"Máximo de {VALIDAR_LOTE_MAX} endereços por pedido."}), 413
+
+        lista_id = _lista_id()
+        resultados, versao = _validar_itens(lista_id, pedidos)
+        validados = sum(1 for r in resultados if r["success"])
+        logger.info(f"Validação em lote: {validados}/{len(pedidos)} endereços atualizados.")
+        if not validados:
+            return jsonify({"success": False, "msg": "Nenhum endereço foi validado.", "resultados": resultados}), 422
+        return _resposta_mutacao(lista_id, versao, resultados=resultados,
+                                 validados=validados, falhados=len(pedidos) - validados)
+    except Exception as e:
+        logger.error(f"Erro na validação em lote: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "msg": "Erro interno ao validar."}), 500
+
+@api_routes.route('/api/validar-linha', methods=['POST'])
+def validar_linha():
+    """Valida um endereço editado na tabela, identificado pelo `seq` (ou pelo order_number)."""
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('seq') is None and not data.get('order_number'):
+            return jsonify({"success": False, "msg": "Linha não informada."}), 400
+        lista_id = _lista_id()
+        (resultado,), versao = _validar_itens(lista_id, [data])
+        if not resultado["success"]:
+            codigo = 404 if resultado["msg"] == _NAO_ENCONTRADO else 400
+            return jsonify({"success": False, "msg": resultado["msg"]}), codigo
+        return _resposta_mutacao(lista_id, versao, seq=resultado["seq"], item=resultado["item"])
+    except Exception as e:
+        logger.error(f"Erro ao validar linha: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "msg": "Erro interno ao validar."}), 500
+
 @api_routes.route('/api/reverse-geocode', methods=['POST'])
 def reverse_geocode_endpoint():
-    """Recebe coordenadas e atualiza o endereço correspondente."""
+    """Recebe coordenadas e atualiza o endereço correspondente (por `seq`, order_number ou posição `idx`)."""
     try:
         data = request.get_json()
-        idx, lat, lng = int(data.get('idx')), float(data.get('lat')), float(data.get('lng'))
-        lista = session.get('lista', [])
-        if not (0 <= idx < len(lista)): return jsonify({'success': False, 'msg': 'Índice fora do alcance.'}), 404
-        
+        lat, lng = float(data.get('lat')), float(data.get('lng'))
+        lista_id = _lista_id()
+        encontrado = None
+        if lista_id and data.get('seq') is not None:
+            seq = int(data.get('seq'))
+            item = lista_enderecos.obter(lista_id, seq)
+            encontrado = (seq, item) if item is not None else None
+        elif lista_id and data.get('order_number'):
+            encontrado = lista_enderecos.procurar(lista_id, data.get('order_number'))
+        elif lista_id and data.get('idx') is not None:
+            encontrado = lista_enderecos.na_posicao(lista_id, int(data.get('idx')))
+        if encontrado is None: return jsonify({'success': False, 'msg': 'Índice fora do alcance.'}), 404
+        seq, item = encontrado
+
         resultado = obter_endereco_por_coordenadas(lat, lng)
         if resultado.get('status') != 'OK': return jsonify({'success': False, 'msg': 'Endereço não encontrado.'}), 404
         
         novo_endereco = resultado.get('address', '')
         novo_cep = resultado.get('postal_code', '')
-        _update_item_com_geo_resultado(lista[idx], resultado, novo_endereco, novo_cep)
-        
-        session['lista'] = lista
-        session.modified = True
-        return jsonify({"success": True, "item": lista[idx], "lista": lista})
+        _update_item_com_geo_resultado(item, resultado, novo_endereco, novo_cep)
+        versao = lista_enderecos.atualizar(lista_id, seq, item)
+        if not versao: return jsonify({'success': False, 'msg': 'Índice fora do alcance.'}), 404
+        return _resposta_mutacao(lista_id, versao, seq=seq, item=item)
     except Exception as e:
         logger.error(f"Erro no reverse-geocode: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'msg': 'Erro interno do servidor.'}), 500
@@ -99,29 +251,40 @@ def add_address_endpoint():
             "cor": cor_por_tipo("manual")
         }
         _update_item_com_geo_resultado(novo_item, resultado_geo, endereco, cep)
-        
-        lista = session.get('lista', [])
-        lista.append(novo_item)
-        session['lista'] = lista
-        session.modified = True
-        return jsonify({"success": True, "item": novo_item, "lista": lista})
+        lista_id = lista_enderecos.id_da_sessao(session, criar=True)
+        seq, versao = lista_enderecos.acrescentar(lista_id, novo_item)
+        return _resposta_mutacao(lista_id, versao, seq=seq, item=novo_item)
     except Exception as e:
         logger.error(f"Erro ao adicionar novo endereço: {str(e)}", exc_info=True)
         return jsonify({"success": False, "msg": "Erro interno ao adicionar endereço."}), 500
 
 @api_routes.route('/api/remover-endereco', methods=['POST'])
 def remover_endereco():
-    """Remove um endereço da lista na sessão pelo order_number (ID)."""
+    """Remove um endereço da lista na sessão pelo `seq`, pelo order_number (ID) ou pela posição `idx`."""
     try:
         data = request.get_json()
         id_remover = str(data.get('order_number', '')).strip()
-        if not id_remover: return jsonify({"success": False, "msg": "ID não informado."}), 400
-        lista_original = session.get('lista', [])
-        nova_lista = [item for item in lista_original if str(item.get('order_number')) != id_remover]
-        if len(nova_lista) == len(lista_original): return jsonify({"success": False, "msg": "Endereço não encontrado."}), 404
-        session['lista'] = nova_lista
-        session.modified = True
-        return jsonify({"success": True, "msg": "Endereço removido com sucesso.", "lista": nova_lista})
+        seq, idx = data.get('seq'), data.get('idx')
+        if not id_remover and seq is None and idx is None: return jsonify({"success": False, "msg": "ID não informado."}), 400
+        lista_id = _lista_id()
+        removidos = versao = 0
+        if lista_id and seq is not None:
+            removidos, versao = lista_enderecos.remover(lista_id, [int(seq)])
+        elif lista_id and id_remover:
+            removidos, versao = lista_enderecos.remover_por_order_number(lista_id, id_remover)
+        elif lista_id:
+            encontrado = lista_enderecos.na_posicao(lista_id, int(idx))
+            if encontrado: removidos, versao = lista_enderecos.remover(lista_id, [encontrado[0]])
+        if not removidos: return jsonify({"success": False, "msg": "Endereço não encontrado."}), 404
+        return _resposta_mutacao(lista_id, versao, msg="Endereço removido com sucesso.", removidos=removidos)
     except Exception as e:
         logger.error(f"Erro ao remover endereço: {str(e)}", exc_info=True)
         return jsonify({"success": False, "msg": "Erro interno ao remover endereço."}), 500
+
+@api_routes.route('/api/saude-provedores', methods=['GET'])
+def saude_dos_provedores():
+    """
+    Latência, taxas de erro/acerto e estado dos disjuntores de cada provedor de geocodificação,
+    mais os contadores do limite de pedidos deste worker.
+    """
+    return jsonify({**saude_provedores.estatisticas(), "limite_taxa": limite_taxa.estatisticas()})
@@ -1,112 +1,172 @@
 # app/routes/gerar.py
-from flask import Blueprint, request, redirect, url_for, session, send_file, flash
-import csv
-import io
-import uuid
+from flask import Blueprint, request, redirect, url_for, session, flash, Response
+import json
+import os
+import tempfile
 from datetime import datetime
 import logging
+from app.utils import lista_enderecos, tardio
 
 logger = logging.getLogger(__name__)
+np = tardio.modulo("numpy")
+pd = tardio.modulo("pandas")
 gerar_bp = Blueprint('gerar', __name__)
 
+# Exportação em streaming: a lista é lida do armazenamento em blocos de EXPORT_BLOCO_LINHAS
+# itens e cada bloco é convertido e enviado de imediato, sem cópia do ficheiro na sessão.
+EXPORT_BLOCO_LINHAS = int(os.environ.get('EXPORT_BLOCO_LINHAS', '1000'))
+# Acima deste tamanho o XLSX em construção passa da memória para um ficheiro temporário
+EXPORT_XLSX_MEMORIA_MAX = int(os.environ.get('EXPORT_XLSX_MEMORIA_MAX', str(8 * 1024 * 1024)))
+_BLOCO_BYTES = 64 * 1024
+
 @gerar_bp.route('/generate', methods=['POST'])
 def generate():
     """
-    Gera um CSV a partir dos dados JÁ VALIDADOS na sessão.
-    Não revalida endereços, apenas exporta.
+    Mantida por compatibilidade com o formulário antigo: redireciona para a exportação
+    em streaming no formato pedido (CSV por omissão). Não revalida endereços.
     """
-    try:
-        lista_final = session.get('lista', [])
-
-        if not lista_final:
-            flash("Não há endereços na sessão para gerar o arquivo.", "warning")
-            return redirect(url_for('preview.preview'))
-
-        # Gera o conteúdo do CSV usando os dados da sessão
-        csv_content = _gerar_csv_content(lista_final)
-
-        # Usa um ID único para o CSV na sessão, permitindo múltiplos downloads simultâneos
-        csv_id = str(uuid.uuid4())
-        session[f'csv_{csv_id}'] = {
-            'content': csv_content,
-            'timestamp': datetime.now().isoformat(),
-            'filename': f'enderecos_validados_{datetime.now().strftime("%Y%m%d_%H%M")}.csv'
-        }
-        session.modified = True
-
-        return redirect(url_for('gerar.download', csv_id=csv_id))
-
-    except Exception as e:
-        logger.error(f"Erro ao gerar CSV: {str(e)}", exc_info=True)
-        flash(f"Ocorreu um erro inesperado ao gerar o arquivo CSV: {e}", "danger")
-        return redirect(url_for('preview.preview'))
+    formato = request.form.get('formato', 'csv')
+    return redirect(url_for('gerar.exportar', formato=formato))
 
 @gerar_bp.route('/download/<csv_id>')
 def download(csv_id):
+    """Links antigos (CSV guardado na sessão) passam a exportar a lista atual."""
+    return redirect(url_for('gerar.exportar', formato='csv'))
+
+@gerar_bp.route('/exportar/<formato>')
+def exportar(formato):
     """
-    Fornece o download do CSV gerado e armazenado na sessão.
+    Exporta a lista da sessão em CSV, XLSX ou GeoJSON, em streaming a partir do
+    armazenamento da lista: nada é acumulado na sessão nem em memória.
     """
-    csv_data_key = f'csv_{csv_id}'
-    csv_data = session.get(csv_data_key)
-
-    if not csv_data or not csv_data.get('content'):
-        flash("Arquivo CSV não encontrado ou expirado. Por favor, gere novamente.", "warning")
+    exportador = EXPORTADORES.get(formato)
+    if exportador is None:
+        flash(f"Formato de exportação desconhecido: {formato}.", "warning")
         return redirect(url_for('preview.preview'))
+    lista_id = lista_enderecos.id_da_sessao(session)
+    if not lista_id or not lista_enderecos.contar(lista_id):
+        flash("Não há endereços na sessão para gerar o arquivo.", "warning")
+        return redirect(url_for('preview.preview'))
+
+    gerador, mimetype, extensao = exportador
+    nome = f'enderecos_validados_{datetime.now().strftime("%Y%m%d_%H%M")}.{extensao}'
+    blocos = lista_enderecos.iterar_blocos(lista_id, EXPORT_BLOCO_LINHAS)
+    resposta = Response(_registar_erros(gerador(blocos), formato), mimetype=mimetype)
+    resposta.headers['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return resposta
+
+def _registar_erros(gerador, formato):
+    """Com a resposta já a ser enviada não há como redirecionar: o erro fica no log."""
+    try:
+        yield from gerador
+    except Exception as e:
+        logger.error(f"Erro ao exportar {formato}: {str(e)}", exc_info=True)
+        raise
 
-    # Remove o CSV da sessão após o uso para não acumular dados
-    session.pop(csv_data_key, None)
-    session.modified = True
+CSV_FIELDNAMES = [
+    "order number", "name", "address", "latitude", "longitude", "duration",
+    "start time", "end time", "phone", "contact", "notes", "color",
+    "Group", "rua_google", "freguesia_google", "status",
+    "cep_original", "cep_google"
+]
 
-    return send_file(
-        io.BytesIO(csv_data['content'].encode('utf-8-sig')),  # utf-8-sig para Excel
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=csv_data.get('filename', 'enderecos.csv')
+def _coluna(df, nome, padrao=""):
+    """Coluna do DataFrame com valores em falta substituídos por `padrao`."""
+    if nome not in df.columns:
+        return pd.Series(padrao, index=df.index, dtype=object)
+    return df[nome].where(df[nome].notna(), padrao)
+
+def _gerar_csv_dataframe(lista):
+    """
+    Constrói, de forma vetorizada, o DataFrame de exportação a partir da lista de dados.
+    """
+    df = pd.DataFrame(lista)
+    status_google = _coluna(df, "status_google", "UNKNOWN").astype(str)
+    status = np.select(
+        [status_google != "OK",
+         ~_coluna(df, "cep_ok", False).astype(bool),
+         ~_coluna(df, "rua_bate", False).astype(bool)],
+        ["Erro Google: " + status_google, "CEP divergente", "Rua divergente"],
+        default="Validado",
     )
+    cep = _coluna(df, "cep")
+    cep_google = _coluna(df, "postal_code_encontrado")
+    return pd.DataFrame({
+        'order number': _coluna(df, "order_number"),
+        'name': "",  # Se quiser popular no futuro
+        'address': _coluna(df, "address"),
+        'latitude': _coluna(df, "latitude"),
+        'longitude': _coluna(df, "longitude"),
+        'duration': "",
+        'start time': "",
+        'end time': "",
+        'phone': "",
+        'contact': "",
+        'notes': cep_google.where(cep_google.astype(bool), cep),
+        'color': _coluna(df, "cor", "#0074D9"),
+        'Group': _coluna(df, "importacao_tipo", "manual"),
+        'rua_google': _coluna(df, "rua_google"),
+        'freguesia_google': _coluna(df, "freguesia"),
+        'status': status,
+        'cep_original': cep,
+        'cep_google': cep_google,
+    }, columns=CSV_FIELDNAMES)
 
-def _gerar_csv_content(lista):
+def _stream_csv(blocos):
+    """CSV com BOM (utf-8-sig, para o Excel): cabeçalho e depois um pedaço por bloco."""
+    yield ('\ufeff' + ",".join(CSV_FIELDNAMES) + "\r\n").encode('utf-8')
+    for lista in blocos:
+        yield _gerar_csv_dataframe(lista).to_csv(index=False, header=False, lineterminator="\r\n").encode('utf-8')
+
+def _stream_xlsx(blocos):
     """
-    Função auxiliar que cria a string do CSV a partir da lista de dados.
+    XLSX com openpyxl em modo write-only (linhas escritas em fluxo, sem células em memória).
+    O formato zip só fica completo no fim, por isso o ficheiro é montado num temporário
+    (em memória até EXPORT_XLSX_MEMORIA_MAX) e depois enviado em pedaços.
     """
-    output = io.StringIO()
-    fieldnames = [
-        "order number", "name", "address", "latitude", "longitude", "duration",
-        "start time", "end time", "phone", "contact", "notes", "color",
-        "Group", "rua_google", "freguesia_google", "status",
-        "cep_original", "cep_google"
-    ]
-    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore')
-    writer.writeheader()
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Endereços")
+    ws.append(CSV_FIELDNAMES)
+    for lista in blocos:
+        df = _gerar_csv_dataframe(lista).astype(object)
+        for linha in df.itertuples(index=False, name=None):
+            ws.append(list(linha))
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_XLSX_MEMORIA_MAX) as destino:
+        wb.save(destino)
+        destino.seek(0)
+        while True:
+            pedaco = destino.read(_BLOCO_BYTES)
+            if not pedaco:
+                break
+            yield pedaco
+
+# Campos das propriedades de cada Feature GeoJSON (as coordenadas vão na geometria)
+GEOJSON_PROPRIEDADES = [campo for campo in CSV_FIELDNAMES if campo not in ("latitude", "longitude")]
 
-    for row in lista:
-        status = "Validado"
-        if row.get("status_google") != "OK":
-            status = f"Erro Google: {row.get('status_google', 'UNKNOWN')}"
-        elif not row.get("cep_ok", False):
-            status = "CEP divergente"
-        elif not row.get("rua_bate", False):
-            status = "Rua divergente"
-        
-        csv_row = {
-            'order number': row.get("order_number", ""),
-            'name': "",  # Se quiser popular no futuro
-            'address': row.get("address", ""),
-            'latitude': row.get("latitude", ""),
-            'longitude': row.get("longitude", ""),
-            'duration': "",
-            'start time': "",
-            'end time': "",
-            'phone': "",
-            'contact': "",
-            'notes': row.get("postal_code_encontrado") or row.get("cep", ""),
-            'color': row.get("cor", "#0074D9"),
-            'Group': row.get("importacao_tipo", "manual"),
-            'rua_google': row.get("rua_google", ""),
-            'freguesia_google': row.get("freguesia", ""),
-            'status': status,
-            'cep_original': row.get("cep", ""),
-            'cep_google': row.get("postal_code_encontrado", "")
-        }
-        writer.writerow(csv_row)
+def _stream_geojson(blocos):
+    """FeatureCollection de pontos, escrita feature a feature (endereços sem coordenadas são omitidos)."""
+    yield b'{"type":"FeatureCollection","features":['
+    primeira = True
+    for lista in blocos:
+        df = _gerar_csv_dataframe(lista)
+        lat = pd.to_numeric(df["latitude"], errors='coerce')
+        lng = pd.to_numeric(df["longitude"], errors='coerce')
+        validas = lat.notna() & lng.notna()
+        propriedades = df.loc[validas, GEOJSON_PROPRIEDADES].astype(str).to_dict('records')
+        pedacos = []
+        for props, y, x in zip(propriedades, lat[validas], lng[validas]):
+            feature = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [float(x), float(y)]},
+                       "properties": props}
+            pedacos.append(("" if primeira else ",") + json.dumps(feature, ensure_ascii=False))
+            primeira = False
+        if pedacos:
+            yield "".join(pedacos).encode('utf-8')
+    yield b']}'
 
-    return output.getvalue()
+# formato -> (gerador, mimetype, extensão)
+EXPORTADORES = {
+    "csv": (_stream_csv, "text/csv", "csv"),
+    "xlsx": (_stream_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "geojson": (_stream_geojson, "application/geo+json", "geojson"),
+}
@@ -1,60 +1,52 @@
 # app/routes/importacao.py
 
-from flask import Blueprint, request, session, redirect, url_for, flash
-from app.utils.geocoder import valida_rua
-from app.utils.helpers import normalizar, registro_unico, cor_por_tipo
-from app.utils import parser
-import pandas as pd
+from __future__ import annotations
+
+from flask import Blueprint, request, session, redirect, url_for, flash, jsonify, Response, stream_with_context
+from app.utils import parser, pipeline, jobs, lista_enderecos, metricas, tardio
+import json
 import logging
+import os
+import time
+import shutil
+import tempfile
 from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
 
 logger = logging.getLogger(__name__)
+pd = tardio.modulo("pandas")
 importacao_bp = Blueprint('importacao', __name__)
 ALLOWED_EXTENSIONS = {'csv', 'xls', 'xlsx', 'txt'}
 
-# Fallback numérico para garantir que as coordenadas são sempre floats
-FALLBACK_LAT, FALLBACK_LNG = 39.3999, -8.2245
+# Importação de CSV em blocos: o ficheiro é lido e geocodificado IMPORT_CSV_CHUNK_ROWS
+# linhas de cada vez, com memória estável. IMPORT_CSV_STREAMING=0 volta à leitura integral.
+IMPORT_CSV_STREAMING = os.environ.get('IMPORT_CSV_STREAMING', '1') == '1'
+IMPORT_CSV_CHUNK_ROWS = int(os.environ.get('IMPORT_CSV_CHUNK_ROWS', '500'))
+# Importações em segundo plano: os ficheiros enviados ficam aqui até o job os processar
+IMPORT_JOBS_DIR = os.environ.get('IMPORT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'importacoes'))
+# Stream SSE de resultados parciais: intervalo entre leituras e duração máxima de cada ligação.
+# Cada ligação ocupa uma thread do worker (gthread, ver gunicorn.conf.py); ao fim de IMPORT_SSE_DURACAO_MAX segundos
+# o servidor fecha-a e o EventSource do browser volta a ligar (Last-Event-ID) sem perder itens.
+IMPORT_SSE_INTERVALO = float(os.environ.get('IMPORT_SSE_INTERVALO', '0.3'))
+IMPORT_SSE_DURACAO_MAX = float(os.environ.get('IMPORT_SSE_DURACAO_MAX', '25'))
 
 def extensao_permitida(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def _processa_e_geocodifica(empresa: str, enderecos: list, ceps: list, order_numbers: list) -> list:
-    lista_processada = []
-    if not enderecos: return lista_processada
-
-    logger.info(f"Geocodificando {len(enderecos)} endereços para o formato '{empresa}'...")
-    for i, (endereco, cep) in enumerate(zip(enderecos, ceps)):
-        order_number = order_numbers[i] if i < len(order_numbers) and order_numbers[i] else f"{(empresa or 'item').upper()}-{i+1}"
-
-        res_geo = valida_rua(endereco, cep)
-        coordenadas = res_geo.get('coordenadas', {})
-        
-        novo_item = {
-            "order_number": order_number, "address": endereco, "cep": cep,
-            "status_google": res_geo.get('status', 'ERRO'),
-            "latitude": float(coordenadas.get('lat', FALLBACK_LAT)),
-            "longitude": float(coordenadas.get('lng', FALLBACK_LNG)),
-            "importacao_tipo": empresa, "cor": cor_por_tipo(empresa),
-            "postal_code_encontrado": res_geo.get('postal_code_encontrado', ''),
-            "endereco_formatado": res_geo.get('endereco_formatado', ''),
-            "rua_google": res_geo.get('route_encontrada', ''),
-            "cep_ok": cep == res_geo.get('postal_code_encontrado', ''),
-            "rua_bate": normalizar(endereco.split(',')[0]) in normalizar(res_geo.get('route_encontrada', '')),
-            "freguesia": res_geo.get('sublocality', ''),
-            "locality": res_geo.get('locality', '')
-        }
-        if registro_unico(lista_processada, novo_item):
-            lista_processada.append(novo_item)
-    return lista_processada
-
-# ... (O resto do seu ficheiro pode permanecer igual) ...
-def _processar_ficheiro(file: FileStorage) -> list:
-    if not file or not extensao_permitida(file.filename): return []
+def _processa_e_geocodifica(empresa: str, dados: pd.DataFrame, progresso=None, inicio: int = 0) -> pd.DataFrame:
+    if progresso is None:
+        return pipeline.geocodifica(empresa, dados, inicio=inicio)
+    progresso.lidas(len(dados))
+    return pipeline.geocodifica(empresa, dados, ao_geocodificar=progresso.geocodificado, inicio=inicio)
+
+def _processar_ficheiro(file: FileStorage, progresso=None) -> pd.DataFrame:
+    if not file or not extensao_permitida(file.filename): return None
     logger.info(f"Processando ficheiro: {file.filename}")
     if file.filename.lower().endswith('.txt'):
         conteudo = file.read().decode("utf-8")
-        enderecos, ceps, order_numbers = parser.parse_paack_texto(conteudo)
-        return _processa_e_geocodifica('paack', enderecos, ceps, order_numbers)
+        return _processa_e_geocodifica('paack', parser.paack_texto_para_dataframe(conteudo), progresso)
+    if IMPORT_CSV_STREAMING and file.filename.lower().endswith('.csv'):
+        return _processar_csv_em_blocos(file, progresso)
     try:
         file.seek(0); df = pd.read_excel(file, skiprows=1)
         if df.empty or len(df.columns) < 2: file.seek(0); df = pd.read_excel(file)
@@ -63,49 +55,174 @@ def _processar_ficheiro(file: FileStorage) -> list:
             file.seek(0); df = pd.read_csv(file, sep=None, engine='python', on_bad_lines='skip', encoding='utf-8', skiprows=1)
             if df.empty or len(df.columns) < 2: file.seek(0); df = pd.read_csv(file, sep=None, engine='python', on_bad_lines='skip', encoding='utf-8')
         except Exception as err:
-            logger.error(f"Erro ao ler arquivo: {err}"); return []
-    if df.empty: return []
+            logger.error(f"Erro ao ler arquivo: {err}"); return None
+    if df.empty: return None
     formato = parser.detectar_formato_df(df)
-    if not formato: return []
-    enderecos, ceps, order_numbers = parser.parse_dataframe(df, formato)
-    return _processa_e_geocodifica(formato, enderecos, ceps, order_numbers)
-
-def _processar_texto_manual(texto: str) -> list:
-    if not texto: return []
-    enderecos, ceps, order_numbers = parser.parse_paack_texto(texto)
-    return _processa_e_geocodifica('paack', enderecos, ceps, order_numbers)
-
-def _unificar_e_deduplicar(lista_de_itens: list) -> list:
-    registros_unicos = {}
-    for item in lista_de_itens:
-        chave = (normalizar(item['address']), normalizar(item['cep']))
-        if chave not in registros_unicos or 'paack' in item['importacao_tipo']:
-            registros_unicos[chave] = item
-    return list(registros_unicos.values())
-
-def _reindexar_lista(lista: list) -> list:
-    d_count = 1
-    for item in lista:
-        if str(item.get("importacao_tipo", "")).lower() == "delnext":
-            item['order_number'] = f"D{d_count}"; d_count += 1
-    return lista
+    if not formato: return None
+    return _processa_e_geocodifica(formato, parser.extrair_dataframe(df, formato), progresso)
+
+def _processar_csv_em_blocos(file: FileStorage, progresso=None) -> pd.DataFrame:
+    """Deteta separador/cabeçalho/formato uma única vez e geocodifica o CSV bloco a bloco."""
+    try:
+        file.stream.seek(0)
+        formato, blocos = parser.iterar_csv_em_blocos(file.stream, IMPORT_CSV_CHUNK_ROWS)
+        if not formato:
+            logger.warning(f"Formato não reconhecido no cabeçalho de {file.filename}"); return None
+        resultados, linhas = [], 0
+        for n, bloco in enumerate(blocos, start=1):
+            # Ids por omissão (EMPRESA-n) numerados no ficheiro inteiro, não em cada bloco
+            resultados.append(_processa_e_geocodifica(formato, bloco, progresso, inicio=linhas))
+            linhas += len(bloco)
+            logger.info(f"{file.filename}: bloco {n} processado ({len(bloco)} linhas).")
+    except Exception as err:
+        logger.error(f"Erro ao ler arquivo: {err}"); return None
+    resultados = [r for r in resultados if not r.empty]
+    return pd.concat(resultados, ignore_index=True) if resultados else None
+
+def _processar_texto_manual(texto: str, progresso=None) -> pd.DataFrame:
+    if not texto: return None
+    return _processa_e_geocodifica('paack', parser.paack_texto_para_dataframe(texto), progresso)
+
+def _unificar_e_deduplicar(itens: pd.DataFrame) -> pd.DataFrame:
+    # Entre duplicados (exatos ou no mesmo local), o registo Paack prevalece
+    return pipeline.deduplica(itens, considerar_tipo=False, preferir_tipo='paack')
+
+def _reindexar_lista(itens: pd.DataFrame) -> pd.DataFrame:
+    return pipeline.reindexa_delnext(itens)
+
+def _importar(files: list, texto_manual: str, progresso=None) -> list:
+    """Parsing, geocodificação e deduplicação de todas as fontes; devolve a lista final."""
+    inicio = time.monotonic()
+    lotes = [_processar_ficheiro(file, progresso) for file in files]
+    lotes.append(_processar_texto_manual(texto_manual, progresso))
+    lotes = [lote for lote in lotes if lote is not None and not lote.empty]
+    metricas.importacao(sum(len(lote) for lote in lotes), time.monotonic() - inicio,
+                        "job" if progresso is not None else "sincrona")
+    if not lotes:
+        return []
+    lista_unica = _unificar_e_deduplicar(pd.concat(lotes, ignore_index=True))
+    return pipeline.para_registos(_reindexar_lista(lista_unica))
+
+def _job_importacao(progresso, diretorio: str, nomes: list, texto_manual: str) -> list:
+    """Corpo do job em segundo plano: reabre os ficheiros guardados e importa-os."""
+    abertos = []
+    try:
+        for nome in nomes:
+            abertos.append(FileStorage(stream=open(os.path.join(diretorio, nome), 'rb'), filename=nome))
+        return _importar(abertos, texto_manual, progresso)
+    finally:
+        for file in abertos: file.close()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+def _submeter_importacao(files: list, texto_manual: str) -> str:
+    """Guarda os ficheiros enviados em disco (o pedido termina antes do job) e submete o job."""
+    os.makedirs(IMPORT_JOBS_DIR, exist_ok=True)
+    diretorio = tempfile.mkdtemp(dir=IMPORT_JOBS_DIR)
+    nomes = []
+    for n, file in enumerate(files):
+        if not file or not extensao_permitida(file.filename): continue
+        # Prefixo numérico: ficheiros diferentes com o mesmo nome não se sobrepõem
+        nome = f"{n}_{secure_filename(file.filename) or 'ficheiro'}"
+        if '.' not in nome: nome += '.' + file.filename.rsplit('.', 1)[1].lower()
+        file.save(os.path.join(diretorio, nome)); nomes.append(nome)
+    return jobs.submeter(_job_importacao, diretorio, nomes, texto_manual)
+
+def _pedido_assincrono() -> bool:
+    return request.values.get('modo') == 'async' or request.accept_mimetypes.best == 'application/json'
 
 @importacao_bp.route('/import_planilha', methods=['POST'])
 def import_planilha():
+    assincrono = _pedido_assincrono()
     try:
         files = request.files.getlist('planilhas')
         texto_manual = request.form.get('enderecos_manuais', '').strip()
         if not files and not texto_manual:
+            if assincrono: return jsonify({"erro": "Adicione pelo menos um ficheiro ou endereço manual."}), 400
             flash("Adicione pelo menos um ficheiro ou endereço manual.", "warning"); return redirect(url_for('preview.home'))
-        todos_os_itens = []
-        for file in files: todos_os_itens.extend(_processar_ficheiro(file))
-        todos_os_itens.extend(_processar_texto_manual(texto_manual))
-        if not todos_os_itens:
+        if assincrono:
+            job_id = _submeter_importacao(files, texto_manual)
+            return jsonify({
+                "job_id": job_id,
+                "progresso": url_for('importacao.estado_importacao', job_id=job_id),
+                "eventos": url_for('importacao.eventos_importacao', job_id=job_id),
+                "resultado": url_for('importacao.resultado_importacao', job_id=job_id),
+                "preview": url_for('preview.preview', job=job_id),
+            }), 202
+        lista_final = _importar(files, texto_manual)
+        if not lista_final:
             flash("Nenhum endereço válido foi encontrado.", "warning"); return redirect(url_for('preview.home'))
-        lista_unica = _unificar_e_deduplicar(todos_os_itens)
-        lista_final = _reindexar_lista(lista_unica)
-        session.clear(); session['lista'] = lista_final; session.modified = True
+        lista_enderecos.guardar_na_sessao(session, lista_final, limpar_sessao=True)
         flash(f"{len(lista_final)} endereços únicos foram importados.", "success"); return redirect(url_for('preview.preview'))
     except Exception as e:
         logger.error(f"[importacao] Erro crítico: {str(e)}", exc_info=True)
+        if assincrono: return jsonify({"erro": f"Ocorreu um erro inesperado: {str(e)}"}), 500
         flash(f"Ocorreu um erro inesperado: {str(e)}", "danger"); return redirect(url_for('preview.home'))
+
+@importacao_bp.route('/api/importacao/<job_id>', methods=['GET'])
+def estado_importacao(job_id):
+    """Progresso de uma importação em segundo plano (linhas lidas, geocodificadas, falhadas)."""
+    estado = jobs.obter(job_id)
+    if estado is None: return jsonify({"erro": "Importação não encontrada ou expirada."}), 404
+    return jsonify(estado)
+
+def _evento_sse(evento: str, dados, evento_id=None) -> str:
+    linhas = [f"event: {evento}"]
+    if evento_id is not None: linhas.append(f"id: {evento_id}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False)}")
+    return "\n".join(linhas) + "\n\n"
+
+@importacao_bp.route('/api/importacao/<job_id>/eventos', methods=['GET'])
+def eventos_importacao(job_id):
+    """
+    Server-Sent Events com os itens geocodificados à medida que ficam prontos.
+    Eventos: `itens` (lista de itens provisórios; o id é o cursor para retomar),
+    `progresso` (contadores do job), `concluido` e `erro` (finais).
+    """
+    if jobs.obter(job_id) is None: return jsonify({"erro": "Importação não encontrada ou expirada."}), 404
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.args.get('desde') or 0)
+    except ValueError:
+        cursor = 0
+
+    def gerar(cursor):
+        yield "retry: 1000\n\n"
+        fim = time.monotonic() + IMPORT_SSE_DURACAO_MAX
+        ultimo_estado = None
+        while time.monotonic() < fim:
+            estado = jobs.obter(job_id)
+            if estado is None:
+                yield _evento_sse("erro", {"erro": "Importação não encontrada ou expirada."}); return
+            # O estado é lido antes dos itens: ao ver "concluido" todos os itens já foram publicados
+            itens, cursor = jobs.ler_itens(job_id, cursor)
+            if itens: yield _evento_sse("itens", itens, cursor)
+            contadores = (estado["estado"], estado["linhas_lidas"], estado["geocodificadas"], estado["falhadas"])
+            if contadores != ultimo_estado:
+                ultimo_estado = contadores; yield _evento_sse("progresso", estado)
+            if estado["estado"] in (jobs.CONCLUIDO, jobs.ERRO):
+                yield _evento_sse("concluido" if estado["estado"] == jobs.CONCLUIDO else "erro", estado); return
+            time.sleep(IMPORT_SSE_INTERVALO)
+
+    resposta = Response(stream_with_context(gerar(cursor)), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'  # sem buffering em proxies nginx
+    return resposta
+
+@importacao_bp.route('/api/importacao/<job_id>/resultado', methods=['GET'])
+def resultado_importacao(job_id):
+    """Entrega a lista final de um job concluído e coloca-a na sessão do utilizador."""
+    estado = jobs.obter(job_id)
+    if estado is None: return jsonify({"erro": "Importação não encontrada ou expirada."}), 404
+    if estado["estado"] == jobs.ERRO: return jsonify({"erro": estado.get("erro", "A importação falhou.")}), 500
+    if estado["estado"] != jobs.CONCLUIDO: return jsonify(estado), 409
+    lista_final = jobs.obter_resultado(job_id) or []
+    if not lista_final:
+        flash("Nenhum endereço válido foi encontrado.", "warning")
+        return jsonify({"total": 0, "redirect": url_for('preview.home')})
+    lista_id = lista_enderecos.guardar_na_sessao(session, lista_final, limpar_sessao=True)
+    flash(f"{len(lista_final)} endereços únicos foram importados.", "success")
+    resposta = {"total": len(lista_final), "redirect": url_for('preview.preview')}
+    if request.args.get('lista') == '1':
+        # Numa lista nova os seqs são 1..n pela ordem da lista
+        resposta.update(lista=lista_final, lista_id=lista_id, versao=lista_enderecos.versao(lista_id),
+                        seqs=list(range(1, len(lista_final) + 1)))
+    return jsonify(resposta)
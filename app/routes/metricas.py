@@ -0,0 +1,43 @@
+# app/routes/metricas.py
+
+from flask import Blueprint, Response, request, session, g
+from app.utils import metricas
+import os
+import pickle
+import random
+import time
+import logging
+
+metricas_bp = Blueprint('metricas', __name__)
+logger = logging.getLogger(__name__)
+
+# Fração das gravações de sessão cujo tamanho é medido: medir obriga a serializar a sessão
+# uma segunda vez, por isso só uma amostra entra no histograma (1 = todas, 0 = nenhuma)
+METRICAS_SESSAO_AMOSTRA = float(os.environ.get('METRICAS_SESSAO_AMOSTRA', '0.01'))
+
+@metricas_bp.before_app_request
+def _inicio_pedido():
+    g.metricas_inicio = time.monotonic()
+
+@metricas_bp.after_app_request
+def _fim_pedido(response):
+    """Duração do pedido por rota (o padrão da rota, não o URL) e, por amostragem, tamanho da sessão gravada."""
+    try:
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is not None and request.endpoint != 'metricas.exportar':
+            rota = request.url_rule.rule if request.url_rule else 'sem_rota'
+            metricas.pedido(rota, request.method, response.status_code, time.monotonic() - inicio)
+        if session.modified and random.random() < METRICAS_SESSAO_AMOSTRA:
+            # O Flask-Session grava a sessão serializada com pickle (ficheiro ou Redis)
+            metricas.sessao(len(pickle.dumps(dict(session))))
+    except Exception as e:
+        logger.warning(f"Falha ao registar métricas do pedido: {e}")
+    return response
+
+@metricas_bp.route('/metrics')
+def exportar():
+    """Métricas no formato do Prometheus, agregadas de todos os workers."""
+    if not metricas.ativo():
+        return Response("prometheus_client não instalado\n", status=503, mimetype='text/plain')
+    corpo, content_type = metricas.exportar()
+    return Response(corpo, content_type=content_type)
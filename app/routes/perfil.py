@@ -0,0 +1,56 @@
+# app/routes/perfil.py
+
+from flask import Blueprint, jsonify, request, send_file, abort, g
+from app.utils import perfil
+import logging
+
+perfil_bp = Blueprint('perfil', __name__)
+logger = logging.getLogger(__name__)
+
+@perfil_bp.before_app_request
+def _inicio_perfil():
+    if not perfil.deve_perfilar(request.endpoint, request.path, request.headers.get(perfil.CABECALHO)):
+        return
+    atual = perfil.Perfil(request.endpoint or 'sem_rota', request.method, request.path)
+    if atual.iniciar():
+        g.perfil = atual
+
+@perfil_bp.after_app_request
+def _cabecalho_perfil(response):
+    atual = g.get('perfil')
+    if atual is not None:
+        atual.codigo = response.status_code
+        response.headers['X-Perfil-Id'] = atual.id
+    return response
+
+@perfil_bp.teardown_app_request
+def _fim_perfil(exc):
+    """Termina no teardown para incluir a gravação da sessão (feita depois dos after_request)."""
+    atual = g.pop('perfil', None)
+    if atual is not None:
+        if exc is not None:
+            atual.codigo = 500
+        atual.terminar()
+
+def _autorizado():
+    # Sem PERFIL_TOKEN configurado os perfis não são expostos
+    if not perfil.token_valido(request.headers.get(perfil.CABECALHO) or request.args.get('token')):
+        abort(404)
+
+@perfil_bp.route('/perfis')
+def listar():
+    """Perfis gravados neste servidor, do mais recente para o mais antigo."""
+    _autorizado()
+    return jsonify(perfil.listar())
+
+@perfil_bp.route('/perfis/<perfil_id>.<extensao>')
+def descarregar(perfil_id, extensao):
+    """Resumo (`.json`) ou perfil completo (`.prof`, para pstats/snakeviz)."""
+    _autorizado()
+    caminho = perfil.caminho(perfil_id, extensao)
+    if caminho is None:
+        abort(404)
+    if extensao == 'json':
+        return send_file(caminho, mimetype='application/json')
+    return send_file(caminho, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{perfil_id}.prof")
@@ -1,8 +1,8 @@
 # app/routes/preview.py
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash
 from app.utils.google import valida_rua_google
-from app.utils.helpers import normalizar, registro_unico, CORES_IMPORTACAO
-from app.utils import parser
+from app.utils.helpers import normalizar, CORES_IMPORTACAO
+from app.utils import parser, pipeline, lista_enderecos
 import os
 import logging
 
@@ -12,6 +12,7 @@ logger = logging.getLogger(__name__)
 @preview_bp.route("/", methods=["GET"])
 def home():
     """Exibe a página inicial e limpa a sessão para um novo começo."""
+    lista_enderecos.apagar_da_sessao(session)
     session.clear()
     return render_template("index.html")
 
@@ -24,17 +25,18 @@ def preview():
     """
     try:
         if request.method == "POST":
+            lista_enderecos.apagar_da_sessao(session)
             session.clear()  # Sempre começa limpo
             
             enderecos_brutos = request.form.get('enderecos', '').strip()
             if not enderecos_brutos:
                 raise ValueError("Nenhum endereço fornecido no formulário.")
 
-            enderecos, ceps, order_numbers = parser.parse_paack(enderecos_brutos)
+            enderecos, ceps, order_numbers = parser.parse_paack_texto(enderecos_brutos)
             if not enderecos:
                 raise ValueError("Não foi possível extrair endereços do texto. Verifique o formato.")
 
-            lista_processada = []
+            itens = []
             for endereco, cep, numero_pacote in zip(enderecos, ceps, order_numbers):
                 res_google = valida_rua_google(endereco, cep)
                 novo_item = {
@@ -54,19 +56,25 @@ def preview():
                     "freguesia": res_google.get('sublocality', ''),
                     "locality": res_google.get('locality', '')
                 }
-                if registro_unico(lista_processada, novo_item):
-                    lista_processada.append(novo_item)
+                itens.append(novo_item)
 
-            session['lista'] = lista_processada
-            session.modified = True
+            lista_enderecos.guardar_na_sessao(session, pipeline.deduplica_registos(itens))
             return redirect(url_for('preview.preview'))
 
-        # GET: Renderiza a lista salva na sessão
-        lista_atual = session.get('lista', [])
+        # GET: Renderiza a lista salva na sessão. Com ?job=<id> (importação em segundo plano),
+        # a página abre vazia e recebe os itens por SSE à medida que são geocodificados.
+        job_id = request.args.get('job', '')
+        lista_id = None if job_id else lista_enderecos.id_da_sessao(session)
+        versao, linhas = lista_enderecos.listar_com_seq(lista_id) if lista_id else (0, [])
+        lista_atual = [item for _, item in linhas]
         origens = list(set(item.get('importacao_tipo', 'manual') for item in lista_atual))
         return render_template(
             "preview.html",
             lista=lista_atual,
+            seqs=[seq for seq, _ in linhas],
+            lista_id=lista_id or '',
+            versao=versao,
+            job_id=job_id,
             MAPBOX_TOKEN=os.environ.get("MAPBOX_TOKEN", ""),
             GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", ""),
             origens=origens
@@ -76,26 +84,3 @@ def preview():
         logger.error(f"[preview] Erro ao processar: {str(e)}", exc_info=True)
         flash(f"Houve um erro ao processar os endereços: {e}. Tente novamente.", "danger")
         return redirect(url_for('preview.home'))
-
-
-# --- NOVA ROTA PARA REMOVER ENDEREÇO ---
-@preview_bp.route('/api/remover-endereco', methods=['POST'])
-def remover_endereco():
-    """Remove um endereço da lista de endereços na sessão, dado o índice."""
-    data = request.get_json()
-    idx = data.get('idx')
-
-    # Recupera lista atual da sessão
-    lista = session.get('lista', [])
-
-    try:
-        idx = int(idx)
-        if 0 <= idx < len(lista):
-            lista.pop(idx)
-            session['lista'] = lista
-            session.modified = True
-            return jsonify({'success': True, 'lista': lista})
-        else:
-            return jsonify({'success': False, 'msg': 'Índice inválido.'}), 400
-    except Exception as e:
-        return jsonify({'success': False, 'msg': f'Erro ao remover: {str(e)}'}), 500
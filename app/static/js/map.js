@@ -82,38 +82,92 @@ class MapManager {
             return;
         }
 
-        validCoords.forEach(item => {
-            // LÓGICA DE COR: Vermelho para pendentes/erro, cor da importação se OK.
-            const markerColor = item.status_google !== "OK" ? "#E74C3C" : (item.cor || "#0d6efd");
-            
-            const el = document.createElement('div');
-            el.className = 'custom-marker-numbered';
-            el.style.backgroundColor = markerColor;
-            el.innerText = String(item.order_number || item.originalIndex + 1).substring(0, 4);
-            el.title = item.address; // Tooltip com o endereço
-
-            const marker = new mapboxgl.Marker({ element: el, draggable: true })
-                .setLngLat([parseFloat(item.longitude), parseFloat(item.latitude)])
-                .setPopup(new mapboxgl.Popup({ offset: 25 }).setHTML(`
-                    <div class="map-infowindow">
-                        <h6>${item.order_number || 'Sem ID'}</h6>
-                        <p>${item.address}</p>
-                        <p>CEP: ${item.cep || 'Não informado'}</p>
-                        ${item.status_google === 'OK' ? '<p class="text-success small">✓ Validado</p>' : `<p class="text-danger small">${item.status_google || 'Não validado'}</p>`}
-                    </div>`
-                ))
-                .addTo(this.map);
-
-            // Armazena o marcador no array
-            this.markers[item.originalIndex] = marker;
-
-            // Associa o callback de arrastar
-            if (typeof this.options.onMarkerDragEnd === 'function') {
-                marker.on('dragend', () => this.options.onMarkerDragEnd(item.originalIndex, marker));
+        validCoords.forEach(item => this._createMarker(item, item.originalIndex));
+
+        this.fitToBounds(validCoords);
+    }
+
+    /**
+     * Acrescenta marcadores sem redesenhar os existentes (resultados parciais de uma importação).
+     * @param {Array<object>} items - Novos endereços.
+     * @param {number} startIndex - Índice, na lista de dados, do primeiro item novo.
+     * @param {boolean} [fit=false] - Reajusta a área do mapa a todos os marcadores.
+     */
+    addMarkers(items, startIndex, fit = false) {
+        if (!this.map) return;
+        items.forEach((item, offset) => {
+            const index = startIndex + offset;
+            this.addressData[index] = item;
+            if (this._isValidCoordinate(item.latitude) && this._isValidCoordinate(item.longitude)) {
+                this._createMarker(item, index);
             }
         });
+        if (fit) {
+            this.fitToBounds(this.addressData.filter(item => this._isValidCoordinate(item.latitude) && this._isValidCoordinate(item.longitude)));
+        }
+    }
 
-        this.fitToBounds(validCoords);
+    /**
+     * Cria um marcador numerado e regista-o na posição `index`.
+     * @private
+     * @param {object} item - Endereço com coordenadas válidas.
+     * @param {number} index - Índice do item na lista de dados.
+     */
+    _createMarker(item, index) {
+        // LÓGICA DE COR: Vermelho para pendentes/erro, cor da importação se OK.
+        const markerColor = item.status_google !== "OK" ? "#E74C3C" : (item.cor || "#0d6efd");
+        
+        const el = document.createElement('div');
+        el.className = 'custom-marker-numbered';
+        el.style.backgroundColor = markerColor;
+        el.innerText = String(item.order_number || index + 1).substring(0, 4);
+        el.title = item.address; // Tooltip com o endereço
+
+        const marker = new mapboxgl.Marker({ element: el, draggable: true })
+            .setLngLat([parseFloat(item.longitude), parseFloat(item.latitude)])
+            .setPopup(new mapboxgl.Popup({ offset: 25 }).setHTML(`
+                <div class="map-infowindow">
+                    <h6>${item.order_number || 'Sem ID'}</h6>
+                    <p>${item.address}</p>
+                    <p>CEP: ${item.cep || 'Não informado'}</p>
+                    ${item.status_google === 'OK' ? '<p class="text-success small">✓ Validado</p>' : `<p class="text-danger small">${item.status_google || 'Não validado'}</p>`}
+                </div>`
+            ))
+            .addTo(this.map);
+
+        // Armazena o marcador no array
+        this.markers[index] = marker;
+
+        // Associa o callback de arrastar (índice atual: pode mudar depois de remoções)
+        if (typeof this.options.onMarkerDragEnd === 'function') {
+            marker.on('dragend', () => this.options.onMarkerDragEnd(this.markers.indexOf(marker), marker));
+        }
+    }
+
+    /**
+     * Redesenha apenas o marcador de um endereço alterado.
+     * @param {number} index - Índice do item na lista de dados.
+     * @param {object} item - Dados atualizados.
+     */
+    updateMarker(index, item) {
+        if (!this.map) return;
+        this.markers[index]?.remove();
+        delete this.markers[index];
+        this.addressData[index] = item;
+        if (this._isValidCoordinate(item.latitude) && this._isValidCoordinate(item.longitude)) {
+            this._createMarker(item, index);
+        }
+    }
+
+    /**
+     * Remove o marcador de um endereço; os índices seguintes recuam uma posição.
+     * A lista de dados é a do chamador (partilhada com `renderMarkers`) e é ele que a atualiza.
+     * @param {number} index - Índice do item removido.
+     */
+    removeMarker(index) {
+        if (!this.map) return;
+        this.markers[index]?.remove();
+        this.markers.splice(index, 1);
     }
 
     /**
@@ -15,6 +15,12 @@ const i18n = {
         added: "Novo endereço adicionado!",
         updated: "Endereço atualizado com sucesso!",
         validated: "Endereço validado com sucesso!",
+        validated_batch: "Endereços validados",
+        nothing_to_validate: "Nenhum endereço editado para validar.",
+        importing: "A importar",
+        import_done: "Importação concluída.",
+        import_failed: "A importação falhou: ",
+        import_in_progress: "Aguarde o fim da importação para editar endereços.",
         total: "Total",
         validated_label: "Validados",
         pending: "Pendentes",
@@ -76,8 +82,18 @@ function showGlobalSpinner(show = true) {
 // ========================
 // 3. Estado Global da Página
 // ========================
+// Cada linha é identificada pelo seu `seq` no servidor (estável, ao contrário da posição).
+// `listaVersao` é a versão da lista que a página reflete: as respostas trazem só o delta.
 let mapManager;
 let enderecosData = [];
+let enderecosSeqs = [];
+let listaId = '';
+let listaVersao = 0;
+let importacaoEmCurso = false;
+
+function posicaoDoSeq(seq) {
+    return enderecosSeqs.indexOf(seq);
+}
 
 // ========================
 // 4. Inicialização Principal
@@ -86,10 +102,17 @@ document.addEventListener('DOMContentLoaded', () => {
     const pageDataElement = document.getElementById('page-data');
     try {
         enderecosData = JSON.parse(pageDataElement?.dataset?.enderecos || '[]');
+        enderecosSeqs = JSON.parse(pageDataElement?.dataset?.seqs || '[]');
+        listaId = pageDataElement?.dataset?.listaId || '';
+        listaVersao = parseInt(pageDataElement?.dataset?.versao || '0', 10);
     } catch (e) {
         window.MapsDrive?.showToast?.(t('error_load'), t('danger'));
         return;
     }
+    if (pageDataElement.dataset.jobEventos) {
+        previewImport.start(pageDataElement);
+        return;
+    }
     if (!Array.isArray(enderecosData) || enderecosData.length === 0) {
         console.warn("Nenhum dado de endereço encontrado para inicializar a página.");
         previewTable.rebuild(); // Chama para mostrar a mensagem de tabela vazia.
@@ -114,6 +137,11 @@ document.addEventListener('DOMContentLoaded', () => {
     document.addEventListener('mapsdrive:themechange', (e) => {
         mapManager.setTheme?.(e.detail.theme);
     });
+
+    // Ao voltar ao separador, aplica as alterações feitas noutro separador (só o delta)
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') previewSync.refresh();
+    });
 });
 
 // ========================
@@ -128,19 +156,20 @@ const previewTable = {
             tbody.innerHTML = '<tr><td colspan="5" class="text-center p-4">Nenhum endereço para exibir.</td></tr>';
             return;
         }
-        enderecosData.forEach((item, idx) => this.appendRow(item, idx));
+        enderecosData.forEach((item, idx) => this.appendRow(item, enderecosSeqs[idx]));
     },
-    appendRow(item, idx) {
+    appendRow(item, seq) {
         const tbody = document.getElementById('address-table-body');
         const row = document.createElement('tr');
-        row.id = `row-${idx}`;
+        row.id = `row-${seq}`;
         tbody.appendChild(row);
-        this.updateRow(idx, item);
+        this.updateRow(seq, item);
     },
-    updateRow(idx, data) {
-        const row = document.getElementById(`row-${idx}`);
+    updateRow(seq, data) {
+        const row = document.getElementById(`row-${seq}`);
         if (!row) return;
-        enderecosData[idx] = data;
+        const idx = posicaoDoSeq(seq);
+        if (idx >= 0) enderecosData[idx] = data;
         const status_google = data.status_google || 'Pendente';
         let statusClass, statusText;
         if (status_google === 'OK') {
@@ -152,19 +181,26 @@ const previewTable = {
         }
         row.innerHTML = `
             <td><span class="badge bg-primary-subtle text-primary-emphasis rounded-pill">${data.order_number}</span></td>
-            <td><input type="text" class="form-control form-control-sm" id="address-${idx}" value="${data.address}" oninput="previewTable.enableValidate(${idx})"></td>
-            <td><input type="text" class="form-control form-control-sm cep-input" id="cep-${idx}" value="${data.cep || ''}" oninput="previewTable.enableValidate(${idx})"></td>
-            <td id="status-${idx}"><span class="badge bg-${statusClass}-subtle text-${statusClass}-emphasis rounded-pill">${statusText}</span></td>
+            <td><input type="text" class="form-control form-control-sm" id="address-${seq}" value="${data.address}" oninput="previewTable.enableValidate(${seq})"></td>
+            <td><input type="text" class="form-control form-control-sm cep-input" id="cep-${seq}" value="${data.cep || ''}" oninput="previewTable.enableValidate(${seq})"></td>
+            <td id="status-${seq}"><span class="badge bg-${statusClass}-subtle text-${statusClass}-emphasis rounded-pill">${statusText}</span></td>
             <td class="text-center">
-                <button class="btn btn-primary btn-sm btn-icon btn-validate" id="btn-validate-${idx}" onclick="debouncedValidateAddress(${idx})" disabled title="Validar endereço"><i class="fas fa-search-location"></i></button>
-                <button class="btn btn-secondary btn-sm btn-icon" onclick="focusMarker(${idx})" title="Focar no mapa"><i class="fas fa-map-marker-alt"></i></button>
-                <button class="btn btn-danger btn-sm btn-icon" onclick="removeAddress(${idx})" title="Remover endereço"><i class="fas fa-trash-alt"></i></button>
+                <button class="btn btn-primary btn-sm btn-icon btn-validate" id="btn-validate-${seq}" onclick="debouncedValidateAddress(${seq})" disabled title="Validar endereço"><i class="fas fa-search-location"></i></button>
+                <button class="btn btn-secondary btn-sm btn-icon" onclick="focusMarker(${seq})" title="Focar no mapa"><i class="fas fa-map-marker-alt"></i></button>
+                <button class="btn btn-danger btn-sm btn-icon" onclick="removeAddress(${seq})" title="Remover endereço"><i class="fas fa-trash-alt"></i></button>
             </td>
         `;
-        applyInputMask(`#cep-${idx}`, maskCEP);
+        applyInputMask(`#cep-${seq}`, maskCEP);
+    },
+    removeRow(seq) {
+        document.getElementById(`row-${seq}`)?.remove();
     },
-    enableValidate(idx) {
-        document.getElementById(`btn-validate-${idx}`).disabled = false;
+    enableValidate(seq) {
+        document.getElementById(`btn-validate-${seq}`).disabled = false;
+        document.getElementById('btn-validate-edited')?.removeAttribute('disabled');
+    },
+    editedSeqs() {
+        return enderecosSeqs.filter(seq => document.getElementById(`btn-validate-${seq}`)?.disabled === false);
     }
 };
 window.previewTable = previewTable;
@@ -181,30 +217,170 @@ const previewStats = {
     }
 };
 
+// ========================
+// 6b. Sincronização por versões (delta)
+// ========================
+const previewSync = {
+    /**
+     * Aplica um delta do servidor (adicionados, alterados, removidos desde uma versão):
+     * só as linhas e marcadores afetados são redesenhados.
+     */
+    apply(delta) {
+        if (!delta) return;
+        delta.removidos.forEach(seq => {
+            const idx = posicaoDoSeq(seq);
+            if (idx < 0) return;
+            enderecosData.splice(idx, 1);
+            enderecosSeqs.splice(idx, 1);
+            previewTable.removeRow(seq);
+            mapManager?.removeMarker(idx);
+        });
+        delta.alterados.forEach(({ seq, item }) => {
+            const idx = posicaoDoSeq(seq);
+            if (idx < 0) return;
+            previewTable.updateRow(seq, item);
+            mapManager?.updateMarker(idx, item);
+        });
+        delta.adicionados.forEach(({ seq, item }) => {
+            if (posicaoDoSeq(seq) >= 0) return;
+            if (enderecosData.length === 0) document.getElementById('address-table-body').innerHTML = '';
+            enderecosData.push(item);
+            enderecosSeqs.push(seq);
+            previewTable.appendRow(item, seq);
+            mapManager?.addMarkers([item], enderecosData.length - 1);
+        });
+        if (enderecosData.length === 0) previewTable.rebuild();
+        listaVersao = Math.max(listaVersao, delta.versao);
+        previewStats.update();
+    },
+
+    /** Resposta de uma alteração: aplica o delta, se veio, e avança a versão. */
+    applyResponse(data) {
+        if (data.delta) this.apply(data.delta);
+        else listaVersao = Math.max(listaVersao, data.versao || 0);
+    },
+
+    async refresh() {
+        if (!listaId || importacaoEmCurso) return;
+        try {
+            const resp = await fetch(`/api/lista?desde=${listaVersao}&lista=${encodeURIComponent(listaId)}`, { headers: { 'Accept': 'application/json' } });
+            if (!resp.ok) return;
+            const data = await resp.json();
+            if (data.lista_id !== listaId) return;
+            this.apply(data);
+        } catch (e) { /* Sem ligação: tenta de novo na próxima visita ao separador */ }
+    }
+};
+
 // ========================
 // 7. Módulo do Mapa (Handlers)
 // ========================
 const previewMap = {
     async onMarkerDragEnd(idx, marker) {
+        if (bloqueadoPelaImportacao()) {
+            const item = enderecosData[idx];
+            marker.setLngLat([parseFloat(item.longitude), parseFloat(item.latitude)]);
+            return;
+        }
+        const seq = enderecosSeqs[idx];
         const newLngLat = marker.getLngLat();
-        const row = document.getElementById(`row-${idx}`);
+        const row = document.getElementById(`row-${seq}`);
         row?.classList.add('table-info');
         try {
             const data = await fetchAPI('/api/reverse-geocode', {
                 method: "POST", headers: {"Content-Type": "application/json"},
-                body: JSON.stringify({ idx, lat: newLngLat.lat, lng: newLngLat.lng })
+                body: JSON.stringify({ seq, lat: newLngLat.lat, lng: newLngLat.lng, versao: listaVersao })
             });
             if (data.success) {
-                previewTable.updateRow(idx, data.item);
-                previewStats.update();
+                previewSync.applyResponse(data);
                 window.MapsDrive?.showToast?.(t('updated'), t('success'));
-                mapManager.renderMarkers(enderecosData);
             }
         } catch(e) { /* Erro já tratado pela fetchAPI */ }
         finally { row?.classList.remove('table-info'); }
     }
 };
 
+// ========================
+// 7b. Importação em segundo plano (resultados parciais por SSE)
+// ========================
+const previewImport = {
+    source: null,
+    progress: null,
+    pendingFit: true,
+
+    start(pageDataElement) {
+        importacaoEmCurso = true;
+        enderecosData = [];
+        enderecosSeqs = [];
+        previewTable.rebuild();
+        this.updateStats();
+        mapManager = new MapManager('map', pageDataElement.dataset.mapboxToken, {
+            onMarkerDragEnd: previewMap.onMarkerDragEnd
+        });
+        mapManager.init(enderecosData);
+        document.addEventListener('mapsdrive:themechange', (e) => mapManager.setTheme?.(e.detail.theme));
+
+        // O EventSource volta a ligar sozinho (com Last-Event-ID) quando o servidor fecha o stream
+        this.source = new EventSource(pageDataElement.dataset.jobEventos);
+        this.source.addEventListener('itens', (e) => this.onItems(JSON.parse(e.data)));
+        this.source.addEventListener('progresso', (e) => { this.progress = JSON.parse(e.data); this.updateStats(); });
+        this.source.addEventListener('concluido', () => this.finish(pageDataElement.dataset.jobResultado));
+        this.source.addEventListener('erro', (e) => this.fail(JSON.parse(e.data).erro));
+    },
+
+    onItems(items) {
+        const inicio = enderecosData.length;
+        const tbody = document.getElementById('address-table-body');
+        if (inicio === 0 && tbody) tbody.innerHTML = '';
+        items.forEach((item, offset) => {
+            // Itens provisórios ainda não têm seq no servidor: usam seqs negativos
+            const seq = -(inicio + offset + 1);
+            enderecosData.push(item);
+            enderecosSeqs.push(seq);
+            previewTable.appendRow(item, seq);
+        });
+        // Ajusta a área do mapa na primeira leva; depois os marcadores só são acrescentados
+        mapManager.addMarkers(items, inicio, this.pendingFit);
+        this.pendingFit = false;
+        this.updateStats();
+    },
+
+    updateStats() {
+        previewStats.update();
+        const p = this.progress;
+        if (!importacaoEmCurso || !p) return;
+        const processados = p.geocodificadas + p.falhadas;
+        document.getElementById('stats-bar').insertAdjacentHTML('beforeend',
+            ` | <span class="spinner-border spinner-border-sm ms-1" role="status" aria-hidden="true"></span> ${t('importing')}: ${processados}/${p.linhas_lidas}`);
+    },
+
+    async finish(resultadoUrl) {
+        this.source.close();
+        try {
+            // A lista final já vem deduplicada e renumerada; passa a ser a da sessão
+            const data = await fetchAPI(resultadoUrl, { headers: { 'Accept': 'application/json' } });
+            enderecosData = data.lista || [];
+            enderecosSeqs = data.seqs || [];
+            listaId = data.lista_id || '';
+            listaVersao = data.versao || 0;
+            importacaoEmCurso = false;
+            previewTable.rebuild();
+            applyInputMask('.cep-input', maskCEP);
+            mapManager.renderMarkers(enderecosData);
+            previewStats.update();
+            window.history.replaceState(null, '', window.location.pathname);
+            window.MapsDrive?.showToast?.(`${t('import_done')} ${data.total} endereços.`, t('success'));
+        } catch (e) { /* Erro já tratado pela fetchAPI */ }
+    },
+
+    fail(message) {
+        this.source.close();
+        importacaoEmCurso = false;
+        previewStats.update();
+        window.MapsDrive?.showToast?.(t('import_failed') + (message || ''), t('danger'));
+    }
+};
+
 // ========================
 // 8. Funções de Comunicação com API
 // ========================
@@ -226,44 +402,84 @@ async function fetchAPI(endpoint, options) {
 const debouncedValidateAddress = debounce(validateAddress, 600);
 window.debouncedValidateAddress = debouncedValidateAddress;
 
-async function validateAddress(idx) {
-    const btn = document.getElementById(`btn-validate-${idx}`);
+function bloqueadoPelaImportacao() {
+    if (importacaoEmCurso) window.MapsDrive?.showToast?.(t('import_in_progress'), t('warning'));
+    return importacaoEmCurso;
+}
+
+async function validateAddress(seq) {
+    if (bloqueadoPelaImportacao()) return;
+    const btn = document.getElementById(`btn-validate-${seq}`);
     btn.disabled = true;
     btn.innerHTML = '<span class="spinner-border spinner-border-sm"></span>';
     try {
         const data = await fetchAPI('/api/validar-linha', {
             method: "POST", headers: {"Content-Type": "application/json"},
             body: JSON.stringify({ 
-                idx, 
-                endereco: document.getElementById(`address-${idx}`).value,
-                cep: document.getElementById(`cep-${idx}`).value
+                seq,
+                versao: listaVersao,
+                endereco: document.getElementById(`address-${seq}`).value,
+                cep: document.getElementById(`cep-${seq}`).value
             })
         });
         if (data.success) {
-            previewTable.updateRow(idx, data.item);
-            mapManager.renderMarkers(enderecosData);
-            previewStats.update();
+            previewSync.applyResponse(data);
             window.MapsDrive?.showToast?.(t('validated'), t('success'));
         }
     } catch(e) {
-        previewTable.updateRow(idx, enderecosData[idx]);
+        previewTable.updateRow(seq, enderecosData[posicaoDoSeq(seq)]);
     } finally {
         btn.innerHTML = '<i class="fas fa-search-location"></i>';
     }
 }
 
-async function removeAddress(idx) {
+/**
+ * Valida de uma vez todas as linhas editadas: um único pedido em lote, geocodificado
+ * em paralelo no servidor e gravado numa só escrita.
+ */
+async function validateEdited() {
+    if (bloqueadoPelaImportacao()) return;
+    const seqs = previewTable.editedSeqs();
+    const btn = document.getElementById('btn-validate-edited');
+    if (!seqs.length) {
+        window.MapsDrive?.showToast?.(t('nothing_to_validate'), t('warning'));
+        btn?.setAttribute('disabled', '');
+        return;
+    }
+    btn?.setAttribute('disabled', '');
+    try {
+        const data = await fetchAPI('/api/validar-lote', {
+            method: "POST", headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({
+                versao: listaVersao,
+                itens: seqs.map(seq => ({
+                    seq,
+                    endereco: document.getElementById(`address-${seq}`).value,
+                    cep: document.getElementById(`cep-${seq}`).value
+                }))
+            })
+        });
+        if (data.success) {
+            previewSync.applyResponse(data);
+            const tipo = data.falhados ? t('warning') : t('success');
+            window.MapsDrive?.showToast?.(`${t('validated_batch')}: ${data.validados}/${seqs.length}`, tipo);
+        }
+    } catch(e) { /* Erro já tratado pela fetchAPI */ }
+    finally {
+        if (previewTable.editedSeqs().length) btn?.removeAttribute('disabled');
+    }
+}
+
+async function removeAddress(seq) {
+    if (bloqueadoPelaImportacao()) return;
     if (!confirm(t('error_remove'))) return;
     try {
         const data = await fetchAPI('/api/remover-endereco', {
             method: "POST", headers: {"Content-Type": "application/json"},
-            body: JSON.stringify({ idx })
+            body: JSON.stringify({ seq, versao: listaVersao })
         });
         if (data.success) {
-            enderecosData = data.lista;
-            previewTable.rebuild();
-            mapManager.renderMarkers(enderecosData);
-            previewStats.update();
+            previewSync.applyResponse(data);
             window.MapsDrive?.showToast?.(t('removed'), t('warning'));
         }
     } catch(e) { /* Erro já tratado */ }
@@ -271,6 +487,7 @@ async function removeAddress(idx) {
 
 async function saveNewAddress(event) {
     event.preventDefault();
+    if (bloqueadoPelaImportacao()) return;
     const form = event.target;
     if (!form.checkValidity()) { form.classList.add('was-validated'); return; }
     
@@ -284,14 +501,14 @@ async function saveNewAddress(event) {
             body: JSON.stringify({ 
                 id: document.getElementById('new_id').value,
                 endereco: document.getElementById('new_address').value,
-                cep: document.getElementById('new_cep').value
+                cep: document.getElementById('new_cep').value,
+                versao: listaVersao
             })
         });
         if (data.success) {
-            enderecosData.push(data.item);
-            previewTable.appendRow(data.item, enderecosData.length - 1);
-            mapManager.renderMarkers(enderecosData);
-            previewStats.update();
+            // Uma lista criada agora (sessão sem importação) começa com este id
+            if (!listaId) listaId = data.lista_id;
+            previewSync.applyResponse(data);
             toggleNewAddressForm();
             form.reset();
             form.classList.remove('was-validated');
@@ -317,7 +534,8 @@ function toggleNewAddressForm() {
     if (!isHidden) form.querySelector('input').focus();
 }
 
-function focusMarker(idx) {
+function focusMarker(seq) {
+    const idx = posicaoDoSeq(seq);
     if (mapManager && mapManager.markers && mapManager.markers[idx]) {
         mapManager.markers[idx].togglePopup();
     }
@@ -331,3 +549,4 @@ window.saveNewAddress = saveNewAddress;
 window.toggleNewAddressForm = toggleNewAddressForm;
 window.focusMarker = focusMarker;
 window.validateAddress = validateAddress;
+window.validateEdited = validateEdited;
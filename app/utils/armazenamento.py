@@ -0,0 +1,70 @@
+# app/utils/armazenamento.py
+"""
+Ligações partilhadas para os armazenamentos entre workers (SQLite local e Redis).
+Usado pelo cache de geocodificação, pelos jobs de importação e pelos restantes
+estados que precisam de ser vistos por todos os workers do gunicorn.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+
+class ConexoesSQLite:
+    """Fornece uma ligação SQLite (modo WAL) por thread e por processo."""
+
+    def __init__(self, caminho: str, esquema: str = ""):
+        self.caminho = caminho
+        self.esquema = esquema
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        # Os workers são criados por fork: ligações herdadas do processo pai não são reutilizadas
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            diretorio = os.path.dirname(self.caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.esquema:
+                conn.executescript(self.esquema)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+_cliente_redis = None
+
+
+def cliente_redis():
+    """
+    Ligação Redis partilhada pelas sessões e pelos backends, criada a partir de
+    REDIS_URL no primeiro uso (o pool do redis-py refaz as ligações após fork).
+    """
+    global _cliente_redis
+    if _cliente_redis is None:
+        redis_url = os.environ.get("REDIS_URL")
+        if not redis_url:
+            return None
+        import redis
+        _cliente_redis = redis.from_url(redis_url)
+    return _cliente_redis
+
+
+def _json_padrao(valor):
+    """Converte escalares NumPy (bool_, int64, float64) vindos dos DataFrames."""
+    if hasattr(valor, "item"):
+        return valor.item()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def para_json(valor) -> str:
+    """Serializa em JSON aceitando os escalares NumPy dos registos criados com pandas."""
+    return json.dumps(valor, ensure_ascii=False, default=_json_padrao)
+
+
+def texto(valor):
+    """Respostas do Redis chegam em bytes; SQLite devolve str."""
+    return valor.decode("utf-8") if isinstance(valor, bytes) else valor
@@ -0,0 +1,202 @@
+# app/utils/cache.py
+"""
+Cache persistente de geocodificação, partilhado entre workers do gunicorn.
+Guarda os resultados de `geocoder.valida_rua` (chave: endereço normalizado + CEP)
+e de `geocoder.obter_endereco_por_coordenadas` (chave: coordenadas arredondadas).
+
+Backends disponíveis (variável GEOCACHE_BACKEND):
+  - "sqlite": ficheiro SQLite local (padrão), partilhado pelos workers da máquina;
+  - "redis": o cliente partilhado de `armazenamento.cliente_redis()`, criado a partir
+    de REDIS_URL (o mesmo das sessões quando SESSION_TYPE=redis);
+  - "none": desativa o cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+from . import metricas
+from .armazenamento import ConexoesSQLite, cliente_redis
+from .helpers import normalizar
+
+logger = logging.getLogger(__name__)
+
+GEOCACHE_BACKEND = os.environ.get("GEOCACHE_BACKEND", "sqlite").lower()
+GEOCACHE_PATH = os.environ.get("GEOCACHE_PATH", os.path.join(os.getcwd(), "geocache.sqlite3"))
+GEOCACHE_TTL = int(os.environ.get("GEOCACHE_TTL", 30 * 24 * 3600))              # 30 dias
+GEOCACHE_TTL_REVERSO = int(os.environ.get("GEOCACHE_TTL_REVERSO", 7 * 24 * 3600))  # 7 dias
+GEOCACHE_MAX_ENTRADAS = int(os.environ.get("GEOCACHE_MAX_ENTRADAS", 200000))
+# 4 casas decimais ≈ 11 m: arrastos de marcador no mesmo prédio partilham a entrada
+GEOCACHE_PRECISAO_COORDS = int(os.environ.get("GEOCACHE_PRECISAO_COORDS", 4))
+
+PREFIXO = "geocache:v1:"
+# A limpeza por tamanho só é verificada a cada N escritas, para não pesar em cada `guardar`
+_INTERVALO_LIMPEZA = 500
+
+
+def chave_endereco(endereco: str, cep: str) -> str:
+    """Chave de cache para busca direta: endereço normalizado + CEP só com dígitos."""
+    cep_limpo = re.sub(r'\D', '', str(cep or ''))
+    base = f"{normalizar(endereco)}|{cep_limpo}"
+    return PREFIXO + "fwd:" + hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def chave_coordenadas(lat: float, lng: float) -> str:
+    """Chave de cache para busca reversa: coordenadas arredondadas."""
+    casas = GEOCACHE_PRECISAO_COORDS
+    return PREFIXO + f"rev:{round(float(lat), casas):.{casas}f},{round(float(lng), casas):.{casas}f}"
+
+
+class SQLiteBackend:
+    """Backend em ficheiro SQLite (modo WAL), seguro para vários processos."""
+
+    def __init__(self, caminho: str, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._escritas = 0
+        self._conexao = ConexoesSQLite(caminho, esquema=(
+            "CREATE TABLE IF NOT EXISTS geocache ("
+            " chave TEXT PRIMARY KEY, valor TEXT NOT NULL,"
+            " expira REAL NOT NULL, criado REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_geocache_criado ON geocache (criado);"
+        ))
+
+    def get(self, chave: str) -> Optional[str]:
+        row = self._conexao().execute(
+            "SELECT valor FROM geocache WHERE chave = ? AND expira > ?", (chave, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, chave: str, valor: str, ttl: int) -> None:
+        agora = time.time()
+        self._conexao().execute(
+            "INSERT OR REPLACE INTO geocache (chave, valor, expira, criado) VALUES (?, ?, ?, ?)",
+            (chave, valor, agora + ttl, agora)
+        )
+        self._escritas += 1
+        if self._escritas % _INTERVALO_LIMPEZA == 0:
+            self._limpar(agora)
+
+    def _limpar(self, agora: float) -> None:
+        """Remove entradas expiradas e, se necessário, as mais antigas acima do limite."""
+        conn = self._conexao()
+        conn.execute("DELETE FROM geocache WHERE expira <= ?", (agora,))
+        total = conn.execute("SELECT COUNT(*) FROM geocache").fetchone()[0]
+        excesso = total - self.max_entradas
+        if excesso > 0:
+            conn.execute(
+                "DELETE FROM geocache WHERE chave IN "
+                "(SELECT chave FROM geocache ORDER BY criado LIMIT ?)", (excesso,)
+            )
+            logger.info(f"Cache de geocodificação: {excesso} entradas antigas removidas.")
+
+
+class RedisBackend:
+    """
+    Backend Redis com TTL nativo e um índice ordenado para limitar o tamanho.
+    O score de cada chave no índice é o instante em que expira: as já expiradas saem
+    do índice a cada escrita e, acima do limite, removem-se as que expirariam primeiro.
+    """
+
+    INDICE = PREFIXO + "indice"
+
+    def __init__(self, cliente, max_entradas: int):
+        self.cliente = cliente
+        self.max_entradas = max_entradas
+        self._escritas = 0
+
+    def get(self, chave: str) -> Optional[str]:
+        valor = self.cliente.get(chave)
+        if valor is None:
+            return None
+        return valor.decode('utf-8') if isinstance(valor, bytes) else valor
+
+    def set(self, chave: str, valor: str, ttl: int) -> None:
+        agora = time.time()
+        pipe = self.cliente.pipeline(transaction=False)
+        pipe.set(chave, valor, ex=ttl)
+        pipe.zadd(self.INDICE, {chave: agora + ttl})
+        pipe.zremrangebyscore(self.INDICE, "-inf", agora)
+        pipe.execute()
+        self._escritas += 1
+        if self._escritas % _INTERVALO_LIMPEZA == 0:
+            self._limpar()
+
+    def _limpar(self) -> None:
+        excesso = self.cliente.zcard(self.INDICE) - self.max_entradas
+        if excesso > 0:
+            antigas = self.cliente.zrange(self.INDICE, 0, excesso - 1)
+            if antigas:
+                pipe = self.cliente.pipeline(transaction=False)
+                pipe.delete(*antigas)
+                pipe.zrem(self.INDICE, *antigas)
+                pipe.execute()
+                logger.info(f"Cache de geocodificação: {len(antigas)} entradas antigas removidas.")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_estatisticas = {"hits": 0, "misses": 0, "erros": 0}
+
+
+def get_backend():
+    """Devolve o backend configurado (criado na primeira utilização), ou None se desativado."""
+    global _backend
+    if _backend is None and GEOCACHE_BACKEND != "none":
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    if GEOCACHE_BACKEND == "redis":
+                        cliente = cliente_redis()
+                        if cliente is None:
+                            raise RuntimeError("GEOCACHE_BACKEND=redis mas nenhuma ligação Redis configurada")
+                        _backend = RedisBackend(cliente, GEOCACHE_MAX_ENTRADAS)
+                    else:
+                        _backend = SQLiteBackend(GEOCACHE_PATH, GEOCACHE_MAX_ENTRADAS)
+                    logger.info(f"Cache de geocodificação ativo (backend: {type(_backend).__name__}).")
+                except Exception as e:
+                    logger.error(f"Falha ao iniciar o cache de geocodificação: {e}. Cache desativado.")
+                    _backend = False
+    return _backend or None
+
+
+def obter(chave: str) -> Optional[dict]:
+    """Lê um resultado do cache. Falhas do backend nunca interrompem a geocodificação."""
+    backend = get_backend()
+    if backend is None:
+        return None
+    try:
+        valor = backend.get(chave)
+    except Exception as e:
+        _estatisticas["erros"] += 1
+        metricas.cache("erro")
+        logger.warning(f"Erro ao ler do cache de geocodificação: {e}")
+        return None
+    if valor is None:
+        _estatisticas["misses"] += 1
+        metricas.cache("miss")
+        return None
+    _estatisticas["hits"] += 1
+    metricas.cache("hit")
+    return json.loads(valor)
+
+
+def guardar(chave: str, resultado: dict, ttl: int = GEOCACHE_TTL) -> None:
+    """Grava um resultado no cache com o TTL indicado."""
+    backend = get_backend()
+    if backend is None:
+        return
+    try:
+        backend.set(chave, json.dumps(resultado, ensure_ascii=False), ttl)
+    except Exception as e:
+        _estatisticas["erros"] += 1
+        logger.warning(f"Erro ao gravar no cache de geocodificação: {e}")
+
+
+def estatisticas() -> dict:
+    """Contadores de hits/misses/erros deste processo."""
+    return dict(_estatisticas)
@@ -0,0 +1,387 @@
+# app/utils/codigos_postais.py
+"""
+Provedor de geocodificação offline baseado num índice local de códigos postais portugueses.
+Resolve CP4-CP3 + rua sem rede, a partir de arrays NumPy mapeados em memória (mmap):
+o índice é partilhado pelas páginas do sistema operativo entre todos os workers.
+
+O índice é construído a partir de um CSV com uma linha por artéria e por CEP:
+    cp;arteria;freguesia;municipio;latitude;longitude
+    1100-148;Rua Augusta;Santa Maria Maior;Lisboa;38.7107;-9.1365
+Linhas sem `arteria` definem o centroide do CEP; sem elas, o centroide é a média das artérias.
+As colunas `cp4` + `cp3` podem substituir `cp`.
+
+Construção:
+    python -m app.utils.codigos_postais construir codigos_postais.csv data/cp_index
+
+Também serve geocodificação reversa offline: as artérias são indexadas numa grelha
+regular (lat/lng) e a busca devolve a artéria mais próxima, com CEP, freguesia e município.
+"""
+
+import csv
+import logging
+import os
+import re
+import sys
+import threading
+
+from . import tardio
+from .geoapi import normaliza_nome, extrai_rua_numero
+
+logger = logging.getLogger(__name__)
+np = tardio.modulo("numpy")
+
+CP_INDEX_DIR = os.environ.get("CP_INDEX_DIR", os.path.join(os.getcwd(), "data", "cp_index"))
+
+# Ficheiros que compõem o índice (todos .npy carregados com mmap_mode='r')
+#   ceps.npy          int32 [N]      chave cp4*1000+cp3, ordenada
+#   centroides.npy    float32 [N,2]  lat/lng do centroide de cada CEP
+#   cep_local.npy     int32 [N,2]    freguesia/município (índices na tabela de textos)
+#   art_inicio.npy    int32 [N+1]    intervalo das artérias de cada CEP
+#   art_coords.npy    float32 [M,2]  lat/lng de cada artéria
+#   art_textos.npy    int32 [M,4]    nome, nome normalizado, freguesia, município
+#   textos.npy        uint8 [B]      textos UTF-8 concatenados
+#   textos_inicio.npy int64 [S+1]    intervalo de cada texto em textos.npy
+# Grelha espacial para a busca reversa (opcional: é calculada no arranque se faltar)
+#   grelha_meta.npy     float64 [1]  tamanho da célula em graus
+#   grelha_celulas.npy  int64 [C]    chave de cada célula não vazia, ordenada
+#   grelha_inicio.npy   int64 [C+1]  intervalo de cada célula em grelha_pontos.npy
+#   grelha_pontos.npy   int32 [M]    artérias agrupadas por célula
+FICHEIROS = (
+    "ceps", "centroides", "cep_local", "art_inicio",
+    "art_coords", "art_textos", "textos", "textos_inicio",
+)
+FICHEIROS_GRELHA = ("grelha_meta", "grelha_celulas", "grelha_inicio", "grelha_pontos")
+
+# ~550 m de latitude (~410 m de longitude a 42°N); a busca reversa percorre as células
+# necessárias para cobrir o raio pedido, calculadas em cada eixo a partir da latitude
+GRELHA_CELULA_GRAUS = 0.005
+REVERSO_RAIO_MAX_M = float(os.environ.get("CP_REVERSO_RAIO_MAX_M", 400))
+
+_REGEX_CEP = re.compile(r'^\s*(\d{4})\s*-?\s*(\d{3})\s*$')
+
+
+def chave_cep(cep):
+    """Converte '1234-567' (ou '1234567') na chave inteira 1234567; None se inválido."""
+    m = _REGEX_CEP.match(str(cep or ""))
+    return int(m.group(1)) * 1000 + int(m.group(2)) if m else None
+
+
+def formata_cep(chave):
+    return f"{chave // 1000:04d}-{chave % 1000:03d}"
+
+
+def _chave_celula(lat, lng, celula):
+    """Chave int64 da célula da grelha (aceita escalares ou arrays NumPy)."""
+    linha = np.floor(np.asarray(lat, dtype=np.float64) / celula).astype(np.int64) + (1 << 20)
+    coluna = np.floor(np.asarray(lng, dtype=np.float64) / celula).astype(np.int64) + (1 << 20)
+    return (linha << 32) | coluna
+
+
+def constroi_grelha(coords, celula=GRELHA_CELULA_GRAUS):
+    """Agrupa os pontos `coords` [M,2] por célula. Devolve os arrays da grelha."""
+    chaves = _chave_celula(coords[:, 0], coords[:, 1], celula) if len(coords) else np.zeros(0, dtype=np.int64)
+    ordem = np.argsort(chaves, kind="stable").astype(np.int32)
+    celulas, inicio = np.unique(chaves[ordem], return_index=True)
+    inicio = np.append(inicio, len(ordem)).astype(np.int64)
+    return {
+        "grelha_meta": np.asarray([celula], dtype=np.float64),
+        "grelha_celulas": celulas.astype(np.int64),
+        "grelha_inicio": inicio,
+        "grelha_pontos": ordem,
+    }
+
+
+class IndiceCodigosPostais:
+    """Índice de códigos postais mapeado em memória (só leitura)."""
+
+    def __init__(self, diretorio):
+        arrays = {nome: np.load(os.path.join(diretorio, f"{nome}.npy"), mmap_mode="r") for nome in FICHEIROS}
+        self.diretorio = diretorio
+        self.ceps = arrays["ceps"]
+        self.centroides = arrays["centroides"]
+        self.cep_local = arrays["cep_local"]
+        self.art_inicio = arrays["art_inicio"]
+        self.art_coords = arrays["art_coords"]
+        self.art_textos = arrays["art_textos"]
+        self._textos = arrays["textos"]
+        self._textos_inicio = arrays["textos_inicio"]
+        self._grelha = None
+
+    def __len__(self):
+        return len(self.ceps)
+
+    def texto(self, i):
+        a, b = int(self._textos_inicio[i]), int(self._textos_inicio[i + 1])
+        return bytes(self._textos[a:b]).decode("utf-8")
+
+    def posicao(self, chave):
+        """Posição do CEP no índice (busca binária), ou None."""
+        i = int(np.searchsorted(self.ceps, chave))
+        if i < len(self.ceps) and int(self.ceps[i]) == chave:
+            return i
+        return None
+
+    def arterias(self, pos):
+        return range(int(self.art_inicio[pos]), int(self.art_inicio[pos + 1]))
+
+    def procura_arteria(self, pos, rua_norm):
+        """Artéria do CEP cujo nome normalizado é igual a (ou contém) `rua_norm`."""
+        candidatas = self.arterias(pos)
+        for j in candidatas:
+            if self.texto(int(self.art_textos[j, 1])) == rua_norm:
+                return j
+        for j in candidatas:
+            if rua_norm in self.texto(int(self.art_textos[j, 1])):
+                return j
+        return None
+
+    def grelha(self):
+        """Arrays da grelha espacial: do disco (mmap) ou, para índices antigos, calculados em memória."""
+        if self._grelha is None:
+            try:
+                self._grelha = {nome: np.load(os.path.join(self.diretorio, f"{nome}.npy"), mmap_mode="r")
+                                for nome in FICHEIROS_GRELHA}
+            except FileNotFoundError:
+                logger.info("Grelha espacial ausente no índice; a calcular em memória.")
+                self._grelha = constroi_grelha(np.asarray(self.art_coords))
+        return self._grelha
+
+    def cep_da_arteria(self, j):
+        return int(np.searchsorted(self.art_inicio, j, side="right")) - 1
+
+    def arteria_mais_proxima(self, lat, lng, raio_max_m):
+        """Artéria mais próxima de (lat, lng) dentro de `raio_max_m`: (índice, distância em m) ou None."""
+        grelha = self.grelha()
+        celula = float(grelha["grelha_meta"][0])
+        base = int(_chave_celula(lat, lng, celula))
+        celulas, inicio, pontos = grelha["grelha_celulas"], grelha["grelha_inicio"], grelha["grelha_pontos"]
+
+        # Células a percorrer em cada eixo: em longitude a célula encolhe com cos(latitude)
+        n_lin = max(1, int(np.ceil(raio_max_m / (celula * 111_320.0))))
+        n_col = max(1, int(np.ceil(raio_max_m / (celula * 111_320.0 * max(np.cos(np.radians(lat)), 0.01)))))
+        vizinhas = (base + (np.arange(-n_lin, n_lin + 1, dtype=np.int64)[:, None] << 32)
+                    + np.arange(-n_col, n_col + 1, dtype=np.int64)[None, :]).ravel()
+        ks = np.searchsorted(celulas, vizinhas)
+        candidatos = [pontos[int(inicio[k]):int(inicio[k + 1])]
+                      for k, chave in zip(ks.tolist(), vizinhas.tolist())
+                      if k < len(celulas) and int(celulas[k]) == chave]
+        if not candidatos:
+            return None
+
+        ids = np.concatenate(candidatos)
+        coords = np.asarray(self.art_coords[ids], dtype=np.float64)
+        # Distância equiretangular: precisa o suficiente a esta escala
+        dy = (coords[:, 0] - lat) * 111_320.0
+        dx = (coords[:, 1] - lng) * 111_320.0 * np.cos(np.radians(lat))
+        dist = np.hypot(dx, dy)
+        k = int(np.argmin(dist))
+        if dist[k] > raio_max_m:
+            return None
+        return int(ids[k]), float(dist[k])
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def get_indice():
+    """Carrega o índice na primeira utilização; devolve None se não estiver disponível."""
+    global _indice
+    if _indice is None:
+        with _indice_lock:
+            if _indice is None:
+                try:
+                    _indice = IndiceCodigosPostais(CP_INDEX_DIR)
+                    logger.info(f"Índice de códigos postais carregado: {len(_indice)} CEPs ({CP_INDEX_DIR}).")
+                except FileNotFoundError:
+                    logger.warning(f"Índice de códigos postais não encontrado em {CP_INDEX_DIR}. Provedor offline inativo.")
+                    _indice = False
+                except Exception as e:
+                    logger.error(f"Falha ao carregar o índice de códigos postais: {e}")
+                    _indice = False
+    return _indice or None
+
+
+def valida_rua_offline(endereco, cep):
+    """
+    Mesma lógica de `geoapi.valida_rua_geoapi`, sem rede:
+      1. Rua (normalizada) dentro das artérias do CEP
+      2. Se não achar, centroide do CEP
+    """
+    try:
+        indice = get_indice()
+        if indice is None:
+            return {"status": "NOT_FOUND", "msg": "Índice offline de códigos postais indisponível"}
+        chave = chave_cep(cep)
+        if chave is None:
+            return {"status": "NOT_FOUND", "msg": "Sem CEP válido para o índice offline"}
+        pos = indice.posicao(chave)
+        if pos is None:
+            return {"status": "NOT_FOUND", "msg": f"CEP {cep} não existe no índice offline"}
+
+        rua, numero = extrai_rua_numero(endereco)
+        j = indice.procura_arteria(pos, normaliza_nome(rua))
+        if j is not None:
+            nome, _, freguesia, municipio = (indice.texto(int(t)) for t in indice.art_textos[j])
+            lat, lng = (round(float(v), 6) for v in indice.art_coords[j])
+            return {
+                "status": "OK",
+                "coordenadas": {"lat": lat, "lng": lng},
+                "postal_code_encontrado": cep,
+                "endereco_formatado": f"{nome} {numero}, {cep}" if numero else f"{nome}, {cep}",
+                "route_encontrada": nome,
+                "sublocality": freguesia,
+                "locality": municipio,
+            }
+
+        lat, lng = (round(float(v), 6) for v in indice.centroides[pos])
+        freguesia, municipio = (indice.texto(int(t)) for t in indice.cep_local[pos])
+        return {
+            "status": "OK_CEP",
+            "coordenadas": {"lat": lat, "lng": lng},
+            "postal_code_encontrado": cep,
+            "endereco_formatado": f"{cep}",
+            "route_encontrada": rua,
+            "sublocality": freguesia,
+            "locality": municipio,
+        }
+    except Exception as e:
+        return {"status": "ERRO", "msg": str(e)}
+
+
+def obter_endereco_por_coordenadas_offline(lat, lng):
+    """
+    Busca reversa offline: artéria mais próxima (até CP_REVERSO_RAIO_MAX_M metros),
+    com o CEP, freguesia e município dessa artéria. Sem artéria próxima devolve
+    NOT_FOUND, para que a cascata passe aos provedores remotos.
+    """
+    try:
+        lat, lng = float(lat), float(lng)
+        indice = get_indice()
+        if indice is None:
+            return {"status": "NOT_FOUND", "msg": "Índice offline de códigos postais indisponível"}
+        encontrado = indice.arteria_mais_proxima(lat, lng, REVERSO_RAIO_MAX_M)
+        if encontrado is None:
+            return {"status": "NOT_FOUND", "msg": "Nenhuma artéria próxima no índice offline"}
+
+        j, _ = encontrado
+        nome, _, freguesia, municipio = (indice.texto(int(t)) for t in indice.art_textos[j])
+        cep = formata_cep(int(indice.ceps[indice.cep_da_arteria(j)]))
+        return {
+            "status": "OK",
+            "address": ", ".join(p for p in (nome, f"{cep} {municipio}".strip()) if p),
+            "postal_code": cep,
+            "route_encontrada": nome,
+            "sublocality": freguesia,
+            "locality": municipio,
+            "coordenadas": {"lat": lat, "lng": lng},
+        }
+    except Exception as e:
+        return {"status": "ERRO", "msg": str(e)}
+
+
+# ========================
+# Construção do índice
+# ========================
+
+class _TabelaTextos:
+    """Tabela de textos deduplicados, serializada como um único blob UTF-8."""
+
+    def __init__(self):
+        self.indices = {}
+        self.blobs = []
+
+    def add(self, texto):
+        texto = texto or ""
+        i = self.indices.get(texto)
+        if i is None:
+            i = self.indices[texto] = len(self.blobs)
+            self.blobs.append(texto.encode("utf-8"))
+        return i
+
+    def arrays(self):
+        inicio = np.zeros(len(self.blobs) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in self.blobs], out=inicio[1:])
+        return np.frombuffer(b"".join(self.blobs), dtype=np.uint8), inicio
+
+
+def _le_linhas(origem):
+    with open(origem, newline="", encoding="utf-8-sig") as f:
+        amostra = f.read(4096)
+        f.seek(0)
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+        for linha in csv.DictReader(f, dialect=dialeto):
+            cep = linha.get("cp") or f"{linha.get('cp4', '')}-{linha.get('cp3', '')}"
+            chave = chave_cep(cep)
+            try:
+                lat, lng = float(linha["latitude"]), float(linha["longitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if chave is not None:
+                yield chave, linha, lat, lng
+
+
+def construir_indice(origem, destino):
+    """Constrói o índice em `destino` a partir do CSV `origem`. Devolve o número de CEPs."""
+    textos = _TabelaTextos()
+    textos.add("")
+    ceps = {}
+    for chave, linha, lat, lng in _le_linhas(origem):
+        entrada = ceps.setdefault(chave, {"centroide": None, "local": None, "arterias": {}})
+        freguesia = (linha.get("freguesia") or "").strip()
+        municipio = (linha.get("municipio") or "").strip()
+        arteria = (linha.get("arteria") or "").strip()
+        if not arteria:
+            entrada["centroide"] = (lat, lng)
+            entrada["local"] = (freguesia, municipio)
+            continue
+        entrada["arterias"].setdefault(normaliza_nome(arteria), (arteria, lat, lng, freguesia, municipio))
+        if entrada["local"] is None:
+            entrada["local"] = (freguesia, municipio)
+
+    chaves = sorted(ceps)
+    n = len(chaves)
+    centroides = np.zeros((n, 2), dtype=np.float32)
+    cep_local = np.zeros((n, 2), dtype=np.int32)
+    art_inicio = np.zeros(n + 1, dtype=np.int32)
+    art_coords, art_textos = [], []
+    for i, chave in enumerate(chaves):
+        entrada = ceps[chave]
+        arterias = list(entrada["arterias"].items())
+        if entrada["centroide"] is None:
+            entrada["centroide"] = (
+                sum(a[1] for _, a in arterias) / len(arterias),
+                sum(a[2] for _, a in arterias) / len(arterias),
+            )
+        centroides[i] = entrada["centroide"]
+        cep_local[i] = [textos.add(t) for t in (entrada["local"] or ("", ""))]
+        for nome_norm, (nome, lat, lng, freguesia, municipio) in arterias:
+            art_coords.append((lat, lng))
+            art_textos.append((textos.add(nome), textos.add(nome_norm), textos.add(freguesia), textos.add(municipio)))
+        art_inicio[i + 1] = len(art_coords)
+
+    blob, textos_inicio = textos.arrays()
+    os.makedirs(destino, exist_ok=True)
+    arrays = {
+        "ceps": np.asarray(chaves, dtype=np.int32),
+        "centroides": centroides,
+        "cep_local": cep_local,
+        "art_inicio": art_inicio,
+        "art_coords": np.asarray(art_coords, dtype=np.float32).reshape(-1, 2),
+        "art_textos": np.asarray(art_textos, dtype=np.int32).reshape(-1, 4),
+        "textos": blob,
+        "textos_inicio": textos_inicio,
+    }
+    arrays.update(constroi_grelha(arrays["art_coords"]))
+    for nome, array in arrays.items():
+        np.save(os.path.join(destino, f"{nome}.npy"), array)
+    logger.info(f"Índice de códigos postais construído em {destino}: {n} CEPs, {len(art_coords)} artérias.")
+    return n
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "construir":
+        print("Uso: python -m app.utils.codigos_postais construir <origem.csv> <diretorio_destino>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    construir_indice(sys.argv[2], sys.argv[3])
@@ -1,9 +1,13 @@
 # app/utils/geoapi.py
 
-import requests
 import os
 import re
+import threading
+import time
 import unicodedata
+from collections import OrderedDict
+
+from . import limite_taxa, transport
 
 GEOAPI_KEY = os.environ.get("GEOAPI_KEY", "SUA_CHAVE_API_GEOAPI")
 BASE_URL = "https://json.geoapi.pt"
@@ -17,71 +21,180 @@ def normaliza_nome(s):
     s = re.sub(r'[^a-z0-9]', '', s.lower())
     return s
 
+# Cache em memória dos dados de cada CEP (/cp/{cep}), com nomes de artérias já normalizados.
+# Evita repetir o pedido HTTP e a normalização para paragens que partilham o mesmo CEP.
+CEP_CACHE_TTL = int(os.environ.get("GEOAPI_CEP_CACHE_TTL", 3600))
+CEP_CACHE_MAX = int(os.environ.get("GEOAPI_CEP_CACHE_MAX", 5000))
+
+_cache_ceps = OrderedDict()       # cep_limpo -> (expira, dados | None), do menos ao mais recente
+_cache_lock = threading.Lock()
+_locks_por_cep = {}               # cep_limpo -> [lock, utilizadores]: um único pedido em curso por CEP
+
+
+def extrai_rua_numero(endereco):
+    """Extrai rua e número da porta (heurística: rua número,[resto])."""
+    partes = [p.strip() for p in re.split(r',', endereco) if p.strip()]
+    rua = partes[0] if partes else endereco.strip()
+    numero = ""
+    if rua:
+        rua_parts = rua.split()
+        if rua_parts and rua_parts[-1].isdigit():
+            numero = rua_parts[-1]
+            rua = " ".join(rua_parts[:-1])
+    return rua, numero
+
+
+def limpa_cep(cep):
+    return str(cep or "").replace("-", "").replace(" ", "")
+
+
+def _indexa_cep(cep_data):
+    """
+    Pré-processa a resposta de /cp/{cep}:
+      - "exatas": nome normalizado -> artéria (busca O(1) quando o nome coincide);
+      - "arterias": lista ordenada (nome normalizado, artéria) para a busca por substring;
+      - "centroide": (lat, lng) ou None.
+    Só entram artérias com coordenadas válidas.
+    """
+    exatas, arterias = {}, []
+    for art in cep_data.get("arterias", []) or []:
+        coords = art.get("coordenadas", [None, None])
+        if not (coords and len(coords) >= 2 and coords[0] and coords[1]):
+            continue
+        nome_norm = normaliza_nome(art.get("arteria", ""))
+        arterias.append((nome_norm, art))
+        exatas.setdefault(nome_norm, art)
+
+    centroide = None
+    if cep_data.get("centroide"):
+        try:
+            centroide = tuple(map(float, str(cep_data["centroide"]).split(",")))
+        except ValueError:
+            centroide = None
+    return {"exatas": exatas, "arterias": arterias, "centroide": centroide}
+
+
+def _dados_cep(cep_limpo):
+    """
+    Devolve os dados indexados de um CEP (ou None se a GEOAPI não o conhece),
+    fazendo no máximo um pedido HTTP por CEP enquanto a entrada estiver válida.
+    Erros de rede propagam-se e não são guardados em cache. Acima de
+    GEOAPI_CEP_CACHE_MAX entradas sai o CEP usado há mais tempo (LRU).
+    """
+    with _cache_lock:
+        entrada = _cache_le(cep_limpo)
+        if entrada is not None:
+            return entrada[1]
+        # O lock de um CEP só é descartado quando nenhum thread o tem ou espera por ele
+        par = _locks_por_cep.setdefault(cep_limpo, [threading.Lock(), 0])
+        par[1] += 1
+    try:
+        with par[0]:
+            # Outro thread pode ter carregado o CEP enquanto esperávamos
+            with _cache_lock:
+                entrada = _cache_le(cep_limpo)
+            if entrada is not None:
+                return entrada[1]
+
+            url_cep = f"{BASE_URL}/cp/{cep_limpo}?key={GEOAPI_KEY}"
+            resp = transport.get("geoapi", url_cep)
+            if resp.ok:
+                dados = _indexa_cep(resp.json())
+            elif resp.status_code == 404:
+                dados = None
+            else:
+                resp.raise_for_status()
+
+            with _cache_lock:
+                _cache_ceps[cep_limpo] = (time.monotonic() + CEP_CACHE_TTL, dados)
+                _cache_ceps.move_to_end(cep_limpo)
+                while len(_cache_ceps) > CEP_CACHE_MAX:
+                    antigo, _ = _cache_ceps.popitem(last=False)
+                    if _locks_por_cep.get(antigo, (None, 1))[1] == 0:
+                        del _locks_por_cep[antigo]
+            return dados
+    finally:
+        with _cache_lock:
+            par[1] -= 1
+            if par[1] == 0 and cep_limpo not in _cache_ceps:
+                _locks_por_cep.pop(cep_limpo, None)
+
+
+def _cache_le(cep_limpo):
+    """Entrada válida do CEP, marcada como a mais recente; None se ausente ou expirada. Com `_cache_lock`."""
+    entrada = _cache_ceps.get(cep_limpo)
+    if entrada is None or entrada[0] <= time.monotonic():
+        return None
+    _cache_ceps.move_to_end(cep_limpo)
+    return entrada
+
+
+def agrupa_por_cep(ceps):
+    """
+    Agrupa índices de uma lista de CEPs pelo CEP limpo, preservando a ordem.
+    Permite a chamadores em lote processar juntos os endereços de cada CEP,
+    de forma a que cada código postal custe um único pedido à GEOAPI.
+    """
+    grupos = {}
+    for i, cep in enumerate(ceps):
+        grupos.setdefault(limpa_cep(cep), []).append(i)
+    return grupos
+
+
+def _procura_arteria(dados, rua_norm):
+    art = dados["exatas"].get(rua_norm)
+    if art is not None:
+        return art
+    return next((art for nome_norm, art in dados["arterias"] if rua_norm in nome_norm), None)
+
+
 def valida_rua_geoapi(endereco, cep):
     """
     Busca:
       1. Rua (normalizada) DENTRO DAS RUAS DO CEP
       2. Se não achar, PIN no centroide do CEP
+    Os dados de cada CEP são obtidos uma única vez e reutilizados (ver `_dados_cep`).
     """
     try:
-        # Extrai rua, número (heurística: rua,número,[resto])
-        partes = [p.strip() for p in re.split(r',', endereco) if p.strip()]
-        rua = partes[0] if partes else endereco.strip()
-        numero = ""
-        if rua:
-            rua_parts = rua.split()
-            if rua_parts and rua_parts[-1].isdigit():
-                numero = rua_parts[-1]
-                rua = " ".join(rua_parts[:-1])
-        cep_limpo = cep.replace("-", "").replace(" ", "")
+        rua, numero = extrai_rua_numero(endereco)
+        cep_limpo = limpa_cep(cep)
         if not cep_limpo:
             return {"status": "NOT_FOUND", "msg": "Sem CEP para buscar na GeoAPI"}
 
-        # 1. Busca todas as ruas do CEP na GEOAPI
-        url_cep = f"{BASE_URL}/cp/{cep_limpo}?key={GEOAPI_KEY}"
-        resp = requests.get(url_cep, timeout=6)
-        if resp.ok:
-            cep_data = resp.json()
-            # CEP pode ter 'arterias' (lista de ruas)
-            arterias = cep_data.get("arterias", [])
-            # Normaliza rua buscada
-            rua_norm = normaliza_nome(rua)
-            achou_rua = None
-            for art in arterias:
-                art_nome = art.get("arteria", "")
-                if rua_norm in normaliza_nome(art_nome):
-                    # Casa a rua!
-                    coords = art.get("coordenadas", [None, None])
-                    if coords and coords[0] and coords[1]:
-                        achou_rua = {
-                            "status": "OK",
-                            "coordenadas": {"lat": float(coords[0]), "lng": float(coords[1])},
-                            "postal_code_encontrado": cep,
-                            "endereco_formatado": f"{art_nome} {numero}, {cep}" if numero else f"{art_nome}, {cep}",
-                            "route_encontrada": art_nome,
-                            "sublocality": art.get("freguesia", ""),
-                            "locality": art.get("municipio", ""),
-                        }
-                        break
-            if achou_rua:
-                return achou_rua
-
-            # Se não achou, retorna centroide do CEP
-            centroide = cep_data.get("centroide")
-            if centroide:
-                lat, lng = map(float, centroide.split(","))
-                return {
-                    "status": "OK_CEP",
-                    "coordenadas": {"lat": lat, "lng": lng},
-                    "postal_code_encontrado": cep,
-                    "endereco_formatado": f"{cep}",
-                    "route_encontrada": rua,
-                    "sublocality": "",
-                    "locality": "",
-                }
-            return {"status": "NOT_FOUND", "msg": f"Não foi possível localizar centroide para o CEP {cep}"}
-
-        return {"status": "NOT_FOUND", "msg": f"CEP {cep} não encontrado na GEOAPI"}
+        # 1. Ruas do CEP na GEOAPI (em cache, já normalizadas)
+        dados = _dados_cep(cep_limpo)
+        if dados is None:
+            return {"status": "NOT_FOUND", "msg": f"CEP {cep} não encontrado na GEOAPI"}
+
+        art = _procura_arteria(dados, normaliza_nome(rua))
+        if art is not None:
+            art_nome = art.get("arteria", "")
+            coords = art["coordenadas"]
+            return {
+                "status": "OK",
+                "coordenadas": {"lat": float(coords[0]), "lng": float(coords[1])},
+                "postal_code_encontrado": cep,
+                "endereco_formatado": f"{art_nome} {numero}, {cep}" if numero else f"{art_nome}, {cep}",
+                "route_encontrada": art_nome,
+                "sublocality": art.get("freguesia", ""),
+                "locality": art.get("municipio", ""),
+            }
+
+        # 2. Se não achou, retorna centroide do CEP
+        if dados["centroide"]:
+            lat, lng = dados["centroide"]
+            return {
+                "status": "OK_CEP",
+                "coordenadas": {"lat": lat, "lng": lng},
+                "postal_code_encontrado": cep,
+                "endereco_formatado": f"{cep}",
+                "route_encontrada": rua,
+                "sublocality": "",
+                "locality": "",
+            }
+        return {"status": "NOT_FOUND", "msg": f"Não foi possível localizar centroide para o CEP {cep}"}
+    except limite_taxa.LimiteExcedido as e:
+        return {"status": "RATE_LIMITED", "msg": str(e)}
     except Exception as e:
         return {"status": "ERRO", "msg": str(e)}
 
@@ -89,7 +202,7 @@ def obter_endereco_por_coordenadas_geoapi(lat, lng):
     try:
         url = f"{BASE_URL}/gps/{lat},{lng}"
         params = {"key": GEOAPI_KEY}
-        resp = requests.get(url, params=params, timeout=5)
+        resp = transport.get("geoapi", url, params=params)
         resp.raise_for_status()
         d = resp.json()
         if isinstance(d, dict) and d.get("cp4"):
@@ -104,5 +217,7 @@ def obter_endereco_por_coordenadas_geoapi(lat, lng):
             }
         else:
             return {"status": "NOT_FOUND"}
+    except limite_taxa.LimiteExcedido as e:
+        return {"status": "RATE_LIMITED", "msg": str(e)}
     except Exception as e:
         return {"status": "ERRO", "msg": str(e)}
@@ -5,6 +5,17 @@ Decide qual serviço de geocodificação usar, implementando lógica de cascata.
 """
 
 import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable
+from . import cache
+from . import metricas
+from . import saude_provedores
+from .rastreio import Span
+from . import codigos_postais  # Índice local, sem rede - primeira tentativa
 from . import geoapi   # Para Portugal - preferencial
 from . import mapbox   # Fallback 1
 from . import google   # Fallback 2
@@ -13,69 +24,303 @@ logger = logging.getLogger(__name__)
 
 # Ordem de prioridade dos provedores para busca direta e reversa
 GEOCODER_PRIORITY = [
+    codigos_postais.valida_rua_offline,
     geoapi.valida_rua_geoapi,
     mapbox.valida_rua_mapbox,
     google.valida_rua_google,
 ]
 
 REVERSE_GEOCODER_PRIORITY = [
+    codigos_postais.obter_endereco_por_coordenadas_offline,
     geoapi.obter_endereco_por_coordenadas_geoapi,
     mapbox.obter_endereco_por_coordenadas,
     google.obter_endereco_por_coordenadas,
 ]
 
+# Provedores que dependem de configuração (chave de API): sem ela ficam fora das cascatas
+_CONFIGURADO = {
+    google.valida_rua_google: google.configurado,
+    google.obter_endereco_por_coordenadas: google.configurado,
+}
+
+# Limites de concorrência para a geocodificação em lote.
+# GEOCODER_BATCH_WORKERS: endereços processados em simultâneo por lote.
+# GEOCODER_PROVIDER_CONCURRENCY: chamadas simultâneas máximas a cada provedor
+# (pode ser ajustado por provedor, ex.: GEOCODER_CONCURRENCY_GOOGLE=4).
+BATCH_MAX_WORKERS = int(os.environ.get("GEOCODER_BATCH_WORKERS", "16"))
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get("GEOCODER_PROVIDER_CONCURRENCY", "8"))
+
+# Modo "hedged" (opcional): se o provedor preferido não responder em GEOCODER_HEDGE_MS
+# milissegundos, o provedor seguinte arranca em paralelo. 0 mantém a cascata sequencial.
+HEDGE_DELAY_MS = int(os.environ.get("GEOCODER_HEDGE_MS", "0"))
+HEDGE_MAX_WORKERS = int(os.environ.get("GEOCODER_HEDGE_WORKERS", "32"))
+
+_semaforos_provedores = {}
+_semaforos_lock = threading.Lock()
+_executor_hedge = None
+_executor_hedge_pid = None
+
+def _semaforo_provedor(provider_name: str) -> threading.BoundedSemaphore:
+    """Devolve o semáforo que limita as chamadas simultâneas a um provedor."""
+    semaforo = _semaforos_provedores.get(provider_name)
+    if semaforo is None:
+        with _semaforos_lock:
+            semaforo = _semaforos_provedores.get(provider_name)
+            if semaforo is None:
+                limite = int(os.environ.get(
+                    f"GEOCODER_CONCURRENCY_{provider_name.upper()}", PROVIDER_MAX_CONCURRENCY
+                ))
+                semaforo = threading.BoundedSemaphore(max(1, limite))
+                _semaforos_provedores[provider_name] = semaforo
+    return semaforo
+
+def _provedores(funcoes: list, reverso: bool = False) -> list:
+    """Provedores da cascata pela ordem de `saude_provedores.ordenar`, sem os não configurados."""
+    return [func for func in saude_provedores.ordenar(funcoes, reverso=reverso)
+            if _CONFIGURADO.get(func, lambda: True)()]
+
 def valida_rua(endereco: str, cep: str) -> dict:
     """
     Tenta validar um endereço usando provedores em cascata (GeoAPI, Mapbox, Google).
     Retorna o primeiro resultado com status "OK" ou variantes ("OK_CEP", "OK_FREGUESIA", etc).
+    Resultados bem-sucedidos ficam no cache persistente, partilhado entre workers.
+    Cada chamada emite um único span de log com o tempo e o desfecho de cada provedor.
+    """
+    span = Span("geocodificacao", f"{endereco}, {cep}")
+    chave = cache.chave_endereco(endereco, cep)
+    resultado = cache.obter(chave)
+    if resultado is not None:
+        span.fim(resultado, origem="cache")
+        return resultado
+    resultado, vencedor = _valida_rua_cascata(endereco, cep, span)
+    if str(resultado.get("status", "")).startswith("OK"):
+        cache.guardar(chave, resultado)
+    span.fim(resultado, vencedor=vencedor)
+    return resultado
+
+def _valida_rua_cascata(endereco: str, cep: str, span: Span = None) -> tuple:
+    """
+    Executa a cascata de provedores para busca direta, sem passar pelo cache.
+    Devolve (resultado, nome do provedor que respondeu ou None).
     """
-    logger.info(f"Iniciando validação em cascata para: '{endereco}, {cep}'")
+    if HEDGE_DELAY_MS > 0 and len(GEOCODER_PRIORITY) > 1:
+        return _valida_rua_hedged(endereco, cep, span)
     erros = []
-    for geocode_func in GEOCODER_PRIORITY:
+    for geocode_func in _provedores(GEOCODER_PRIORITY):
         provider_name = geocode_func.__module__.split('.')[-1]
-        logger.info(f"Tentando com o provedor: {provider_name}...")
+        if not saude_provedores.disponivel(provider_name):
+            if span is not None:
+                span.ignorado(provider_name)
+            erros.append({provider_name: {"status": "CIRCUIT_OPEN"}})
+            continue
         try:
-            resultado = geocode_func(endereco, cep)
+            resultado = _chama_provedor(geocode_func, endereco, cep, span=span)
             if resultado and str(resultado.get("status", "")).startswith("OK"):
-                logger.info(f"Endereço validado com sucesso via {provider_name}.")
-                return resultado
-            else:
-                logger.warning(f"Provedor {provider_name} falhou ou não encontrou o endereço (Status: {resultado.get('status')}).")
-                erros.append({provider_name: resultado})
+                return resultado, provider_name
+            erros.append({provider_name: resultado})
         except Exception as e:
-            logger.error(f"Erro inesperado ao usar o provedor {provider_name}: {e}", exc_info=True)
+            logger.error("Erro inesperado ao usar o provedor %s: %s", provider_name, e, exc_info=True)
             erros.append({provider_name: str(e)})
-    logger.error(f"Todos os provedores falharam para o endereço: '{endereco}, {cep}'. Retornando falha.")
     return {
         "status": "ALL_PROVIDERS_FAILED",
         "coordenadas": {"lat": 0.0, "lng": 0.0},
         "erros": erros
-    }
+    }, None
+
+def _get_executor_hedge() -> ThreadPoolExecutor:
+    """Pool partilhado pelas chamadas especulativas (recriado após fork do worker)."""
+    global _executor_hedge, _executor_hedge_pid
+    if _executor_hedge is None or _executor_hedge_pid != os.getpid():
+        with _semaforos_lock:
+            if _executor_hedge is None or _executor_hedge_pid != os.getpid():
+                _executor_hedge = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="geocoder-hedge")
+                _executor_hedge_pid = os.getpid()
+    return _executor_hedge
+
+def _chama_provedor(geocode_func, *args, reverso: bool = False, span: Span = None) -> dict:
+    """Chama um provedor respeitando o seu limite de concorrência e regista latência e desfecho."""
+    provider_name = geocode_func.__module__.split('.')[-1]
+    with _semaforo_provedor(provider_name):
+        inicio = time.monotonic()
+        try:
+            resultado = geocode_func(*args)
+        except Exception as e:
+            duracao = time.monotonic() - inicio
+            saude_provedores.registar(provider_name, e, duracao, reverso=reverso)
+            metricas.provedor(provider_name, e, duracao, reverso=reverso)
+            if span is not None:
+                span.provedor(provider_name, e, duracao)
+            raise
+    duracao = time.monotonic() - inicio
+    saude_provedores.registar(provider_name, resultado, duracao, reverso=reverso)
+    metricas.provedor(provider_name, resultado, duracao, reverso=reverso)
+    if span is not None:
+        span.provedor(provider_name, resultado, duracao)
+    return resultado
+
+def _valida_rua_hedged(endereco: str, cep: str, span: Span = None) -> tuple:
+    """
+    Cascata especulativa: o provedor seguinte arranca sempre que os que estão em curso
+    excedem o orçamento de latência (GEOCODER_HEDGE_MS) ou quando todos já falharam.
+    O vencedor é o mesmo da cascata sequencial: recebida uma resposta "OK", ainda se
+    esperam os provedores de maior prioridade em curso; os restantes são cancelados
+    (ou ignorados, se já estiverem a correr).
+    """
+    executor = _get_executor_hedge()
+    orcamento = HEDGE_DELAY_MS / 1000.0
+    provedores = [func for func in _provedores(GEOCODER_PRIORITY)
+                  if saude_provedores.disponivel(func.__module__.split('.')[-1])]
+    if not provedores:
+        return {"status": "ALL_PROVIDERS_FAILED", "coordenadas": {"lat": 0.0, "lng": 0.0},
+                "erros": [{"disjuntores": "CIRCUIT_OPEN"}]}, None
+    nomes = [func.__module__.split('.')[-1] for func in provedores]
+    futuros = {}       # future -> índice na prioridade
+    respostas = {}     # índice -> resultado (dict) ou mensagem de erro (str)
+    melhor = None      # menor índice com resposta "OK"
+
+    def arranca_proximo():
+        i = len(futuros)
+        futuros[executor.submit(_chama_provedor, provedores[i], endereco, cep, span=span)] = i
+
+    arranca_proximo()
+    inicio_ultimo = time.monotonic()
+    while True:
+        pendentes = [f for f in futuros if not f.done()]
+        # Recolhe todas as chamadas terminadas antes de decidir, incluindo as que acabaram
+        # depois de `wait` voltar ou antes da primeira espera
+        for futuro, i in futuros.items():
+            if i in respostas or futuro in pendentes:
+                continue
+            try:
+                respostas[i] = futuro.result()
+            except Exception as e:
+                logger.error("Erro inesperado ao usar o provedor %s: %s", nomes[i], e, exc_info=True)
+                respostas[i] = str(e)
+            if isinstance(respostas[i], dict) and str(respostas[i].get("status", "")).startswith("OK"):
+                melhor = i if melhor is None else min(melhor, i)
+
+        if melhor is not None:
+            # Já há um "OK": só falta saber se um provedor de maior prioridade também acerta
+            pendentes = [f for f in pendentes if futuros[f] < melhor]
+            if not pendentes:
+                for futuro in futuros:
+                    futuro.cancel()
+                return respostas[melhor], nomes[melhor]
+            wait(pendentes, return_when=FIRST_COMPLETED)
+            continue
+        if not pendentes and len(futuros) == len(provedores):
+            break
+        if not pendentes or (len(futuros) < len(provedores) and time.monotonic() - inicio_ultimo >= orcamento):
+            arranca_proximo()
+            inicio_ultimo = time.monotonic()
+            continue
+        espera = None
+        if len(futuros) < len(provedores):
+            espera = max(0.0, orcamento - (time.monotonic() - inicio_ultimo))
+        wait(pendentes, timeout=espera, return_when=FIRST_COMPLETED)
+
+    erros = [{nomes[i]: respostas[i]} for i in sorted(respostas)]
+    return {
+        "status": "ALL_PROVIDERS_FAILED",
+        "coordenadas": {"lat": 0.0, "lng": 0.0},
+        "erros": erros
+    }, None
+
+def valida_ruas_em_lote(enderecos: list, ceps: list, max_workers: int = None,
+                        ao_concluir: Callable = None) -> list:
+    """
+    Valida vários endereços em paralelo usando a mesma cascata de `valida_rua`.
+    Pares (endereço, CEP) repetidos são geocodificados apenas uma vez.
+    Os resultados são devolvidos na mesma ordem das listas de entrada.
+    `ao_concluir(posicoes, resultado)` é chamado (de qualquer thread) à medida que cada
+    par único termina, com as posições de entrada que partilham esse par.
+    """
+    pares = list(zip(enderecos, ceps))
+    if not pares:
+        return []
+
+    # Pares agrupados por CEP: os endereços de um mesmo código postal são processados
+    # lado a lado e partilham um único pedido /cp/{cep} à GEOAPI
+    unicos = list(dict.fromkeys(pares))
+    unicos = [unicos[i] for grupo in geoapi.agrupa_por_cep([cep for _, cep in unicos]).values() for i in grupo]
+    workers = max(1, min(max_workers or BATCH_MAX_WORKERS, len(unicos)))
+    logger.info("Geocodificação em lote: %d endereços (%d únicos), %d em paralelo.", len(pares), len(unicos), workers)
+
+    posicoes = defaultdict(list)
+    if ao_concluir is not None:
+        for i, par in enumerate(pares):
+            posicoes[par].append(i)
+
+    def processa(par):
+        resultado = _valida_rua_protegido(*par)
+        if ao_concluir is not None:
+            ao_concluir(posicoes[par], resultado)
+        return resultado
+
+    if workers == 1:
+        resultados = [processa(par) for par in unicos]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocoder") as executor:
+            resultados = list(executor.map(processa, unicos))
+
+    por_par = dict(zip(unicos, resultados))
+    return [por_par[par] for par in pares]
+
+def _valida_rua_protegido(endereco: str, cep: str) -> dict:
+    """Executa `valida_rua` garantindo que uma falha isolada não interrompe o lote."""
+    try:
+        return valida_rua(endereco, cep)
+    except Exception as e:
+        logger.error("Erro inesperado na validação em lote de '%s, %s': %s", endereco, cep, e, exc_info=True)
+        return {
+            "status": "ALL_PROVIDERS_FAILED",
+            "coordenadas": {"lat": 0.0, "lng": 0.0},
+            "erros": [str(e)]
+        }
 
 def obter_endereco_por_coordenadas(lat: float, lng: float) -> dict:
     """
     Tenta obter um endereço a partir de coordenadas usando provedores em cascata.
     Retorna o primeiro resultado com status "OK" ou variante.
+    Resultados bem-sucedidos ficam no cache persistente (chave: coordenadas arredondadas).
+    """
+    span = Span("geocodificacao_reversa", f"{lat},{lng}")
+    chave = cache.chave_coordenadas(lat, lng)
+    resultado = cache.obter(chave)
+    if resultado is not None:
+        # As coordenadas devolvidas são sempre as pedidas, não as da entrada em cache
+        resultado["coordenadas"] = {"lat": float(lat), "lng": float(lng)}
+        span.fim(resultado, origem="cache")
+        return resultado
+    resultado, vencedor = _obter_endereco_cascata(lat, lng, span)
+    if str(resultado.get("status", "")).startswith("OK"):
+        cache.guardar(chave, resultado, ttl=cache.GEOCACHE_TTL_REVERSO)
+    span.fim(resultado, vencedor=vencedor)
+    return resultado
+
+def _obter_endereco_cascata(lat: float, lng: float, span: Span = None) -> tuple:
+    """
+    Executa a cascata de provedores para busca reversa, sem passar pelo cache.
+    Devolve (resultado, nome do provedor que respondeu ou None).
     """
-    logger.info(f"Iniciando geocodificação reversa em cascata para: lat={lat}, lng={lng}")
     erros = []
-    for reverse_geocode_func in REVERSE_GEOCODER_PRIORITY:
+    for reverse_geocode_func in _provedores(REVERSE_GEOCODER_PRIORITY, reverso=True):
         provider_name = reverse_geocode_func.__module__.split('.')[-1]
-        logger.info(f"Tentando geocodificação reversa com o provedor: {provider_name}...")
+        if not saude_provedores.disponivel(provider_name):
+            if span is not None:
+                span.ignorado(provider_name)
+            erros.append({provider_name: {"status": "CIRCUIT_OPEN"}})
+            continue
         try:
-            resultado = reverse_geocode_func(lat, lng)
+            resultado = _chama_provedor(reverse_geocode_func, lat, lng, reverso=True, span=span)
             if resultado and str(resultado.get("status", "")).startswith("OK"):
-                logger.info(f"Endereço reverso encontrado com sucesso via {provider_name}.")
-                return resultado
-            else:
-                logger.warning(f"Provedor {provider_name} falhou na busca reversa (Status: {resultado.get('status')}).")
-                erros.append({provider_name: resultado})
+                return resultado, provider_name
+            erros.append({provider_name: resultado})
         except Exception as e:
-            logger.error(f"Erro inesperado na busca reversa com o provedor {provider_name}: {e}", exc_info=True)
+            logger.error("Erro inesperado na busca reversa com o provedor %s: %s", provider_name, e, exc_info=True)
             erros.append({provider_name: str(e)})
-    logger.error(f"Todos os provedores falharam na busca reversa para: lat={lat}, lng={lng}.")
     return {
         "status": "ALL_PROVIDERS_FAILED",
         "address": "Não foi possível encontrar o endereço.",
         "erros": erros
-    }
+    }, None
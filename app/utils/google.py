@@ -6,16 +6,61 @@ Oferece funções para validação e geolocalização de endereços, e geocodifi
 
 import requests
 import os
-from functools import lru_cache
+from functools import lru_cache, wraps
 import logging
 
+from . import limite_taxa, transport
+
 logger = logging.getLogger(__name__)
 
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+# Respostas que dependem do momento (quota) e não devem ficar no lru_cache
+STATUS_TRANSITORIOS = {"OVER_QUERY_LIMIT", "RATE_LIMITED"}
+
 class GoogleAPIError(Exception):
     """Exceção personalizada para erros da API do Google."""
     pass
 
-@lru_cache(maxsize=1000)
+class _Transitorio(Exception):
+    def __init__(self, resultado: dict):
+        self.resultado = resultado
+
+def _lru_cache_definitivo(maxsize: int):
+    """`lru_cache` que devolve, mas não guarda, as respostas de STATUS_TRANSITORIOS."""
+    def decorador(funcao):
+        @lru_cache(maxsize=maxsize)
+        def guardada(*args):
+            resultado = funcao(*args)
+            if resultado.get("status") in STATUS_TRANSITORIOS:
+                raise _Transitorio(resultado)  # exceções não entram no lru_cache
+            return resultado
+
+        @wraps(funcao)
+        def chamada(*args):
+            try:
+                return guardada(*args)
+            except _Transitorio as e:
+                return e.resultado
+        chamada.cache_info, chamada.cache_clear = guardada.cache_info, guardada.cache_clear
+        return chamada
+    return decorador
+
+def _consulta(params: dict) -> dict:
+    """
+    GET à Geocoding API. Um OVER_QUERY_LIMIT adia os pedidos seguintes de todos os
+    workers (`limite_taxa.penalizar`) e o pedido é repetido uma vez, na sua vez da fila.
+    """
+    data = transport.get("google", GEOCODE_URL, params=params).json()
+    if data.get("status") == "OVER_QUERY_LIMIT":
+        limite_taxa.penalizar("google")
+        data = transport.get("google", GEOCODE_URL, params=params).json()
+    return data
+
+def configurado() -> bool:
+    """Sem GOOGLE_API_KEY o Google fica fora das cascatas do geocoder."""
+    return bool(os.environ.get("GOOGLE_API_KEY"))
+
+@_lru_cache_definitivo(maxsize=1000)
 def valida_rua_google(endereco: str, cep: str) -> dict:
     """
     Valida e geocodifica um endereço consultando a API do Google Maps.
@@ -42,7 +87,6 @@ def valida_rua_google(endereco: str, cep: str) -> dict:
         return {"status": "API_KEY_MISSING", "msg": "Google API Key não definida."}
 
     full_address = f"{endereco}, {cep}".strip(", ")
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
     params = {
         "address": full_address,
         "key": chave,
@@ -50,8 +94,7 @@ def valida_rua_google(endereco: str, cep: str) -> dict:
     }
 
     try:
-        response = requests.get(url, params=params, timeout=(3, 7))
-        data = response.json()
+        data = _consulta(params)
 
         if data.get("status") != "OK" or not data.get("results"):
             return {
@@ -92,6 +135,9 @@ def valida_rua_google(endereco: str, cep: str) -> dict:
             "locality": locality
         }
 
+    except limite_taxa.LimiteExcedido as e:
+        logger.warning(str(e))
+        return {"status": "RATE_LIMITED", "msg": str(e)}
     except requests.Timeout:
         logger.warning("Timeout na consulta à API do Google Maps.")
         return {"status": "TIMEOUT", "msg": "Tempo de resposta excedido na API Google."}
@@ -99,7 +145,7 @@ def valida_rua_google(endereco: str, cep: str) -> dict:
         logger.exception("Erro inesperado na consulta à API do Google Maps.")
         return {"status": "ERROR", "msg": str(e)}
 
-@lru_cache(maxsize=1000)
+@_lru_cache_definitivo(maxsize=1000)
 def obter_endereco_por_coordenadas(lat, lng) -> dict:
     """
     Faz geocodificação reversa: obtém endereço formatado a partir de coordenadas.
@@ -124,7 +170,6 @@ def obter_endereco_por_coordenadas(lat, lng) -> dict:
         logger.warning("Google API Key não encontrada nas variáveis de ambiente")
         return {"status": "API_KEY_MISSING", "msg": "Google API Key não definida."}
 
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
     params = {
         "latlng": f"{lat},{lng}",
         "key": chave,
@@ -132,8 +177,7 @@ def obter_endereco_por_coordenadas(lat, lng) -> dict:
     }
 
     try:
-        response = requests.get(url, params=params, timeout=(3, 7))
-        data = response.json()
+        data = _consulta(params)
 
         if data.get("status") != "OK" or not data.get("results"):
             return {
@@ -170,6 +214,9 @@ def obter_endereco_por_coordenadas(lat, lng) -> dict:
             "coordenadas": {"lat": float(lat), "lng": float(lng)}
         }
 
+    except limite_taxa.LimiteExcedido as e:
+        logger.warning(str(e))
+        return {"status": "RATE_LIMITED", "msg": str(e)}
     except requests.Timeout:
         logger.warning("Timeout na consulta reversa à API do Google Maps.")
         return {"status": "TIMEOUT", "msg": "Tempo de resposta excedido na API Google."}
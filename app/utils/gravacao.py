@@ -0,0 +1,128 @@
+# app/utils/gravacao.py
+"""
+Gravação e reprodução das respostas HTTP dos provedores de geocodificação.
+
+Fica por baixo de `transport.get`, por isso cobre a GeoAPI, o Mapbox e o Google
+sem alterar os módulos dos provedores. Modos (variável GRAVACAO_MODO):
+  - "" (padrão): desativado, todos os pedidos vão à rede;
+  - "gravar": os pedidos vão à rede e cada resposta é guardada em GRAVACAO_DIR;
+  - "reproduzir": as respostas vêm de GRAVACAO_DIR, sem rede. Um pedido sem gravação
+    falha como erro de ligação (ou vai à rede, com GRAVACAO_EM_FALTA=rede).
+
+Cada resposta fica num ficheiro JSON `<provedor>/<hash>.json`, em que o hash identifica
+o pedido (URL e parâmetros, sem chaves de API). As gravações não guardam segredos e
+podem ser partilhadas. Na reprodução, a latência é a gravada (GRAVACAO_LATENCIA=original)
+ou um valor fixo em milissegundos (ex.: GRAVACAO_LATENCIA=0 responde de imediato).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import timedelta
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+GRAVACAO_MODO = os.environ.get("GRAVACAO_MODO", "").lower()
+GRAVACAO_DIR = os.environ.get("GRAVACAO_DIR", os.path.join(os.getcwd(), "fixtures", "provedores"))
+GRAVACAO_LATENCIA = os.environ.get("GRAVACAO_LATENCIA", "original").lower()
+GRAVACAO_EM_FALTA = os.environ.get("GRAVACAO_EM_FALTA", "erro").lower()
+
+GRAVAR, REPRODUZIR = "gravar", "reproduzir"
+# Parâmetros com credenciais: nunca gravados nem usados na identificação do pedido
+PARAMETROS_SECRETOS = {"key", "access_token"}
+# Cabeçalhos da resposta que não fazem sentido reproduzir
+_CABECALHOS_IGNORADOS = {"set-cookie", "date", "connection", "transfer-encoding", "content-encoding", "content-length"}
+
+
+class GravacaoEmFalta(requests.ConnectionError):
+    """Pedido sem resposta gravada no modo de reprodução (tratado como falha de rede)."""
+
+
+def modo() -> str:
+    return GRAVACAO_MODO if GRAVACAO_MODO in (GRAVAR, REPRODUZIR) else ""
+
+
+def pedido_canonico(url: str, params: dict = None) -> tuple:
+    """(URL sem query, parâmetros ordenados) do pedido, sem credenciais."""
+    partes = urlsplit(url)
+    todos = parse_qsl(partes.query, keep_blank_values=True) + [
+        (str(k), str(v)) for k, v in (params or {}).items() if v is not None
+    ]
+    publicos = sorted((k, v) for k, v in todos if k not in PARAMETROS_SECRETOS)
+    return urlunsplit((partes.scheme, partes.netloc, partes.path, "", "")), publicos
+
+
+def _caminho(provider: str, url: str, params: dict) -> str:
+    base, publicos = pedido_canonico(url, params)
+    chave = hashlib.sha256(json.dumps([provider, base, publicos], ensure_ascii=False).encode("utf-8")).hexdigest()
+    return os.path.join(GRAVACAO_DIR, provider, f"{chave[:32]}.json")
+
+
+def gravar(provider: str, url: str, params: dict, resposta: requests.Response, duracao: float) -> None:
+    """Guarda a resposta (escrita atómica: vários workers podem gravar em simultâneo)."""
+    caminho = _caminho(provider, url, params)
+    base, publicos = pedido_canonico(url, params)
+    registo = {
+        "provider": provider,
+        "url": base,
+        "params": publicos,
+        "status": resposta.status_code,
+        "headers": {k: v for k, v in resposta.headers.items() if k.lower() not in _CABECALHOS_IGNORADOS},
+        "body": resposta.content.decode(resposta.encoding or "utf-8", errors="replace"),
+        "latencia": round(duracao, 4),
+        "gravado": time.time(),
+    }
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(registo, f, ensure_ascii=False, indent=1)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar a resposta de '{provider}' em {caminho}: {e}")
+
+
+def _latencia(gravada: float) -> float:
+    if GRAVACAO_LATENCIA == "original":
+        return gravada
+    try:
+        return max(0.0, float(GRAVACAO_LATENCIA) / 1000.0)
+    except ValueError:
+        return gravada
+
+
+def reproduzir(provider: str, url: str, params: dict) -> Optional[requests.Response]:
+    """
+    Resposta gravada para o pedido, após a latência configurada.
+    Devolve None se não houver gravação e GRAVACAO_EM_FALTA=rede; caso contrário levanta
+    `GravacaoEmFalta`, que os provedores tratam como qualquer falha de ligação.
+    """
+    caminho = _caminho(provider, url, params)
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            registo = json.load(f)
+    except FileNotFoundError:
+        if GRAVACAO_EM_FALTA == "rede":
+            return None
+        raise GravacaoEmFalta(f"Sem resposta gravada de '{provider}' para {pedido_canonico(url, params)}")
+
+    espera = _latencia(float(registo.get("latencia", 0)))
+    if espera > 0:
+        time.sleep(espera)
+    resposta = requests.Response()
+    resposta.status_code = int(registo["status"])
+    resposta.headers = CaseInsensitiveDict(registo.get("headers") or {})
+    resposta._content = registo.get("body", "").encode("utf-8")
+    resposta.encoding = "utf-8"
+    resposta.url = url
+    resposta.reason = "Gravado"
+    resposta.elapsed = timedelta(seconds=espera)
+    return resposta
@@ -3,9 +3,9 @@
 Módulo com funções auxiliares (helpers) utilizadas em toda a aplicação.
 Inclui normalização de texto, validação de dados, gestão de cores e constantes.
 """
+import math
 import unicodedata
 import re
-from typing import List, Dict, Any
 
 # Paleta de cores padronizada para os tipos de importação (usada nos mapas/frontends)
 CORES_IMPORTACAO = {
@@ -39,28 +39,21 @@ def normalizar(texto: str) -> str:
     # Espaços únicos e limpa bordas
     return re.sub(r'\s+', ' ', texto).strip()
 
-def registro_unico(lista: List[Dict[str, Any]], novo: Dict[str, Any]) -> bool:
-    """
-    Verifica se um novo registro é único na lista (por endereço, CEP e tipo).
-
-    Args:
-        lista (list): Lista de registros existentes.
-        novo (dict): Novo registro a verificar.
+# Abreviaturas comuns em moradas portuguesas, expandidas antes da comparação
+ABREVIATURAS_MORADA = {
+    "r": "rua", "av": "avenida", "avda": "avenida", "tv": "travessa", "trav": "travessa",
+    "pc": "praca", "pca": "praca", "lg": "largo", "al": "alameda", "est": "estrada",
+    "estr": "estrada", "calc": "calcada", "bc": "beco", "urb": "urbanizacao",
+    "qta": "quinta", "bto": "bairro", "dr": "doutor", "eng": "engenheiro",
+    "s": "sao", "sta": "santa", "sto": "santo",
+}
+PALAVRAS_IGNORADAS = {"de", "da", "do", "das", "dos", "e"}
 
-    Returns:
-        bool: True se for único, False se duplicado.
-    """
-    endereco_novo = normalizar(novo.get("address", ""))
-    cep_novo = normalizar(novo.get("cep", ""))
-    tipo_novo = novo.get("importacao_tipo", "")
-    for item in lista:
-        if (
-            normalizar(item.get("address", "")) == endereco_novo and
-            normalizar(item.get("cep", "")) == cep_novo and
-            item.get("importacao_tipo") == tipo_novo
-        ):
-            return False
-    return True
+def distancia_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distância aproximada em metros (equiretangular), suficiente para poucas dezenas de metros."""
+    dy = (lat2 - lat1) * 111_320.0
+    dx = (lng2 - lng1) * 111_320.0 * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, dy)
 
 def cor_por_tipo(tipo: str) -> str:
     """
@@ -0,0 +1,290 @@
+# app/utils/jobs.py
+"""
+Jobs de importação em segundo plano.
+O pedido HTTP apenas regista o job e devolve o seu id; o parsing e a geocodificação
+correm num pool de threads local ao worker, libertando-o para o tráfego interativo.
+O estado (progresso e resultado) fica num armazenamento partilhado, para que
+qualquer worker do gunicorn possa responder às consultas de progresso.
+
+Backends disponíveis (variável JOBS_BACKEND):
+  - "sqlite": ficheiro SQLite local (padrão), partilhado pelos workers da máquina;
+  - "redis": o cliente partilhado de `armazenamento.cliente_redis()`, criado a partir
+    de REDIS_URL (o mesmo das sessões quando SESSION_TYPE=redis).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .armazenamento import ConexoesSQLite, cliente_redis, para_json, texto
+
+logger = logging.getLogger(__name__)
+
+JOBS_BACKEND = os.environ.get("JOBS_BACKEND", "sqlite").lower()
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(os.getcwd(), "jobs.sqlite3"))
+JOBS_TTL = int(os.environ.get("JOBS_TTL", 24 * 3600))  # jobs e resultados expiram ao fim de 1 dia
+IMPORT_JOB_WORKERS = int(os.environ.get("IMPORT_JOB_WORKERS", "2"))
+# Intervalo mínimo entre gravações de progresso: a geocodificação conclui centenas de
+# endereços por segundo e não faz sentido gravar o estado a cada um
+JOBS_INTERVALO_PROGRESSO = float(os.environ.get("JOBS_INTERVALO_PROGRESSO", "0.5"))
+
+PENDENTE, A_PROCESSAR, CONCLUIDO, ERRO = "pendente", "a_processar", "concluido", "erro"
+PREFIXO = "jobs:v1:"
+
+
+class SQLiteBackend:
+    """Estado dos jobs num ficheiro SQLite (modo WAL), partilhado entre processos."""
+
+    def __init__(self, caminho: str):
+        self._conexao = ConexoesSQLite(caminho, esquema=(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, estado TEXT NOT NULL, resultado TEXT,"
+            " atualizado REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_atualizado ON jobs (atualizado);"
+            "CREATE TABLE IF NOT EXISTS jobs_itens ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, item TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_itens_job ON jobs_itens (job_id, seq);"
+        ))
+
+    def gravar_estado(self, job_id: str, estado: str) -> None:
+        self._conexao().execute(
+            "INSERT INTO jobs (id, estado, atualizado) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET estado = excluded.estado, atualizado = excluded.atualizado",
+            (job_id, estado, time.time())
+        )
+
+    def ler_estado(self, job_id: str) -> Optional[str]:
+        row = self._conexao().execute("SELECT estado FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def gravar_resultado(self, job_id: str, resultado: str) -> None:
+        self._conexao().execute("UPDATE jobs SET resultado = ? WHERE id = ?", (resultado, job_id))
+
+    def ler_resultado(self, job_id: str) -> Optional[str]:
+        row = self._conexao().execute("SELECT resultado FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def acrescentar_itens(self, job_id: str, itens: list) -> None:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT INTO jobs_itens (job_id, item) VALUES (?, ?)",
+                             [(job_id, item) for item in itens])
+
+    def ler_itens(self, job_id: str, desde: int) -> tuple:
+        rows = self._conexao().execute(
+            "SELECT seq, item FROM jobs_itens WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, desde)
+        ).fetchall()
+        return [item for _, item in rows], (rows[-1][0] if rows else desde)
+
+    def limpar(self) -> None:
+        conn = self._conexao()
+        limite = time.time() - JOBS_TTL
+        conn.execute("DELETE FROM jobs_itens WHERE job_id IN (SELECT id FROM jobs WHERE atualizado < ?)", (limite,))
+        conn.execute("DELETE FROM jobs WHERE atualizado < ?", (limite,))
+
+
+class RedisBackend:
+    """Estado dos jobs no Redis, com expiração nativa."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def gravar_estado(self, job_id: str, estado: str) -> None:
+        self.cliente.set(PREFIXO + job_id, estado, ex=JOBS_TTL)
+
+    def ler_estado(self, job_id: str) -> Optional[str]:
+        return texto(self.cliente.get(PREFIXO + job_id))
+
+    def gravar_resultado(self, job_id: str, resultado: str) -> None:
+        self.cliente.set(PREFIXO + job_id + ":resultado", resultado, ex=JOBS_TTL)
+
+    def ler_resultado(self, job_id: str) -> Optional[str]:
+        return texto(self.cliente.get(PREFIXO + job_id + ":resultado"))
+
+    def acrescentar_itens(self, job_id: str, itens: list) -> None:
+        chave = PREFIXO + job_id + ":itens"
+        pipe = self.cliente.pipeline(transaction=False)
+        pipe.rpush(chave, *itens)
+        pipe.expire(chave, JOBS_TTL)
+        pipe.execute()
+
+    def ler_itens(self, job_id: str, desde: int) -> tuple:
+        # Cursor = número de itens já lidos (posição na lista)
+        itens = [texto(i) for i in self.cliente.lrange(PREFIXO + job_id + ":itens", desde, -1)]
+        return itens, desde + len(itens)
+
+    def limpar(self) -> None:
+        pass  # as chaves expiram sozinhas
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_backend():
+    """Devolve o backend configurado, criado na primeira utilização."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if JOBS_BACKEND == "redis":
+                    cliente = cliente_redis()
+                    if cliente is None:
+                        raise RuntimeError("JOBS_BACKEND=redis mas nenhuma ligação Redis configurada")
+                    _backend = RedisBackend(cliente)
+                else:
+                    _backend = SQLiteBackend(JOBS_DB_PATH)
+                logger.info(f"Jobs de importação ativos (backend: {type(_backend).__name__}).")
+    return _backend
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool de execução dos jobs, recriado após um fork do processo."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=max(1, IMPORT_JOB_WORKERS), thread_name_prefix="importacao")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _grava(job_id: str, estado: dict) -> None:
+    estado["atualizado"] = time.time()
+    get_backend().gravar_estado(job_id, para_json(estado))
+
+
+def obter(job_id: str) -> Optional[dict]:
+    """Estado atual do job (estado, contadores, erro), ou None se não existir/expirou."""
+    valor = get_backend().ler_estado(job_id)
+    return json.loads(valor) if valor else None
+
+
+def obter_resultado(job_id: str):
+    """Resultado final de um job concluído, ou None."""
+    valor = get_backend().ler_resultado(job_id)
+    return json.loads(valor) if valor else None
+
+
+def ler_itens(job_id: str, desde: int = 0) -> tuple:
+    """
+    Itens parciais publicados pelo job depois do cursor `desde`.
+    Devolve (itens, cursor) — o cursor é passado na leitura seguinte.
+    """
+    itens, cursor = get_backend().ler_itens(job_id, desde)
+    return [json.loads(item) for item in itens], cursor
+
+
+class Progresso:
+    """
+    Contadores de progresso de um job. Pode ser atualizado a partir de várias threads
+    (ex.: o pool da geocodificação em lote); as gravações são agrupadas no tempo.
+    Os itens parciais recebidos em `geocodificado` são publicados junto com o progresso.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.linhas_lidas = 0
+        self.geocodificadas = 0
+        self.falhadas = 0
+        self.criado = time.time()
+        self._itens_pendentes = []
+        self._lock = threading.Lock()
+        # Uma gravação de cada vez, pela ordem dos instantâneos: um estado antigo nunca
+        # substitui um mais recente (nem os itens ficam fora de ordem)
+        self._gravacao_lock = threading.Lock()
+        self._ultima_gravacao = 0.0
+
+    def estado(self, estado: str, **extra) -> dict:
+        return {
+            "id": self.job_id, "estado": estado, "linhas_lidas": self.linhas_lidas,
+            "geocodificadas": self.geocodificadas, "falhadas": self.falhadas,
+            "criado": self.criado, **extra,
+        }
+
+    def lidas(self, quantidade: int) -> None:
+        """Regista linhas lidas do ficheiro (antes da geocodificação)."""
+        with self._lock:
+            self.linhas_lidas += quantidade
+        self._grava_se_necessario(forcar=True)
+
+    def geocodificado(self, itens: list, resultado: dict) -> None:
+        """Callback de `pipeline.geocodifica`: um endereço concluído e os itens que o usam."""
+        with self._lock:
+            if str(resultado.get("status", "")).startswith("OK"):
+                self.geocodificadas += len(itens)
+            else:
+                self.falhadas += len(itens)
+            self._itens_pendentes.extend(itens)
+        self._grava_se_necessario()
+
+    def descarregar(self) -> None:
+        """Publica de imediato o progresso e os itens ainda pendentes."""
+        self._grava_se_necessario(forcar=True)
+
+    def _grava_se_necessario(self, forcar: bool = False) -> None:
+        # Sem `forcar`, se outra thread já está a gravar, os itens ficam para a gravação seguinte
+        if not self._gravacao_lock.acquire(blocking=forcar):
+            return
+        try:
+            agora = time.monotonic()
+            with self._lock:
+                if not forcar and agora - self._ultima_gravacao < JOBS_INTERVALO_PROGRESSO:
+                    return
+                self._ultima_gravacao = agora
+                estado = self.estado(A_PROCESSAR)
+                itens, self._itens_pendentes = self._itens_pendentes, []
+            # Itens antes do estado: quem vê os contadores encontra os itens correspondentes
+            if itens:
+                get_backend().acrescentar_itens(self.job_id, [para_json(item) for item in itens])
+            _grava(self.job_id, estado)
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar o progresso do job {self.job_id}: {e}")
+        finally:
+            self._gravacao_lock.release()
+
+
+def submeter(funcao: Callable, *args, **kwargs) -> str:
+    """
+    Regista um novo job e agenda `funcao(progresso, *args, **kwargs)` no pool local.
+    O valor devolvido pela função (serializável em JSON) fica disponível em `obter_resultado`.
+    """
+    backend = get_backend()
+    try:
+        backend.limpar()
+    except Exception as e:
+        logger.warning(f"Falha ao limpar jobs antigos: {e}")
+    job_id = uuid.uuid4().hex
+    progresso = Progresso(job_id)
+    _grava(job_id, progresso.estado(PENDENTE))
+    _get_executor().submit(_executa, progresso, funcao, args, kwargs)
+    logger.info(f"Job {job_id} submetido ({funcao.__name__}).")
+    return job_id
+
+
+def _executa(progresso: Progresso, funcao: Callable, args: tuple, kwargs: dict) -> None:
+    job_id = progresso.job_id
+    inicio = time.monotonic()
+    try:
+        _grava(job_id, progresso.estado(A_PROCESSAR))
+        resultado = funcao(progresso, *args, **kwargs)
+        progresso.descarregar()
+        get_backend().gravar_resultado(job_id, para_json(resultado))
+        total = len(resultado) if hasattr(resultado, "__len__") else None
+        _grava(job_id, progresso.estado(CONCLUIDO, total=total, duracao=round(time.monotonic() - inicio, 2)))
+        logger.info(f"Job {job_id} concluído em {time.monotonic() - inicio:.1f}s.")
+    except Exception as e:
+        logger.error(f"Job {job_id} falhou: {e}", exc_info=True)
+        try:
+            _grava(job_id, progresso.estado(ERRO, erro=str(e)))
+        except Exception as e2:
+            logger.error(f"Não foi possível registar a falha do job {job_id}: {e2}")
@@ -0,0 +1,243 @@
+# app/utils/limite_taxa.py
+"""
+Limite de pedidos por segundo aos provedores de geocodificação (token bucket),
+partilhado por todos os workers do gunicorn.
+
+Cada pedido HTTP a um provedor reserva um token antes de sair (`aguardar`). Quando
+o balde está vazio, a reserva fica marcada para o instante em que haverá um token
+livre e o chamador dorme até lá: as reservas são atribuídas pela ordem de chegada,
+por isso os pedidos formam uma fila justa entre threads e workers. Se a espera
+ultrapassar LIMITE_TAXA_ESPERA_MAX segundos, a reserva é recusada com `LimiteExcedido`.
+
+Uma resposta 429 / OVER_QUERY_LIMIT do provedor (`penalizar`) adia todas as reservas
+desse provedor, em todos os workers, pelo tempo indicado em Retry-After.
+
+Backends disponíveis (variável LIMITE_TAXA_BACKEND):
+  - "arquivo": um ficheiro por provedor com `fcntl.flock` (padrão), partilhado pelos workers da máquina;
+  - "redis": o cliente partilhado de `armazenamento.cliente_redis()`, criado a partir
+    de REDIS_URL (o mesmo das sessões quando SESSION_TYPE=redis);
+  - "none": sem limite.
+
+Limites por provedor (pedidos por segundo e rajada máxima), ex.:
+  LIMITE_TAXA_GOOGLE_QPS=40, LIMITE_TAXA_GOOGLE_RAJADA=50, LIMITE_TAXA_MAPBOX_QPS=0 (sem limite)
+"""
+
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from .armazenamento import cliente_redis
+
+logger = logging.getLogger(__name__)
+
+LIMITE_TAXA_BACKEND = os.environ.get("LIMITE_TAXA_BACKEND", "arquivo").lower()
+LIMITE_TAXA_DIR = os.environ.get("LIMITE_TAXA_DIR", os.path.join(tempfile.gettempdir(), "limite_taxa"))
+LIMITE_TAXA_ESPERA_MAX = float(os.environ.get("LIMITE_TAXA_ESPERA_MAX", "10"))
+# Penalização usada quando o provedor responde 429 sem Retry-After
+LIMITE_TAXA_PENALIZACAO = float(os.environ.get("LIMITE_TAXA_PENALIZACAO", "1"))
+
+PROVIDERS = {
+    "geoapi": {"qps": 10, "rajada": 10},
+    "mapbox": {"qps": 10, "rajada": 20},   # 600 pedidos/minuto no plano base
+    "google": {"qps": 40, "rajada": 50},   # abaixo das 50 QPS da Geocoding API
+}
+PREFIXO = "limite:v1:"
+_FORMATO = struct.Struct("dd")  # tokens disponíveis, instante da última atualização
+
+
+class LimiteExcedido(Exception):
+    """A fila de espera do provedor excede LIMITE_TAXA_ESPERA_MAX."""
+
+    def __init__(self, provider: str, espera: float):
+        super().__init__(f"Limite de pedidos de '{provider}' atingido (espera estimada {espera:.1f}s).")
+        self.provider = provider
+        self.espera = espera
+
+
+def configuracao(provider: str) -> dict:
+    """Limite efetivo de um provedor (valores padrão + variáveis de ambiente)."""
+    base = PROVIDERS.get(provider, {"qps": 0, "rajada": 1})
+    prefixo = f"LIMITE_TAXA_{provider.upper()}_"
+    qps = float(os.environ.get(prefixo + "QPS", base["qps"]))
+    return {"qps": qps, "rajada": max(1.0, float(os.environ.get(prefixo + "RAJADA", base["rajada"])))}
+
+
+def _reserva(tokens: float, atualizado: float, agora: float, cfg: dict, espera_max: float) -> tuple:
+    """
+    Aplica uma reserva ao estado do balde. Devolve (novos tokens, espera em segundos);
+    espera None significa recusada (o estado não deve ser gravado).
+    Tokens negativos representam reservas já feitas para instantes futuros.
+    """
+    tokens = min(cfg["rajada"], tokens + max(0.0, agora - atualizado) * cfg["qps"]) - 1
+    espera = -tokens / cfg["qps"] if tokens < 0 else 0.0
+    if espera > espera_max:
+        return tokens + 1, None
+    return tokens, espera
+
+
+class _Balde:
+    """Operações do token bucket; cada backend fornece `_altera(provider, funcao)` atómico."""
+
+    def reservar(self, provider: str, cfg: dict, espera_max: float):
+        def funcao(estado):
+            agora = time.time()
+            tokens, atualizado = estado or (cfg["rajada"], agora)
+            tokens, espera = _reserva(tokens, atualizado, agora, cfg, espera_max)
+            return ((tokens, agora) if espera is not None else None), (espera, tokens)
+        return self._altera(provider, funcao)
+
+    def penalizar(self, provider: str, cfg: dict, segundos: float) -> None:
+        def funcao(estado):
+            agora = time.time()
+            tokens, atualizado = estado or (cfg["rajada"], agora)
+            tokens = min(cfg["rajada"], tokens + max(0.0, agora - atualizado) * cfg["qps"])
+            return (min(tokens, -segundos * cfg["qps"]), agora), None
+        self._altera(provider, funcao)
+
+
+class ArquivoBackend(_Balde):
+    """Estado de cada balde num pequeno ficheiro, alterado sob `fcntl.flock` exclusivo."""
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self._descritores = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _descritor(self, provider: str) -> int:
+        if self._pid != os.getpid():
+            # Descritores herdados partilham a posição e os locks do processo pai
+            self._descritores, self._pid = {}, os.getpid()
+        fd = self._descritores.get(provider)
+        if fd is None:
+            fd = os.open(os.path.join(self.diretorio, f"{provider}.balde"), os.O_RDWR | os.O_CREAT, 0o600)
+            self._descritores[provider] = fd
+        return fd
+
+    def _altera(self, provider: str, funcao):
+        import fcntl
+        # flock é por descritor: entre threads do mesmo processo é o lock local que serializa
+        with self._lock:
+            fd = self._descritor(provider)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                dados = os.pread(fd, _FORMATO.size, 0)
+                estado = _FORMATO.unpack(dados) if len(dados) == _FORMATO.size else None
+                novo, resposta = funcao(estado)
+                if novo is not None:
+                    os.pwrite(fd, _FORMATO.pack(*novo), 0)
+                return resposta
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class RedisBackend(_Balde):
+    """Estado de cada balde num hash Redis, alterado numa transação otimista (WATCH/MULTI)."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def _altera(self, provider: str, funcao):
+        import redis
+        chave = PREFIXO + provider
+        while True:
+            with self.cliente.pipeline() as pipe:
+                try:
+                    pipe.watch(chave)
+                    tokens, atualizado = pipe.hmget(chave, "tokens", "atualizado")
+                    estado = (float(tokens), float(atualizado)) if tokens is not None else None
+                    novo, resposta = funcao(estado)
+                    if novo is not None:
+                        pipe.multi()
+                        pipe.hset(chave, mapping={"tokens": novo[0], "atualizado": novo[1]})
+                        pipe.expire(chave, 3600)
+                        pipe.execute()
+                    return resposta
+                except redis.WatchError:
+                    continue  # outro worker alterou o balde entretanto: recalcula
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_estatisticas = {"reservas": 0, "esperas": 0, "recusadas": 0, "penalizacoes": 0, "segundos_espera": 0.0}
+
+
+def get_backend():
+    """Devolve o backend configurado (criado na primeira utilização), ou None se desativado."""
+    global _backend
+    if _backend is None and LIMITE_TAXA_BACKEND != "none":
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    if LIMITE_TAXA_BACKEND == "redis":
+                        cliente = cliente_redis()
+                        if cliente is None:
+                            raise RuntimeError("LIMITE_TAXA_BACKEND=redis mas nenhuma ligação Redis configurada")
+                        _backend = RedisBackend(cliente)
+                    else:
+                        _backend = ArquivoBackend(LIMITE_TAXA_DIR)
+                    logger.info(f"Limite de pedidos aos provedores ativo (backend: {type(_backend).__name__}).")
+                except Exception as e:
+                    logger.error(f"Falha ao iniciar o limite de pedidos: {e}. Pedidos sem limite.")
+                    _backend = False
+    return _backend or None
+
+
+def aguardar(provider: str, espera_max: float = None) -> float:
+    """
+    Reserva um token do provedor, esperando pela sua vez se necessário.
+    Devolve os segundos esperados; levanta `LimiteExcedido` se a espera excedesse `espera_max`.
+    Falhas do armazenamento nunca bloqueiam o pedido.
+    """
+    cfg = configuracao(provider)
+    backend = get_backend()
+    if backend is None or cfg["qps"] <= 0:
+        return 0.0
+    espera_max = LIMITE_TAXA_ESPERA_MAX if espera_max is None else espera_max
+    try:
+        espera, tokens = backend.reservar(provider, cfg, espera_max)
+    except Exception as e:
+        logger.warning(f"Erro no limite de pedidos de '{provider}': {e}. Pedido enviado sem espera.")
+        return 0.0
+    if espera is None:
+        _estatisticas["recusadas"] += 1
+        raise LimiteExcedido(provider, (1 - tokens) / cfg["qps"])
+    _estatisticas["reservas"] += 1
+    if espera > 0:
+        _estatisticas["esperas"] += 1
+        _estatisticas["segundos_espera"] += espera
+        time.sleep(espera)
+    return espera
+
+
+def penalizar(provider: str, segundos: float = None) -> None:
+    """Adia as próximas reservas do provedor (resposta 429 / OVER_QUERY_LIMIT)."""
+    cfg = configuracao(provider)
+    backend = get_backend()
+    if backend is None or cfg["qps"] <= 0:
+        return
+    segundos = LIMITE_TAXA_PENALIZACAO if segundos is None else segundos
+    try:
+        backend.penalizar(provider, cfg, segundos)
+        _estatisticas["penalizacoes"] += 1
+        logger.warning(f"Provedor '{provider}' pediu para abrandar: reservas adiadas {segundos:g}s.")
+    except Exception as e:
+        logger.warning(f"Erro ao penalizar o limite de pedidos de '{provider}': {e}")
+
+
+def retry_after(resposta, padrao: float = None) -> float:
+    """Segundos indicados no cabeçalho Retry-After (ou o padrão)."""
+    valor = resposta.headers.get("Retry-After") if resposta is not None else None
+    try:
+        return max(0.0, float(valor))
+    except (TypeError, ValueError):
+        return LIMITE_TAXA_PENALIZACAO if padrao is None else padrao
+
+
+def estatisticas() -> dict:
+    """Contadores de reservas, esperas e recusas deste processo."""
+    return dict(_estatisticas)
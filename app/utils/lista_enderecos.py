@@ -0,0 +1,631 @@
+# app/utils/lista_enderecos.py
+"""
+Armazenamento por linha da lista de endereços de cada sessão.
+A sessão Flask guarda apenas o id da lista (`lista_id`); os itens ficam num
+armazenamento partilhado, um registo por endereço, com índice por `order_number`.
+Assim, validar/mover/remover um endereço lê e grava só essa linha, em vez de
+re-serializar a lista inteira a cada pedido.
+
+Backends disponíveis (variável ENDERECOS_BACKEND):
+  - "sqlite": ficheiro SQLite local (padrão), partilhado pelos workers da máquina;
+  - "redis": o cliente partilhado de `armazenamento.cliente_redis()`, criado a partir
+    de REDIS_URL (o mesmo das sessões quando SESSION_TYPE=redis).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .armazenamento import ConexoesSQLite, cliente_redis, para_json, texto
+
+logger = logging.getLogger(__name__)
+
+ENDERECOS_BACKEND = os.environ.get("ENDERECOS_BACKEND", "sqlite").lower()
+ENDERECOS_DB_PATH = os.environ.get("ENDERECOS_DB_PATH", os.path.join(os.getcwd(), "enderecos.sqlite3"))
+# Acompanha PERMANENT_SESSION_LIFETIME: listas sem alterações há mais de 1 dia são apagadas
+ENDERECOS_TTL = int(os.environ.get("ENDERECOS_TTL", 24 * 3600))
+
+SESSAO_CHAVE = "lista_id"
+PREFIXO = "enderecos:v1:"
+
+
+class SQLiteBackend:
+    """
+    Itens num ficheiro SQLite (modo WAL); chave primária (lista, seq) e índice por order_number.
+    Cada linha guarda a versão em que foi criada e a última em que mudou; as remoções
+    ficam registadas em `removidos`, para responder a pedidos de alterações desde a versão N.
+    """
+
+    def __init__(self, caminho: str):
+        self._conexao = ConexoesSQLite(caminho, esquema=(
+            "CREATE TABLE IF NOT EXISTS listas ("
+            " id TEXT PRIMARY KEY, versao INTEGER NOT NULL DEFAULT 0, atualizado REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS enderecos ("
+            " lista_id TEXT NOT NULL, seq INTEGER NOT NULL, order_number TEXT, item TEXT NOT NULL,"
+            " criado INTEGER NOT NULL DEFAULT 0, versao INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (lista_id, seq));"
+            "CREATE INDEX IF NOT EXISTS idx_enderecos_order ON enderecos (lista_id, order_number);"
+            "CREATE INDEX IF NOT EXISTS idx_enderecos_versao ON enderecos (lista_id, versao);"
+            "CREATE TABLE IF NOT EXISTS removidos ("
+            " lista_id TEXT NOT NULL, seq INTEGER NOT NULL, versao INTEGER NOT NULL,"
+            " PRIMARY KEY (lista_id, seq));"
+        ))
+
+    def _nova_versao(self, conn, lista_id: str) -> int:
+        """Incrementa a versão da lista (dentro da transação do chamador) e devolve-a."""
+        conn.execute(
+            "INSERT INTO listas (id, versao, atualizado) VALUES (?, 1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET versao = versao + 1, atualizado = excluded.atualizado",
+            (lista_id, time.time())
+        )
+        return conn.execute("SELECT versao FROM listas WHERE id = ?", (lista_id,)).fetchone()[0]
+
+    def versao(self, lista_id: str) -> int:
+        row = self._conexao().execute("SELECT versao FROM listas WHERE id = ?", (lista_id,)).fetchone()
+        return row[0] if row else 0
+
+    def substituir(self, lista_id: str, itens: List[str], order_numbers: List[str]) -> int:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM enderecos WHERE lista_id = ?", (lista_id,))
+            conn.execute("DELETE FROM removidos WHERE lista_id = ?", (lista_id,))
+            versao = self._nova_versao(conn, lista_id)
+            conn.executemany(
+                "INSERT INTO enderecos (lista_id, seq, order_number, item, criado, versao) VALUES (?, ?, ?, ?, ?, ?)",
+                [(lista_id, seq, on, item, versao, versao)
+                 for seq, (on, item) in enumerate(zip(order_numbers, itens), start=1)]
+            )
+        return versao
+
+    def listar(self, lista_id: str) -> List[Tuple[int, str]]:
+        return self._conexao().execute(
+            "SELECT seq, item FROM enderecos WHERE lista_id = ? ORDER BY seq", (lista_id,)
+        ).fetchall()
+
+    def listar_bloco(self, lista_id: str, apos_seq: int, limite: int) -> List[Tuple[int, str]]:
+        return self._conexao().execute(
+            "SELECT seq, item FROM enderecos WHERE lista_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (lista_id, apos_seq, limite)
+        ).fetchall()
+
+    def contar(self, lista_id: str) -> int:
+        return self._conexao().execute(
+            "SELECT COUNT(*) FROM enderecos WHERE lista_id = ?", (lista_id,)
+        ).fetchone()[0]
+
+    def obter(self, lista_id: str, seq: int) -> Optional[str]:
+        row = self._conexao().execute(
+            "SELECT item FROM enderecos WHERE lista_id = ? AND seq = ?", (lista_id, seq)
+        ).fetchone()
+        return row[0] if row else None
+
+    def procurar(self, lista_id: str, order_number: str) -> Optional[Tuple[int, str]]:
+        return self._conexao().execute(
+            "SELECT seq, item FROM enderecos WHERE lista_id = ? AND order_number = ? ORDER BY seq LIMIT 1",
+            (lista_id, order_number)
+        ).fetchone()
+
+    def na_posicao(self, lista_id: str, posicao: int) -> Optional[Tuple[int, str]]:
+        return self._conexao().execute(
+            "SELECT seq, item FROM enderecos WHERE lista_id = ? ORDER BY seq LIMIT 1 OFFSET ?",
+            (lista_id, posicao)
+        ).fetchone()
+
+    def atualizar(self, lista_id: str, seq: int, item: str, order_number: str) -> int:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM enderecos WHERE lista_id = ? AND seq = ?", (lista_id, seq)).fetchone() is None:
+                return 0
+            versao = self._nova_versao(conn, lista_id)
+            conn.execute(
+                "UPDATE enderecos SET item = ?, order_number = ?, versao = ? WHERE lista_id = ? AND seq = ?",
+                (item, order_number, versao, lista_id, seq)
+            )
+        return versao
+
+    def atualizar_varios(self, lista_id: str, alteracoes: List[Tuple[int, str, str]]) -> Tuple[List[int], int]:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            pedidos = [seq for seq, _, _ in alteracoes]
+            marcadores = ",".join("?" * len(pedidos))
+            existentes = {row[0] for row in conn.execute(
+                f"SELECT seq FROM enderecos WHERE lista_id = ? AND seq IN ({marcadores})", (lista_id, *pedidos)
+            )}
+            if not existentes:
+                return [], self.versao(lista_id)
+            versao = self._nova_versao(conn, lista_id)
+            conn.executemany(
+                "UPDATE enderecos SET item = ?, order_number = ?, versao = ? WHERE lista_id = ? AND seq = ?",
+                [(item, order_number, versao, lista_id, seq)
+                 for seq, item, order_number in alteracoes if seq in existentes]
+            )
+        return sorted(existentes), versao
+
+    def acrescentar(self, lista_id: str, item: str, order_number: str) -> Tuple[int, int]:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # seq nunca é reutilizado: também conta as linhas já removidas
+            seq = conn.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(seq) FROM enderecos WHERE lista_id = ?), 0),"
+                " COALESCE((SELECT MAX(seq) FROM removidos WHERE lista_id = ?), 0)) + 1",
+                (lista_id, lista_id)
+            ).fetchone()[0]
+            versao = self._nova_versao(conn, lista_id)
+            conn.execute(
+                "INSERT INTO enderecos (lista_id, seq, order_number, item, criado, versao) VALUES (?, ?, ?, ?, ?, ?)",
+                (lista_id, seq, order_number, item, versao, versao)
+            )
+        return seq, versao
+
+    def remover(self, lista_id: str, seqs: List[int]) -> Tuple[int, int]:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            marcadores = ",".join("?" * len(seqs))
+            existentes = [row[0] for row in conn.execute(
+                f"SELECT seq FROM enderecos WHERE lista_id = ? AND seq IN ({marcadores})", (lista_id, *seqs)
+            )]
+            if not existentes:
+                return 0, self.versao(lista_id)
+            versao = self._nova_versao(conn, lista_id)
+            conn.executemany("DELETE FROM enderecos WHERE lista_id = ? AND seq = ?",
+                             [(lista_id, seq) for seq in existentes])
+            conn.executemany("INSERT OR REPLACE INTO removidos (lista_id, seq, versao) VALUES (?, ?, ?)",
+                             [(lista_id, seq, versao) for seq in existentes])
+        return len(existentes), versao
+
+    def seqs_por_order_number(self, lista_id: str, order_number: str) -> List[int]:
+        return [row[0] for row in self._conexao().execute(
+            "SELECT seq FROM enderecos WHERE lista_id = ? AND order_number = ?", (lista_id, order_number)
+        )]
+
+    def alteracoes(self, lista_id: str, desde: int) -> Tuple[int, List[Tuple[int, str, bool]], List[int]]:
+        conn = self._conexao()
+        # Leitura numa só transação: versão, linhas e remoções consistentes entre si
+        with conn:
+            conn.execute("BEGIN")
+            versao = self.versao(lista_id)
+            linhas = [(seq, item, criado > desde) for seq, item, criado in conn.execute(
+                "SELECT seq, item, criado FROM enderecos WHERE lista_id = ? AND versao > ? ORDER BY seq",
+                (lista_id, desde)
+            )]
+            removidos = [row[0] for row in conn.execute(
+                "SELECT seq FROM removidos WHERE lista_id = ? AND versao > ? ORDER BY seq", (lista_id, desde)
+            )]
+        return versao, linhas, removidos
+
+    def apagar(self, lista_id: str) -> None:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM enderecos WHERE lista_id = ?", (lista_id,))
+            conn.execute("DELETE FROM removidos WHERE lista_id = ?", (lista_id,))
+            conn.execute("DELETE FROM listas WHERE id = ?", (lista_id,))
+
+    def limpar(self) -> None:
+        conn = self._conexao()
+        limite = time.time() - ENDERECOS_TTL
+        with conn:
+            conn.execute("BEGIN")
+            antigas = "SELECT id FROM listas WHERE atualizado < ?"
+            conn.execute(f"DELETE FROM enderecos WHERE lista_id IN ({antigas})", (limite,))
+            conn.execute(f"DELETE FROM removidos WHERE lista_id IN ({antigas})", (limite,))
+            conn.execute("DELETE FROM listas WHERE atualizado < ?", (limite,))
+
+
+class RedisBackend:
+    """
+    Itens no Redis: hash seq -> item, conjunto ordenado com a ordem da lista e
+    hash order_number -> seqs como índice. As versões ficam num contador, num
+    conjunto ordenado seq -> versão da última alteração, num hash seq -> versão de
+    criação e num conjunto ordenado de remoções. Todas as chaves expiram com a lista.
+    Cada escrita muda a versão e os dados num só MULTI/EXEC, com WATCH na versão.
+    """
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    @staticmethod
+    def _chaves(lista_id: str) -> Tuple[str, ...]:
+        base = PREFIXO + lista_id
+        return (base + ":itens", base + ":ordem", base + ":indice", base + ":seq",
+                base + ":versao", base + ":alterados", base + ":criados", base + ":removidos")
+
+    def _expira(self, pipe, lista_id: str) -> None:
+        for chave in self._chaves(lista_id):
+            pipe.expire(chave, ENDERECOS_TTL)
+
+    def versao(self, lista_id: str) -> int:
+        return int(self.cliente.get(self._chaves(lista_id)[4]) or 0)
+
+    def _transacao(self, lista_id: str, escrita):
+        """
+        Equivalente ao BEGIN IMMEDIATE do SQLite: WATCH na versão da lista; `escrita(pipe, versao)`
+        lê com `pipe` (modo imediato), chama `pipe.multi()` e enfileira as escritas, que gravam a
+        nova versão no mesmo MULTI/EXEC. Como todas as escritas mudam a versão, uma escrita
+        concorrente faz falhar o EXEC e a transação é repetida. Devolve o valor de `escrita`.
+        """
+        chave_versao = self._chaves(lista_id)[4]
+
+        def executa(pipe):
+            return escrita(pipe, int(pipe.get(chave_versao) or 0) + 1)
+
+        return self.cliente.transaction(executa, chave_versao, value_from_callable=True)
+
+    def substituir(self, lista_id: str, itens: List[str], order_numbers: List[str]) -> int:
+        chaves = self._chaves(lista_id)
+        chave_itens, chave_ordem, chave_indice, chave_seq, chave_versao, chave_alterados, chave_criados, chave_removidos = chaves
+        indice = {}
+        for seq, on in enumerate(order_numbers, start=1):
+            indice.setdefault(on, []).append(seq)
+        seqs = range(1, len(itens) + 1)
+
+        def escrita(pipe, versao):
+            pipe.multi()
+            pipe.delete(chave_itens, chave_ordem, chave_indice, chave_seq, chave_alterados, chave_criados, chave_removidos)
+            if itens:
+                pipe.hset(chave_itens, mapping=dict(zip(seqs, itens)))
+                pipe.zadd(chave_ordem, {seq: seq for seq in seqs})
+                pipe.hset(chave_indice, mapping={on: json.dumps(s) for on, s in indice.items()})
+                pipe.zadd(chave_alterados, {seq: versao for seq in seqs})
+                pipe.hset(chave_criados, mapping={seq: versao for seq in seqs})
+            pipe.set(chave_seq, len(itens))
+            pipe.set(chave_versao, versao)
+            self._expira(pipe, lista_id)
+            return versao
+
+        return self._transacao(lista_id, escrita)
+
+    def listar(self, lista_id: str) -> List[Tuple[int, str]]:
+        itens = self.cliente.hgetall(self._chaves(lista_id)[0])
+        return sorted((int(seq), texto(item)) for seq, item in itens.items())
+
+    def listar_bloco(self, lista_id: str, apos_seq: int, limite: int) -> List[Tuple[int, str]]:
+        # Na ordem da lista o score de cada seq é o próprio seq
+        seqs = [int(seq) for seq in self.cliente.zrangebyscore(
+            self._chaves(lista_id)[1], f"({apos_seq}", "+inf", start=0, num=limite)]
+        if not seqs:
+            return []
+        itens = self.cliente.hmget(self._chaves(lista_id)[0], seqs)
+        return [(seq, texto(item)) for seq, item in zip(seqs, itens) if item is not None]
+
+    def contar(self, lista_id: str) -> int:
+        return self.cliente.hlen(self._chaves(lista_id)[0])
+
+    def obter(self, lista_id: str, seq: int) -> Optional[str]:
+        return texto(self.cliente.hget(self._chaves(lista_id)[0], seq))
+
+    @staticmethod
+    def _seqs_indice(con, chave_indice: str, order_number: str) -> List[int]:
+        """Seqs de `order_number` lidos com `con` (o cliente ou um pipe em WATCH)."""
+        valor = con.hget(chave_indice, order_number)
+        return json.loads(valor) if valor else []
+
+    def seqs_por_order_number(self, lista_id: str, order_number: str) -> List[int]:
+        return self._seqs_indice(self.cliente, self._chaves(lista_id)[2], order_number)
+
+    def procurar(self, lista_id: str, order_number: str) -> Optional[Tuple[int, str]]:
+        seqs = self.seqs_por_order_number(lista_id, order_number)
+        if not seqs:
+            return None
+        item = self.obter(lista_id, min(seqs))
+        return (min(seqs), item) if item is not None else None
+
+    def na_posicao(self, lista_id: str, posicao: int) -> Optional[Tuple[int, str]]:
+        seqs = self.cliente.zrange(self._chaves(lista_id)[1], posicao, posicao)
+        if not seqs:
+            return None
+        seq = int(seqs[0])
+        item = self.obter(lista_id, seq)
+        return (seq, item) if item is not None else None
+
+    def _reindexa(self, pipe, lista_id: str, order_number: str, seqs: List[int]) -> None:
+        chave_indice = self._chaves(lista_id)[2]
+        if seqs:
+            pipe.hset(chave_indice, order_number, json.dumps(sorted(seqs)))
+        else:
+            pipe.hdel(chave_indice, order_number)
+
+    def atualizar(self, lista_id: str, seq: int, item: str, order_number: str) -> int:
+        alterados, versao = self.atualizar_varios(lista_id, [(seq, item, order_number)])
+        return versao if alterados else 0
+
+    def atualizar_varios(self, lista_id: str, alteracoes: List[Tuple[int, str, str]]) -> Tuple[List[int], int]:
+        chave_itens, _, chave_indice, _, chave_versao, chave_alterados, _, _ = self._chaves(lista_id)
+
+        def escrita(pipe, versao):
+            anteriores = pipe.hmget(chave_itens, [seq for seq, _, _ in alteracoes])
+            existentes = [(seq, item, order_number, json.loads(anterior))
+                          for (seq, item, order_number), anterior in zip(alteracoes, anteriores)
+                          if anterior is not None]
+            if not existentes:
+                return [], versao - 1
+            # Índice por order_number recalculado em memória para todos os números afetados
+            mudancas = [(seq, str(anterior.get("order_number", "")), order_number)
+                        for seq, _, order_number, anterior in existentes
+                        if str(anterior.get("order_number", "")) != order_number]
+            afetados = {on for _, antes, depois in mudancas for on in (antes, depois)}
+            indice = {on: set(self._seqs_indice(pipe, chave_indice, on)) for on in afetados}
+            for seq, antes, depois in mudancas:
+                indice[antes].discard(seq)
+                indice[depois].add(seq)
+            pipe.multi()
+            pipe.hset(chave_itens, mapping={seq: item for seq, item, _, _ in existentes})
+            pipe.zadd(chave_alterados, {seq: versao for seq, _, _, _ in existentes})
+            for order_number, seqs in indice.items():
+                self._reindexa(pipe, lista_id, order_number, list(seqs))
+            pipe.set(chave_versao, versao)
+            self._expira(pipe, lista_id)
+            return sorted(seq for seq, _, _, _ in existentes), versao
+
+        return self._transacao(lista_id, escrita)
+
+    def acrescentar(self, lista_id: str, item: str, order_number: str) -> Tuple[int, int]:
+        chave_itens, chave_ordem, chave_indice, chave_seq, chave_versao, chave_alterados, chave_criados, _ = self._chaves(lista_id)
+
+        def escrita(pipe, versao):
+            seq = int(pipe.get(chave_seq) or 0) + 1
+            seqs = self._seqs_indice(pipe, chave_indice, order_number)
+            pipe.multi()
+            pipe.set(chave_seq, seq)
+            pipe.hset(chave_itens, seq, item)
+            pipe.zadd(chave_ordem, {seq: seq})
+            pipe.zadd(chave_alterados, {seq: versao})
+            pipe.hset(chave_criados, seq, versao)
+            self._reindexa(pipe, lista_id, order_number, seqs + [seq])
+            pipe.set(chave_versao, versao)
+            self._expira(pipe, lista_id)
+            return seq, versao
+
+        return self._transacao(lista_id, escrita)
+
+    def remover(self, lista_id: str, seqs: List[int]) -> Tuple[int, int]:
+        chave_itens, chave_ordem, chave_indice, _, chave_versao, chave_alterados, chave_criados, chave_removidos = self._chaves(lista_id)
+
+        def escrita(pipe, versao):
+            seqs_unicos = list(dict.fromkeys(seqs))
+            anteriores = pipe.hmget(chave_itens, seqs_unicos) if seqs_unicos else []
+            existentes = [(seq, str(json.loads(anterior).get("order_number", "")))
+                          for seq, anterior in zip(seqs_unicos, anteriores) if anterior is not None]
+            if not existentes:
+                return 0, versao - 1
+            indice = {}
+            for seq, order_number in existentes:
+                if order_number not in indice:
+                    indice[order_number] = set(self._seqs_indice(pipe, chave_indice, order_number))
+                indice[order_number].discard(seq)
+            removidos = [seq for seq, _ in existentes]
+            pipe.multi()
+            pipe.hdel(chave_itens, *removidos)
+            pipe.zrem(chave_ordem, *removidos)
+            pipe.zrem(chave_alterados, *removidos)
+            pipe.hdel(chave_criados, *removidos)
+            pipe.zadd(chave_removidos, {seq: versao for seq in removidos})
+            for order_number, restantes in indice.items():
+                self._reindexa(pipe, lista_id, order_number, list(restantes))
+            pipe.set(chave_versao, versao)
+            self._expira(pipe, lista_id)
+            return len(removidos), versao
+
+        return self._transacao(lista_id, escrita)
+
+    def alteracoes(self, lista_id: str, desde: int) -> Tuple[int, List[Tuple[int, str, bool]], List[int]]:
+        chave_itens, _, _, _, chave_versao, chave_alterados, chave_criados, chave_removidos = self._chaves(lista_id)
+        pipe = self.cliente.pipeline()
+        pipe.get(chave_versao)
+        pipe.zrangebyscore(chave_alterados, f"({desde}", "+inf")
+        pipe.zrangebyscore(chave_removidos, f"({desde}", "+inf")
+        versao, alterados, removidos = pipe.execute()
+        seqs = sorted(int(seq) for seq in alterados)
+        linhas = []
+        if seqs:
+            pipe = self.cliente.pipeline()
+            pipe.hmget(chave_itens, seqs)
+            pipe.hmget(chave_criados, seqs)
+            itens, criados = pipe.execute()
+            linhas = [(seq, texto(item), int(criado or 0) > desde)
+                      for seq, item, criado in zip(seqs, itens, criados) if item is not None]
+        return int(versao or 0), linhas, sorted(int(seq) for seq in removidos)
+
+    def apagar(self, lista_id: str) -> None:
+        self.cliente.delete(*self._chaves(lista_id))
+
+    def limpar(self) -> None:
+        pass  # as chaves expiram sozinhas
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Devolve o backend configurado, criado na primeira utilização."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if ENDERECOS_BACKEND == "redis":
+                    cliente = cliente_redis()
+                    if cliente is None:
+                        raise RuntimeError("ENDERECOS_BACKEND=redis mas nenhuma ligação Redis configurada")
+                    _backend = RedisBackend(cliente)
+                else:
+                    _backend = SQLiteBackend(ENDERECOS_DB_PATH)
+                logger.info(f"Lista de endereços por linha ativa (backend: {type(_backend).__name__}).")
+    return _backend
+
+
+def _order_number(item: dict) -> str:
+    return str(item.get("order_number", "")).strip()
+
+
+# --- Operações sobre uma lista (por id) ---
+# Cada alteração incrementa a versão da lista; `alteracoes(lista_id, desde)` devolve
+# só o que mudou depois de uma versão, para o cliente não ter de recarregar tudo.
+
+def substituir(lista_id: str, itens: list) -> int:
+    """
+    Substitui todos os itens da lista (ex.: no fim de uma importação) e devolve a versão.
+    Os seqs dos itens passam a ser 1..len(itens), pela ordem recebida.
+    """
+    return get_backend().substituir(lista_id, [para_json(item) for item in itens], [_order_number(i) for i in itens])
+
+
+def listar(lista_id: str) -> list:
+    """Todos os itens, pela ordem da lista."""
+    return [json.loads(item) for _, item in get_backend().listar(lista_id)]
+
+
+def iterar_blocos(lista_id: str, tamanho_bloco: int = 1000) -> Iterator[list]:
+    """
+    Percorre a lista em blocos de até `tamanho_bloco` itens, pela ordem da lista, sem a
+    carregar inteira (paginação por seq: cada bloco é uma leitura curta e independente).
+    """
+    backend = get_backend()
+    apos_seq = 0
+    while True:
+        linhas = backend.listar_bloco(lista_id, apos_seq, tamanho_bloco)
+        if not linhas:
+            return
+        yield [json.loads(item) for _, item in linhas]
+        apos_seq = linhas[-1][0]
+
+
+def listar_com_seq(lista_id: str) -> Tuple[int, List[Tuple[int, dict]]]:
+    """(versão, [(seq, item), ...]) pela ordem da lista."""
+    backend = get_backend()
+    # A versão é lida antes dos itens: no pior caso o cliente recebe alterações repetidas
+    versao = backend.versao(lista_id)
+    return versao, [(seq, json.loads(item)) for seq, item in backend.listar(lista_id)]
+
+
+def versao(lista_id: str) -> int:
+    return get_backend().versao(lista_id)
+
+
+def obter(lista_id: str, seq: int) -> Optional[dict]:
+    """Item com este seq, ou None."""
+    item = get_backend().obter(lista_id, seq)
+    return json.loads(item) if item is not None else None
+
+
+def contar(lista_id: str) -> int:
+    return get_backend().contar(lista_id)
+
+
+def procurar(lista_id: str, order_number: str) -> Optional[Tuple[int, dict]]:
+    """Primeiro item com este order_number, via índice: (seq, item) ou None."""
+    encontrado = get_backend().procurar(lista_id, str(order_number).strip())
+    return (encontrado[0], json.loads(encontrado[1])) if encontrado else None
+
+
+def na_posicao(lista_id: str, posicao: int) -> Optional[Tuple[int, dict]]:
+    """Item na posição `posicao` da lista (índice usado pela interface): (seq, item) ou None."""
+    if posicao < 0:
+        return None
+    encontrado = get_backend().na_posicao(lista_id, posicao)
+    return (encontrado[0], json.loads(encontrado[1])) if encontrado else None
+
+
+def atualizar(lista_id: str, seq: int, item: dict) -> int:
+    """Grava apenas a linha `seq`. Devolve a nova versão da lista, ou 0 se a linha já não existir."""
+    return get_backend().atualizar(lista_id, seq, para_json(item), _order_number(item))
+
+
+def atualizar_varios(lista_id: str, itens: Dict[int, dict]) -> Tuple[List[int], int]:
+    """
+    Grava várias linhas (seq -> item) numa única escrita, com um só incremento de versão.
+    Devolve (seqs que ainda existiam e foram gravados, versão).
+    """
+    if not itens:
+        return [], versao(lista_id)
+    return get_backend().atualizar_varios(
+        lista_id, [(int(seq), para_json(item), _order_number(item)) for seq, item in itens.items()]
+    )
+
+
+def acrescentar(lista_id: str, item: dict) -> Tuple[int, int]:
+    """Acrescenta um item no fim da lista. Devolve (seq, versão)."""
+    return get_backend().acrescentar(lista_id, para_json(item), _order_number(item))
+
+
+def remover(lista_id: str, seqs: list) -> Tuple[int, int]:
+    """Remove as linhas indicadas. Devolve (quantas existiam, versão)."""
+    if not seqs:
+        return 0, versao(lista_id)
+    return get_backend().remover(lista_id, list(seqs))
+
+
+def remover_por_order_number(lista_id: str, order_number: str) -> Tuple[int, int]:
+    """Remove todas as linhas com este order_number. Devolve (quantas foram removidas, versão)."""
+    backend = get_backend()
+    return remover(lista_id, backend.seqs_por_order_number(lista_id, str(order_number).strip()))
+
+
+def alteracoes(lista_id: str, desde: int) -> dict:
+    """
+    Delta da lista desde a versão `desde`: itens adicionados e alterados (com o seu seq)
+    e seqs removidos. A ordem da lista é a dos seqs: os adicionados vão sempre para o fim.
+    """
+    versao_atual, linhas, removidos = get_backend().alteracoes(lista_id, desde)
+    adicionados, alterados = [], []
+    for seq, item, novo in linhas:
+        (adicionados if novo else alterados).append({"seq": seq, "item": json.loads(item)})
+    return {"versao": versao_atual, "desde": desde, "adicionados": adicionados,
+            "alterados": alterados, "removidos": removidos}
+
+
+# --- Ligação à sessão Flask (recebe o objeto `session`, para não depender de Flask aqui) ---
+
+def id_da_sessao(sessao, criar: bool = False) -> Optional[str]:
+    """
+    Id da lista da sessão. Sessões anteriores a este armazenamento (com a lista
+    completa em `session['lista']`) são migradas na primeira utilização.
+    """
+    lista_id = sessao.get(SESSAO_CHAVE)
+    if lista_id is None and "lista" in sessao:
+        lista_id = guardar_na_sessao(sessao, sessao.pop("lista") or [])
+    elif lista_id is None and criar:
+        lista_id = guardar_na_sessao(sessao, [])
+    return lista_id
+
+
+def guardar_na_sessao(sessao, itens: list, limpar_sessao: bool = False) -> str:
+    """
+    Cria uma nova lista com `itens` e associa-a à sessão (a lista anterior é apagada).
+    Com `limpar_sessao`, o resto da sessão é limpo antes (início de uma nova importação).
+    """
+    backend = get_backend()
+    apagar_da_sessao(sessao)
+    if limpar_sessao:
+        sessao.clear()
+    try:
+        backend.limpar()
+    except Exception as e:
+        logger.warning(f"Falha ao limpar listas de endereços antigas: {e}")
+    lista_id = uuid.uuid4().hex
+    substituir(lista_id, itens)
+    sessao[SESSAO_CHAVE] = lista_id
+    sessao.modified = True
+    return lista_id
+
+
+def listar_da_sessao(sessao) -> list:
+    """Todos os itens da lista da sessão (lista vazia se não houver)."""
+    lista_id = id_da_sessao(sessao)
+    return listar(lista_id) if lista_id else []
+
+
+def apagar_da_sessao(sessao) -> None:
+    """Apaga a lista associada à sessão, se existir."""
+    lista_id = sessao.pop(SESSAO_CHAVE, None)
+    if lista_id:
+        get_backend().apagar(lista_id)
@@ -1,24 +1,31 @@
 # app/utils/mapbox.py
 
-import requests
 import os
 
+import requests
+
+from . import limite_taxa, transport
+
 MAPBOX_TOKEN = os.environ.get("MAPBOX_TOKEN", "SEU_TOKEN_MAPBOX_AQUI")
 
 def _busca_geocode_mapbox(query):
+    """
+    Features do Mapbox para `query`. Uma consulta que o Mapbox rejeita (4xx, exceto
+    autenticação e 429) conta como "sem resultados". Timeouts, erros de ligação e
+    respostas 5xx propagam-se como `requests.RequestException`, para o disjuntor
+    os contar como erro.
+    """
     url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{query}.json"
     params = {
         "access_token": MAPBOX_TOKEN,
         "country": "PT",
         "limit": 1
     }
-    try:
-        r = requests.get(url, params=params, timeout=7)
-        r.raise_for_status()
-        data = r.json()
-        return data.get('features', [])
-    except Exception as e:
+    r = transport.get("mapbox", url, params=params)
+    if 400 <= r.status_code < 500 and r.status_code not in (401, 403, 429):
         return []
+    r.raise_for_status()
+    return r.json().get('features', [])
 
 def valida_rua_mapbox(endereco, cep):
     """
@@ -29,13 +36,18 @@ def valida_rua_mapbox(endereco, cep):
     Sempre retorna lat/lng como float.
     """
     consulta = f"{endereco}, {cep}" if cep else endereco
-    features = _busca_geocode_mapbox(consulta)
+    try:
+        features = _busca_geocode_mapbox(consulta)
+
+        if not features and cep:
+            features = _busca_geocode_mapbox(cep)
 
-    if not features and cep:
-        features = _busca_geocode_mapbox(cep)
-    
-    if not features and endereco:
-        features = _busca_geocode_mapbox(endereco)
+        if not features and endereco:
+            features = _busca_geocode_mapbox(endereco)
+    except limite_taxa.LimiteExcedido as e:
+        return {"status": "RATE_LIMITED", "msg": str(e)}
+    except (requests.RequestException, ValueError) as e:
+        return {"status": "ERRO", "msg": str(e)}
 
     # Não encontrou nada? Retorno padrão.
     if not features:
@@ -79,7 +91,7 @@ def obter_endereco_por_coordenadas(lat, lng):
         "limit": 1
     }
     try:
-        r = requests.get(url, params=params, timeout=7)
+        r = transport.get("mapbox", url, params=params)
         r.raise_for_status()
         data = r.json()
         if data.get('features'):
@@ -101,6 +113,8 @@ def obter_endereco_por_coordenadas(lat, lng):
             "address": "Endereço não encontrado",
             "coordenadas": {"lat": lat, "lng": lng}
         }
+    except limite_taxa.LimiteExcedido as e:
+        return {"status": "RATE_LIMITED", "address": str(e), "coordenadas": {"lat": lat, "lng": lng}}
     except Exception as e:
         return {
             "status": "ERRO",
@@ -0,0 +1,126 @@
+# app/utils/metricas.py
+"""
+Métricas Prometheus da aplicação (expostas em /metrics pela rota `metricas`).
+
+Com vários workers do gunicorn cada processo tem os seus contadores; o modo
+multiprocesso do `prometheus_client` grava-os em ficheiros no diretório
+PROMETHEUS_MULTIPROC_DIR (definido em `gunicorn.conf.py`) e /metrics agrega os
+ficheiros de todos os workers, seja qual for o worker que responde.
+Sem essa variável (servidor de desenvolvimento) é usado o registo normal, em memória.
+
+Se o `prometheus_client` não estiver instalado, as funções de registo não fazem nada.
+"""
+
+import logging
+import os
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:  # pragma: no cover - dependência opcional
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = "drivemaps_"
+# Estados dos provedores com etiqueta própria; os restantes contam como "OUTRO"
+STATUS_CONHECIDOS = {
+    "OK", "OK_CEP", "OK_FREGUESIA", "NOT_FOUND", "ZERO_RESULTS", "TIMEOUT", "ERRO",
+    "RATE_LIMITED", "OVER_QUERY_LIMIT", "API_KEY_MISSING",
+}
+_BALDES_PROVEDOR = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_BALDES_PEDIDO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_BALDES_LINHAS_SEGUNDO = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_BALDES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+if prometheus_client is not None:
+    PROVEDOR_LATENCIA = Histogram(
+        PREFIXO + "geocoder_provedor_latencia_segundos",
+        "Latência das chamadas a cada provedor de geocodificação.",
+        ["provedor", "tipo"], buckets=_BALDES_PROVEDOR,
+    )
+    PROVEDOR_RESULTADOS = Counter(
+        PREFIXO + "geocoder_provedor_resultados",
+        "Chamadas a cada provedor, por estado devolvido (OK, OK_CEP, NOT_FOUND, TIMEOUT, ERRO, ...).",
+        ["provedor", "tipo", "status"],
+    )
+    GEOCACHE_CONSULTAS = Counter(
+        PREFIXO + "geocache_consultas",
+        "Consultas ao cache de geocodificação, por resultado (hit, miss, erro).",
+        ["resultado"],
+    )
+    IMPORTACAO_LINHAS = Counter(
+        PREFIXO + "importacao_linhas", "Linhas importadas (antes da deduplicação).", ["modo"],
+    )
+    IMPORTACAO_LINHAS_SEGUNDO = Histogram(
+        PREFIXO + "importacao_linhas_por_segundo",
+        "Débito de cada importação (linhas por segundo).",
+        ["modo"], buckets=_BALDES_LINHAS_SEGUNDO,
+    )
+    IMPORTACAO_DURACAO = Histogram(
+        PREFIXO + "importacao_duracao_segundos", "Duração de cada importação.",
+        ["modo"], buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+    )
+    SESSAO_BYTES = Histogram(
+        PREFIXO + "sessao_tamanho_bytes", "Tamanho da sessão serializada, numa amostra das gravações (METRICAS_SESSAO_AMOSTRA).",
+        buckets=_BALDES_BYTES,
+    )
+    PEDIDO_LATENCIA = Histogram(
+        PREFIXO + "http_pedido_duracao_segundos",
+        "Duração dos pedidos HTTP por rota, método e código de resposta.",
+        ["rota", "metodo", "codigo"], buckets=_BALDES_PEDIDO,
+    )
+
+
+def ativo() -> bool:
+    return prometheus_client is not None
+
+
+def provedor(nome: str, resultado, duracao: float, reverso: bool = False) -> None:
+    """Regista uma chamada a um provedor (`resultado`: dict devolvido ou exceção)."""
+    if prometheus_client is None:
+        return
+    if isinstance(resultado, BaseException):
+        status = "ERRO"
+    else:
+        status = str((resultado or {}).get("status", "")).upper() if isinstance(resultado, dict) else ""
+        status = "ERRO" if status == "ERROR" else status
+    tipo = "reversa" if reverso else "direta"
+    PROVEDOR_LATENCIA.labels(nome, tipo).observe(duracao)
+    PROVEDOR_RESULTADOS.labels(nome, tipo, status if status in STATUS_CONHECIDOS else "OUTRO").inc()
+
+
+def cache(resultado: str) -> None:
+    """Regista uma consulta ao cache de geocodificação: "hit", "miss" ou "erro"."""
+    if prometheus_client is not None:
+        GEOCACHE_CONSULTAS.labels(resultado).inc()
+
+
+def importacao(linhas: int, duracao: float, modo: str) -> None:
+    """Regista uma importação concluída ("sincrona" ou "job")."""
+    if prometheus_client is None:
+        return
+    IMPORTACAO_LINHAS.labels(modo).inc(linhas)
+    IMPORTACAO_DURACAO.labels(modo).observe(duracao)
+    if duracao > 0 and linhas:
+        IMPORTACAO_LINHAS_SEGUNDO.labels(modo).observe(linhas / duracao)
+
+
+def sessao(tamanho_bytes: int) -> None:
+    if prometheus_client is not None:
+        SESSAO_BYTES.observe(tamanho_bytes)
+
+
+def pedido(rota: str, metodo: str, codigo: int, duracao: float) -> None:
+    if prometheus_client is not None:
+        PEDIDO_LATENCIA.labels(rota, metodo, str(codigo)).observe(duracao)
+
+
+def exportar() -> tuple:
+    """Texto no formato de exposição do Prometheus e o respetivo content type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registo = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registo)
+    else:
+        registo = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registo), prometheus_client.CONTENT_TYPE_LATEST
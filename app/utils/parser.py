@@ -4,9 +4,15 @@ Módulo dedicado ao parsing de diferentes formatos de dados (texto e DataFrames)
 para extrair informações de endereço, CEP e número de encomenda de forma flexível.
 """
 
+from __future__ import annotations
+
+import csv
 import re
-import pandas as pd
-from typing import List, Tuple, Optional
+from typing import IO, Iterator, List, Tuple, Optional
+
+from . import tardio
+
+pd = tardio.modulo("pandas")
 
 def _normalize_col_name(col: str) -> str:
     """Função auxiliar para normalizar nomes de colunas, removendo espaços,
@@ -20,8 +26,9 @@ def detectar_formato_df(df: pd.DataFrame) -> Optional[str]:
     """
     Deteta o formato dos dados ('delnext' ou 'paack') de forma flexível,
     procurando por palavras-chave nos nomes das colunas.
+    Basta o cabeçalho: um DataFrame sem linhas mas com colunas é aceite.
     """
-    if not isinstance(df, pd.DataFrame) or df.empty:
+    if not isinstance(df, pd.DataFrame) or len(df.columns) == 0:
         return None
 
     cols = {_normalize_col_name(c) for c in df.columns}
@@ -63,22 +70,22 @@ def parse_paack_texto(text: str) -> Tuple[List[str], List[str], List[str]]:
             
     return enderecos, ceps, order_numbers
 
-def _parse_delnext_df(df: pd.DataFrame) -> Tuple[List[str], List[str], List[str]]:
+def _parse_delnext_df(df: pd.DataFrame, inicio: int = 0) -> pd.DataFrame:
     """Função interna para fazer o parsing de um DataFrame no formato Delnext."""
     # Encontra as colunas relevantes procurando por palavras-chave
     col_end = next((c for c in df.columns if 'morada' in _normalize_col_name(c)), None)
     col_cep = next((c for c in df.columns if 'codigopostal' in _normalize_col_name(c)), None)
 
     if not col_end or not col_cep:
-        return [], [], []
-        
-    enderecos = df[col_end].astype(str).tolist()
-    ceps = df[col_cep].astype(str).tolist()
-    order_numbers = [f"D{i+1}" for i in range(len(enderecos))]  # Sempre sequencial D1, D2...
-    
-    return enderecos, ceps, order_numbers
+        return _dataframe_vazio()
+
+    return pd.DataFrame({
+        "address": df[col_end].astype(str).to_numpy(),
+        "cep": df[col_cep].astype(str).to_numpy(),
+        "order_number": [f"D{i+1}" for i in range(inicio, inicio + len(df))],  # Sempre sequencial D1, D2...
+    })
 
-def _parse_paack_df(df: pd.DataFrame) -> Tuple[List[str], List[str], List[str]]:
+def _parse_paack_df(df: pd.DataFrame, inicio: int = 0) -> pd.DataFrame:
     """Função interna para fazer o parsing de um DataFrame no formato Paack."""
     # Encontra as colunas relevantes procurando por palavras-chave
     col_end = next((c for c in df.columns if 'endereco' in _normalize_col_name(c)), None)
@@ -86,27 +93,100 @@ def _parse_paack_df(df: pd.DataFrame) -> Tuple[List[str], List[str], List[str]]:
     col_order = next((c for c in df.columns if 'order' in _normalize_col_name(c)), None)
     
     if not col_end or not col_cep:
-        return [], [], []
-        
-    enderecos = df[col_end].astype(str).tolist()
-    ceps = df[col_cep].astype(str).tolist()
-    order_numbers = df[col_order].astype(str).tolist() if col_order else [f"P{i+1}" for i in range(len(enderecos))]
-    
-    return enderecos, ceps, order_numbers
+        return _dataframe_vazio()
 
-def parse_dataframe(df: pd.DataFrame, formato: Optional[str] = None) -> Tuple[List[str], List[str], List[str]]:
+    return pd.DataFrame({
+        "address": df[col_end].astype(str).to_numpy(),
+        "cep": df[col_cep].astype(str).to_numpy(),
+        "order_number": df[col_order].astype(str).to_numpy() if col_order else [f"P{i+1}" for i in range(inicio, inicio + len(df))],
+    })
+
+def _dataframe_vazio() -> pd.DataFrame:
+    return pd.DataFrame(columns=["address", "cep", "order_number"])
+
+def extrair_dataframe(df: pd.DataFrame, formato: Optional[str] = None, inicio: int = 0) -> pd.DataFrame:
     """
-    Função "dispatcher" que deteta o formato do DataFrame e chama o parser correto.
+    Deteta o formato do DataFrame e devolve um DataFrame colunar com as colunas
+    `address`, `cep` e `order_number` (vazio se o formato não for reconhecido).
+    `inicio` desloca a numeração gerada (D1, P1...) quando o DataFrame é um bloco de um ficheiro maior.
     """
     if not isinstance(df, pd.DataFrame) or df.empty:
-        return [], [], []
+        return _dataframe_vazio()
 
     formato_detectado = formato or detectar_formato_df(df)
     
     if formato_detectado == 'delnext':
-        return _parse_delnext_df(df)
+        return _parse_delnext_df(df, inicio)
     elif formato_detectado == 'paack':
-        return _parse_paack_df(df)
+        return _parse_paack_df(df, inicio)
         
     # Retorna vazio se nenhum formato for reconhecido
-    return [], [], []
+    return _dataframe_vazio()
+
+def paack_texto_para_dataframe(text: str) -> pd.DataFrame:
+    """Versão colunar de `parse_paack_texto`."""
+    enderecos, ceps, order_numbers = parse_paack_texto(text)
+    return pd.DataFrame({"address": enderecos, "cep": ceps, "order_number": order_numbers},
+                        columns=["address", "cep", "order_number"])
+
+def parse_dataframe(df: pd.DataFrame, formato: Optional[str] = None) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Função "dispatcher" que deteta o formato do DataFrame e chama o parser correto.
+    Mantida por compatibilidade: devolve listas (ver `extrair_dataframe`).
+    """
+    dados = extrair_dataframe(df, formato)
+    return dados["address"].tolist(), dados["cep"].tolist(), dados["order_number"].tolist()
+
+# Tamanho da amostra lida para detetar o separador e o cabeçalho de um CSV
+AMOSTRA_CSV_BYTES = 64 * 1024
+
+def detectar_csv(stream: IO[bytes]) -> Optional[dict]:
+    """
+    Lê uma única vez o início de um CSV e deteta separador, linha de cabeçalho e formato.
+    Tal como a leitura tradicional, tenta primeiro ignorar uma linha de título
+    (cabeçalho na 2ª linha) e depois o cabeçalho na 1ª linha.
+    Devolve {"sep", "skiprows", "formato"} ou None. O stream volta à posição inicial.
+    """
+    inicio = stream.tell()
+    amostra = stream.read(AMOSTRA_CSV_BYTES).decode('utf-8-sig', errors='replace')
+    stream.seek(inicio)
+    linhas = amostra.splitlines()
+    if not linhas:
+        return None
+    for skiprows in (1, 0):
+        if skiprows >= len(linhas):
+            continue
+        # O separador é detetado a partir do cabeçalho candidato (a linha de título não o tem)
+        try:
+            sep = csv.Sniffer().sniff("\n".join(linhas[skiprows:skiprows + 20]), delimiters=";,\t|").delimiter
+        except csv.Error:
+            sep = ','
+        cabecalho = next(csv.reader([linhas[skiprows]], delimiter=sep), [])
+        if len(cabecalho) < 2:
+            continue
+        formato = detectar_formato_df(pd.DataFrame(columns=cabecalho))
+        if formato:
+            return {"sep": sep, "skiprows": skiprows, "formato": formato}
+    return None
+
+def iterar_csv_em_blocos(stream: IO[bytes], tamanho_bloco: int) -> Tuple[Optional[str], Iterator[pd.DataFrame]]:
+    """
+    Lê um CSV em blocos de `tamanho_bloco` linhas, sem carregar o ficheiro inteiro.
+    Devolve o formato detetado e um iterador de DataFrames colunares (ver `extrair_dataframe`);
+    (None, iterador vazio) se o formato não for reconhecido pelo cabeçalho.
+    """
+    deteccao = detectar_csv(stream)
+    if not deteccao:
+        return None, iter(())
+
+    def blocos():
+        leitor = pd.read_csv(
+            stream, sep=deteccao["sep"], skiprows=deteccao["skiprows"], chunksize=tamanho_bloco,
+            dtype=str, keep_default_na=False, on_bad_lines='skip', encoding='utf-8-sig'
+        )
+        lidas = 0
+        for bloco in leitor:
+            yield extrair_dataframe(bloco, deteccao["formato"], inicio=lidas)
+            lidas += len(bloco)
+
+    return deteccao["formato"], blocos()
@@ -0,0 +1,263 @@
+# app/utils/perfil.py
+"""
+Perfis de execução (cProfile) de pedidos individuais, ativados a pedido.
+
+Um pedido é perfilado quando:
+  - traz o cabeçalho `X-Perfil: <PERFIL_TOKEN>` (forçado, ex.: ao reproduzir uma importação lenta); ou
+  - PERFIL_ATIVO=1 e é sorteado com probabilidade PERFIL_AMOSTRAGEM (ex.: 0.01 = 1%).
+Só entram as rotas de PERFIL_ROTAS: nomes de endpoint (`preview.preview`) ou prefixos
+de caminho (`/api/`).
+
+Cada perfil é gravado em PERFIL_DIR como `<id>.prof` (formato pstats, para
+`python -m pstats` ou snakeviz) e `<id>.json` com o resumo: tempo de relógio vs CPU,
+tempo próprio por categoria (pandas, normalização, I/O dos provedores, sessão, ...),
+tempo acumulado das funções-chave do pipeline e as funções mais pesadas.
+São mantidos os PERFIL_MAX_FICHEIROS perfis mais recentes.
+
+O cProfile só vê a thread do pedido: o trabalho feito no pool da geocodificação em
+lote aparece como espera ("espera_threads"); o tempo de CPU do processo inclui-o.
+"""
+
+import cProfile
+import glob
+import hmac
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PERFIL_ATIVO = os.environ.get("PERFIL_ATIVO", "0") == "1"
+PERFIL_AMOSTRAGEM = float(os.environ.get("PERFIL_AMOSTRAGEM", "0.01"))
+PERFIL_TOKEN = os.environ.get("PERFIL_TOKEN", "")
+PERFIL_DIR = os.environ.get("PERFIL_DIR", os.path.join(tempfile.gettempdir(), "drivemaps_perfis"))
+PERFIL_MAX_FICHEIROS = int(os.environ.get("PERFIL_MAX_FICHEIROS", "200"))
+PERFIL_ROTAS = [r.strip() for r in os.environ.get(
+    "PERFIL_ROTAS", "importacao.import_planilha,preview.preview,/api/"
+).split(",") if r.strip()]
+CABECALHO = "X-Perfil"
+TOP_FUNCOES = 30
+
+# Categorias do tempo próprio, pela ordem em que são testadas (padrões no caminho do ficheiro)
+CATEGORIAS = [
+    ("sessao", ("flask_session", "pickle", "cachelib")),
+    ("templates", ("jinja2", "markupsafe")),
+    ("provedores_io", ("requests", "urllib3", "http/client.py", "ssl.py", "socket.py",
+                       "app/utils/transport.py", "app/utils/geoapi.py", "app/utils/mapbox.py",
+                       "app/utils/google.py", "app/utils/limite_taxa.py")),
+    ("leitura_ficheiros", ("openpyxl", "xlrd", "et_xmlfile", "zipfile.py", "csv.py")),
+    ("pandas", ("pandas", "numpy")),
+    ("armazenamento", ("sqlite3", "redis", "app/utils/armazenamento.py", "app/utils/lista_enderecos.py",
+                       "app/utils/cache.py", "app/utils/jobs.py")),
+    ("aplicacao", ("app/",)),
+    ("flask", ("flask", "werkzeug")),
+]
+# Funções-chave: tempo acumulado (inclui o das funções que chamam)
+FUNCOES_CHAVE = {
+    "parser": ("app/utils/parser.py", None),
+    "normalizar": ("app/utils/helpers.py", "normalizar"),
+    "normalizar_serie": ("app/utils/pipeline.py", "normalizar_serie"),
+    "geocodificacao": ("app/utils/pipeline.py", "geocodifica"),
+    "deduplicacao": ("app/utils/pipeline.py", "deduplica"),
+    "ler_excel": ("pandas/io/excel/_base.py", "read_excel"),
+    "ler_csv": ("pandas/io/parsers/readers.py", "read_csv"),
+    "gravar_sessao": ("flask_session", "save_session"),
+    "render_template": ("flask/templating.py", "render_template"),
+}
+_ID_VALIDO = re.compile(r'^[\w.-]+$')
+
+
+def token_valido(valor: Optional[str]) -> bool:
+    return bool(PERFIL_TOKEN) and bool(valor) and hmac.compare_digest(str(valor), PERFIL_TOKEN)
+
+
+def rota_elegivel(endpoint: Optional[str], caminho: str) -> bool:
+    for rota in PERFIL_ROTAS:
+        if rota.startswith("/") and caminho.startswith(rota):
+            return True
+        if endpoint and rota == endpoint:
+            return True
+    return False
+
+
+def deve_perfilar(endpoint: Optional[str], caminho: str, cabecalho: Optional[str]) -> bool:
+    """Decide se o pedido é perfilado (cabeçalho com o token, ou amostragem se ativa)."""
+    if not rota_elegivel(endpoint, caminho):
+        return False
+    if token_valido(cabecalho):
+        return True
+    return PERFIL_ATIVO and random.random() < PERFIL_AMOSTRAGEM
+
+
+def _categoria_ficheiro(ficheiro: str) -> Optional[str]:
+    ficheiro = ficheiro.replace(os.sep, "/")
+    for nome, padroes in CATEGORIAS:
+        if any(p in ficheiro for p in padroes):
+            return nome
+    return None
+
+
+def _categoria_builtin(funcao: str) -> Optional[str]:
+    if "_thread.lock" in funcao or "acquire" in funcao or "'wait'" in funcao:
+        return "espera_threads"
+    if "sqlite3" in funcao:
+        return "armazenamento"
+    if "socket" in funcao or "_ssl" in funcao or "select" in funcao or "poll" in funcao:
+        return "provedores_io"
+    if "pickle" in funcao or "_pickle" in funcao:
+        return "sessao"
+    return None
+
+
+def _categoria(stats: dict, chave: tuple, memo: dict, profundidade: int = 0) -> str:
+    """
+    Categoria de uma função. Funções em C (ficheiro "~") e da biblioteca padrão sem
+    categoria própria herdam a do chamador que mais tempo lhes dedicou, até 6 níveis
+    (ex.: `re.sub` chamado por `helpers.normalizar` conta como "aplicacao").
+    """
+    if chave in memo:
+        return memo[chave]
+    ficheiro, _, funcao = chave
+    categoria = _categoria_builtin(funcao) if ficheiro == "~" else _categoria_ficheiro(ficheiro)
+    if categoria is None and profundidade < 6:
+        chamadores = stats[chave][4]
+        if chamadores:
+            principal = max(chamadores, key=lambda c: chamadores[c][2])
+            if principal in stats and principal != chave:
+                categoria = _categoria(stats, principal, memo, profundidade + 1)
+    categoria = categoria or "outros"
+    if profundidade == 0:
+        memo[chave] = categoria
+    return categoria
+
+
+def _nome(chave: tuple) -> str:
+    ficheiro, linha, funcao = chave
+    if ficheiro == "~":
+        return funcao
+    partes = ficheiro.replace(os.sep, "/").split("/")
+    return f"{'/'.join(partes[-2:])}:{linha}({funcao})"
+
+
+def resumir(perfil: cProfile.Profile) -> dict:
+    """Categorias, funções-chave e funções mais pesadas de um perfil."""
+    estatisticas = pstats.Stats(perfil)
+    stats = estatisticas.stats  # (ficheiro, linha, função) -> (cc, nc, tt, ct, chamadores)
+    categorias, memo = {}, {}
+    for chave, (_, _, proprio, _, _) in stats.items():
+        categoria = _categoria(stats, chave, memo)
+        categorias[categoria] = categorias.get(categoria, 0.0) + proprio
+
+    chave_funcoes = {}
+    for nome, (ficheiro, funcao) in FUNCOES_CHAVE.items():
+        total = 0.0
+        for (f, _, fn), (_, _, _, acumulado, _) in stats.items():
+            if ficheiro in f.replace(os.sep, "/") and (funcao is None or fn == funcao):
+                # Sem nome de função (módulo inteiro) conta só a função mais externa
+                total = max(total, acumulado) if funcao is None else total + acumulado
+        if total:
+            chave_funcoes[nome] = round(total, 4)
+
+    def top(indice):
+        ordenadas = sorted(stats.items(), key=lambda item: item[1][indice], reverse=True)[:TOP_FUNCOES]
+        return [{"funcao": _nome(chave), "chamadas": nc, "proprio_s": round(tt, 4), "acumulado_s": round(ct, 4)}
+                for chave, (_, nc, tt, ct, _) in ordenadas]
+
+    return {
+        "categorias_s": {k: round(v, 4) for k, v in sorted(categorias.items(), key=lambda kv: -kv[1])},
+        "funcoes_chave_s": chave_funcoes,
+        "top_proprio": top(2),
+        "top_acumulado": top(3),
+    }
+
+
+class Perfil:
+    """Perfil de um pedido: cProfile na thread do pedido mais relógio e CPU."""
+
+    def __init__(self, rota: str, metodo: str, caminho: str):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S}-{re.sub(r'[^A-Za-z0-9]+', '_', rota)}-{uuid.uuid4().hex[:8]}"
+        self.rota, self.metodo, self.caminho = rota, metodo, caminho
+        self.codigo = None
+        self._perfil = cProfile.Profile()
+
+    def iniciar(self) -> bool:
+        try:
+            self._perfil.enable()
+        except ValueError as e:  # outro profiler ativo nesta thread
+            logger.warning(f"Perfil {self.id} não iniciado: {e}")
+            return False
+        self._relogio, self._cpu_thread, self._cpu_processo = time.perf_counter(), time.thread_time(), time.process_time()
+        return True
+
+    def terminar(self) -> Optional[str]:
+        """Para o perfil e grava-o; devolve o id (None se falhou)."""
+        self._perfil.disable()
+        medidas = {
+            "relogio_s": round(time.perf_counter() - self._relogio, 4),
+            "cpu_thread_s": round(time.thread_time() - self._cpu_thread, 4),
+            "cpu_processo_s": round(time.process_time() - self._cpu_processo, 4),
+        }
+        try:
+            os.makedirs(PERFIL_DIR, exist_ok=True)
+            self._perfil.dump_stats(os.path.join(PERFIL_DIR, f"{self.id}.prof"))
+            resumo = {
+                "id": self.id, "rota": self.rota, "metodo": self.metodo, "caminho": self.caminho,
+                "codigo": self.codigo, "data": datetime.now().isoformat(timespec="seconds"), "pid": os.getpid(),
+                **medidas,
+                # Tempo de relógio sem CPU desta thread: I/O, locks e espera pelo pool de geocodificação
+                "espera_s": round(max(0.0, medidas["relogio_s"] - medidas["cpu_thread_s"]), 4),
+                **resumir(self._perfil),
+            }
+            temporario = os.path.join(PERFIL_DIR, f".{self.id}.json.tmp")
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(resumo, f, ensure_ascii=False, indent=1)
+            os.replace(temporario, os.path.join(PERFIL_DIR, f"{self.id}.json"))
+            logger.info(f"Perfil {self.id} gravado ({self.metodo} {self.caminho}: {medidas['relogio_s']}s de relógio, "
+                        f"{medidas['cpu_thread_s']}s de CPU).")
+            _limpar()
+            return self.id
+        except Exception as e:
+            logger.warning(f"Falha ao gravar o perfil {self.id}: {e}")
+            return None
+
+
+def _limpar() -> None:
+    resumos = sorted(glob.glob(os.path.join(PERFIL_DIR, "*.json")), key=os.path.getmtime, reverse=True)
+    for antigo in resumos[PERFIL_MAX_FICHEIROS:]:
+        base = antigo[:-len(".json")]
+        for caminho in (antigo, base + ".prof"):
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+
+def listar() -> list:
+    """Resumo curto dos perfis gravados, do mais recente para o mais antigo."""
+    perfis = []
+    for caminho in sorted(glob.glob(os.path.join(PERFIL_DIR, "*.json")), key=os.path.getmtime, reverse=True):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                resumo = json.load(f)
+        except (OSError, ValueError):
+            continue
+        perfis.append({campo: resumo.get(campo) for campo in (
+            "id", "data", "rota", "metodo", "caminho", "codigo", "relogio_s", "cpu_thread_s", "cpu_processo_s", "espera_s",
+        )})
+    return perfis
+
+
+def caminho(perfil_id: str, extensao: str) -> Optional[str]:
+    """Caminho do ficheiro de um perfil (`json` ou `prof`), ou None se não existir."""
+    if not _ID_VALIDO.match(perfil_id or "") or extensao not in ("json", "prof"):
+        return None
+    destino = os.path.join(PERFIL_DIR, f"{perfil_id}.{extensao}")
+    return destino if os.path.isfile(destino) else None
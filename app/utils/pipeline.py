@@ -0,0 +1,260 @@
+# app/utils/pipeline.py
+"""
+Pipeline colunar de importação: mantém as linhas num DataFrame desde o parsing até
+à exportação. Normalização, validação de CEP, cálculo de `cep_ok`/`rua_bate` e
+deduplicação são operações vetorizadas (pandas/NumPy). Os dicionários por linha só
+são criados na fronteira, para o template e para a sessão (`para_registos`).
+"""
+
+from __future__ import annotations
+
+import logging
+
+from . import tardio
+from .geocoder import valida_ruas_em_lote
+from .helpers import ABREVIATURAS_MORADA, PALAVRAS_IGNORADAS, CORES_IMPORTACAO, distancia_m, normalizar
+
+logger = logging.getLogger(__name__)
+
+np = tardio.modulo("numpy")
+pd = tardio.modulo("pandas")
+
+# Fallback numérico para garantir que as coordenadas são sempre floats
+FALLBACK_LAT, FALLBACK_LNG = 39.3999, -8.2245
+
+# Colunas (e ordem) de cada item da lista guardada na sessão
+COLUNAS_ITEM = [
+    "order_number", "address", "cep", "status_google", "latitude", "longitude",
+    "importacao_tipo", "cor", "postal_code_encontrado", "endereco_formatado",
+    "rua_google", "cep_ok", "rua_bate", "freguesia", "locality",
+]
+
+# Campos do resultado do geocoder -> colunas do item
+_CAMPOS_GEO = {
+    "postal_code_encontrado": "postal_code_encontrado",
+    "endereco_formatado": "endereco_formatado",
+    "route_encontrada": "rua_google",
+    "sublocality": "freguesia",
+    "locality": "locality",
+}
+
+_REGEX_ABREVIATURAS = r'\b(' + '|'.join(sorted(ABREVIATURAS_MORADA, key=len, reverse=True)) + r')\b'
+_REGEX_IGNORADAS = r'\b(' + '|'.join(PALAVRAS_IGNORADAS) + r')\b'
+# Raio (em metros) para considerar duas paragens geocodificadas o mesmo local
+DEDUP_RAIO_M = 25.0
+
+
+def normalizar_serie(serie: pd.Series) -> pd.Series:
+    """Versão vetorizada de `helpers.normalizar` (minúsculas, sem acentos, sem pontuação)."""
+    s = serie.fillna('').astype(str).str.lower().str.normalize('NFKD')
+    s = s.str.replace('[\u0300-\u036f]', '', regex=True)  # acentos (marcas combinantes)
+    s = s.str.replace(r'[^\w\s]', '', regex=True)
+    return s.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def cep_valido_serie(ceps: pd.Series) -> pd.Series:
+    """Versão vetorizada de `helpers.validar_cep` (formato xxxx-xxx)."""
+    return ceps.fillna('').astype(str).str.strip().str.fullmatch(r'\d{4}-\d{3}')
+
+
+def assinatura_serie(enderecos: pd.Series, ceps: pd.Series) -> pd.DataFrame:
+    """
+    Assinatura canónica de cada morada: colunas rua, numero (da porta) e cep (só dígitos).
+    Expande abreviaturas e ignora pontuação, por isso "R. X 12" e "Rua X, 12" coincidem.
+    """
+    partes = enderecos.fillna('').astype(str).str.split(',', n=2)
+    primeiro = normalizar_serie(partes.str[0])
+    segundo = normalizar_serie(partes.str[1])
+    primeiro = primeiro.str.replace(
+        _REGEX_ABREVIATURAS, lambda m: ABREVIATURAS_MORADA[m.group(1)], regex=True
+    )
+    numero = primeiro.str.extract(r'(?:^|\s)(\d+)$', expand=False)
+    numero_segundo = segundo.str.extract(r'^(?:no? ?)?(\d+[a-z]?)$', expand=False)
+    rua = primeiro.where(numero.isna(), primeiro.str.replace(r'\s*\d+$', '', regex=True))
+    rua = rua.str.replace(_REGEX_IGNORADAS, '', regex=True).str.replace(r'\s+', ' ', regex=True).str.strip()
+    return pd.DataFrame({
+        "rua": rua,
+        "numero": numero.fillna(numero_segundo).fillna(''),
+        "cep": ceps.fillna('').astype(str).str.replace(r'\D', '', regex=True),
+    }, index=enderecos.index)
+
+
+def geocodifica(empresa: str, entrada: pd.DataFrame, ao_geocodificar=None, inicio: int = 0) -> pd.DataFrame:
+    """
+    Geocodifica um DataFrame com colunas `address`, `cep`, `order_number` e devolve-o
+    com todas as colunas de COLUNAS_ITEM, já sem duplicados dentro do mesmo lote.
+    Linhas sem `order_number` recebem EMPRESA-n; `inicio` desloca essa numeração quando
+    o DataFrame é um bloco de um ficheiro maior (como em `parser.extrair_dataframe`).
+    `ao_geocodificar(itens, resultado)` é chamado à medida que cada endereço é geocodificado,
+    com os itens provisórios (ainda por deduplicar) das linhas que partilham esse endereço.
+    """
+    if entrada is None or entrada.empty:
+        return pd.DataFrame(columns=COLUNAS_ITEM)
+
+    df = entrada.reset_index(drop=True)
+    df["address"] = df["address"].fillna('').astype(str)
+    df["cep"] = df["cep"].fillna('').astype(str)
+    sem_id = df["order_number"].isna() | (df["order_number"].astype(str) == '')
+    ids_padrao = f"{(empresa or 'item').upper()}-" + pd.Series(np.arange(inicio + 1, inicio + len(df) + 1), index=df.index).astype(str)
+    df["order_number"] = df["order_number"].astype(str).where(~sem_id, ids_padrao)
+
+    logger.info(f"Geocodificando {len(df)} endereços para o formato '{empresa}'...")
+    ao_concluir = None
+    if ao_geocodificar is not None:
+        linhas = df[["order_number", "address", "cep"]].to_dict('records')
+
+        def ao_concluir(posicoes, resultado):
+            ao_geocodificar([item_provisorio(linhas[i], resultado, empresa) for i in posicoes], resultado)
+
+    resultados = valida_ruas_em_lote(df["address"].tolist(), df["cep"].tolist(), ao_concluir=ao_concluir)
+    geo = pd.DataFrame.from_records(
+        [{**{campo: r.get(campo, '') for campo in _CAMPOS_GEO},
+          "status": r.get('status', 'ERRO'),
+          "lat": (r.get('coordenadas') or {}).get('lat', FALLBACK_LAT),
+          "lng": (r.get('coordenadas') or {}).get('lng', FALLBACK_LNG)}
+         for r in resultados],
+        index=df.index,
+    )
+
+    df["status_google"] = geo["status"]
+    df["latitude"] = pd.to_numeric(geo["lat"], errors='coerce').fillna(FALLBACK_LAT).astype(float)
+    df["longitude"] = pd.to_numeric(geo["lng"], errors='coerce').fillna(FALLBACK_LNG).astype(float)
+    df["importacao_tipo"] = empresa
+    df["cor"] = CORES_IMPORTACAO.get(empresa, CORES_IMPORTACAO["default"])
+    for campo, coluna in _CAMPOS_GEO.items():
+        df[coluna] = geo[campo].fillna('').astype(str)
+    calcula_comparacoes(df)
+    return deduplica(df[COLUNAS_ITEM], considerar_tipo=True)
+
+
+def item_provisorio(linha: dict, resultado: dict, empresa: str) -> dict:
+    """
+    Item de uma única linha, construído assim que o seu endereço é geocodificado (para
+    mostrar resultados parciais). Mesmos campos e regras que as colunas de `geocodifica`.
+    """
+    coordenadas = resultado.get('coordenadas') or {}
+    item = {
+        "order_number": linha["order_number"], "address": linha["address"], "cep": linha["cep"],
+        "status_google": resultado.get('status', 'ERRO'),
+        "latitude": float(coordenadas.get('lat', FALLBACK_LAT)),
+        "longitude": float(coordenadas.get('lng', FALLBACK_LNG)),
+        "importacao_tipo": empresa,
+        "cor": CORES_IMPORTACAO.get(empresa, CORES_IMPORTACAO["default"]),
+    }
+    for campo, coluna in _CAMPOS_GEO.items():
+        item[coluna] = str(resultado.get(campo) or '')
+    item["cep_ok"] = item["cep"] == item["postal_code_encontrado"]
+    item["rua_bate"] = normalizar(item["address"].split(',')[0]) in normalizar(item["rua_google"])
+    return item
+
+
+def calcula_comparacoes(df: pd.DataFrame) -> None:
+    """Preenche `cep_ok` e `rua_bate` comparando a entrada com o resultado da geocodificação."""
+    df["cep_ok"] = df["cep"] == df["postal_code_encontrado"]
+    rua = normalizar_serie(df["address"].str.split(',', n=1).str[0])
+    rota = normalizar_serie(df["rua_google"])
+    # Teste de substring elemento a elemento: não há equivalente nativo em pandas
+    df["rua_bate"] = np.fromiter((a in b for a, b in zip(rua, rota)), dtype=bool, count=len(df))
+
+
+def _remove_duplicados(df: pd.DataFrame, chave: pd.Series, preferidos: pd.Series) -> pd.DataFrame:
+    """
+    Mantém um registo por valor de `chave` (linhas com chave nula nunca são removidas).
+    Entre duplicados vence o primeiro preferido (ou o primeiro de todos), ficando na
+    posição da primeira ocorrência do grupo.
+    """
+    if df.empty:
+        return df
+    pos = pd.Series(np.arange(len(df)), index=df.index)
+    chave = chave.where(chave.notna(), "#linha-" + pos.astype(str))
+    ordem_grupo = pos.groupby(chave).transform('min')
+    vencedores = (
+        pd.DataFrame({"chave": chave, "pref": (~preferidos).astype(int), "pos": pos, "ordem": ordem_grupo})
+        .sort_values(["pref", "pos"], kind="stable")
+        .drop_duplicates("chave")
+        .sort_values("ordem", kind="stable")
+    )
+    return df.loc[vencedores.index]
+
+
+def _grupos_mesmo_local(df: pd.DataFrame, assinatura: pd.DataFrame, tipo, raio_m: float) -> pd.Series:
+    """
+    Grupo de quase-duplicados de cada paragem (NaN se não tiver nenhum).
+    As paragens são primeiro agrupadas, de forma vetorizada, por número de porta,
+    CEP e tipo. Só dentro dos grupos com mais de uma paragem se aplicam a regra
+    das ruas (uma contém a outra) e a distância real. Esses grupos são pequenos.
+    Cada paragem junta-se à primeira paragem anterior, ainda não absorvida, que
+    cumpra os critérios.
+    """
+    candidatos = (
+        df["status_google"].astype(str).str.startswith("OK")
+        & (assinatura["rua"] != '') & df["latitude"].notna() & df["longitude"].notna()
+    )
+    bloco = assinatura["numero"] + '|' + assinatura["cep"] + ('|' + tipo if isinstance(tipo, pd.Series) else '')
+    bloco = bloco.where(candidatos)
+    bloco = bloco[bloco.duplicated(keep=False) & bloco.notna()]
+    grupos = {}
+    mantidas = {}  # bloco -> [(grupo, rua, lat, lng)] das paragens que ficam
+    for rotulo, chave, rua, lat, lng in zip(
+        bloco.index, bloco, assinatura["rua"].loc[bloco.index],
+        df["latitude"].loc[bloco.index].astype(float), df["longitude"].loc[bloco.index].astype(float),
+    ):  # pela ordem original
+        for grupo, rua_o, lat_o, lng_o in mantidas.get(chave, ()):
+            if (rua in rua_o or rua_o in rua) and distancia_m(lat, lng, lat_o, lng_o) <= raio_m:
+                grupos[rotulo] = grupo
+                break
+        else:
+            grupos[rotulo] = f"#local-{len(grupos)}"
+            mantidas.setdefault(chave, []).append((grupos[rotulo], rua, lat, lng))
+    return pd.Series(grupos, index=df.index, dtype=object)
+
+
+def deduplica(df: pd.DataFrame, considerar_tipo: bool = True, preferir_tipo: str = None,
+              raio_m: float = DEDUP_RAIO_M) -> pd.DataFrame:
+    """
+    Deduplicação vetorizada (a única implementação das regras de duplicados):
+      1. exata: endereço + CEP normalizados (+ tipo de importação);
+      2. mesmo local: paragens geocodificadas com o mesmo número de porta e CEP
+         (+ tipo), ruas canónicas em que uma contém a outra (ruas vazias nunca
+         coincidem) e a menos de `raio_m` metros (distância real, sem células).
+    Com `preferir_tipo`, o registo desse tipo prevalece sobre os restantes duplicados,
+    na posição da primeira ocorrência.
+    """
+    if df.empty:
+        return df.reset_index(drop=True)
+    preferidos = (
+        df["importacao_tipo"].astype(str).str.contains(preferir_tipo, regex=False)
+        if preferir_tipo else pd.Series(False, index=df.index)
+    )
+    tipo = df["importacao_tipo"].astype(str) if considerar_tipo else ''
+
+    chave_exata = normalizar_serie(df["address"]) + '|' + normalizar_serie(df["cep"]) + '|' + tipo
+    df = _remove_duplicados(df, chave_exata, preferidos)
+    preferidos = preferidos.loc[df.index]
+
+    assinatura = assinatura_serie(df["address"], df["cep"])
+    tipo = tipo.loc[df.index] if considerar_tipo else ''
+    chave_local = _grupos_mesmo_local(df, assinatura, tipo, raio_m)
+    return _remove_duplicados(df, chave_local, preferidos).reset_index(drop=True)
+
+
+def deduplica_registos(itens: list, considerar_tipo: bool = True) -> list:
+    """`deduplica` para uma lista de itens (dicionários com as colunas de COLUNAS_ITEM)."""
+    if not itens:
+        return []
+    return para_registos(deduplica(pd.DataFrame.from_records(itens, columns=COLUNAS_ITEM),
+                                   considerar_tipo=considerar_tipo))
+
+
+def reindexa_delnext(df: pd.DataFrame) -> pd.DataFrame:
+    """Renumera sequencialmente (D1, D2, ...) os registos Delnext, pela ordem atual."""
+    delnext = df["importacao_tipo"].astype(str).str.lower() == "delnext"
+    df.loc[delnext, "order_number"] = [f"D{i}" for i in range(1, int(delnext.sum()) + 1)]
+    return df
+
+
+def para_registos(df: pd.DataFrame) -> list:
+    """Converte o DataFrame final na lista de dicionários usada pela sessão e pelos templates."""
+    if df.empty:
+        return []
+    return df[COLUNAS_ITEM].to_dict('records')
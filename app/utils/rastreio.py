@@ -0,0 +1,68 @@
+# app/utils/rastreio.py
+"""
+Spans de geocodificação: cada pesquisa de endereço (direta ou reversa) produz um
+único registo de log estruturado, em vez de uma linha por provedor tentado.
+
+O registo leva em `extra={"span": {...}}` a consulta, o desfecho, a duração total e,
+por provedor, o estado devolvido e o tempo da chamada. No ficheiro de log (JSON) o
+span aparece como campo próprio; na consola fica resumido numa linha.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("app.geocodificacao")
+
+
+class _Resumo:
+    """Resumo textual dos provedores, construído apenas se a mensagem for formatada."""
+
+    def __init__(self, provedores: list):
+        self.provedores = provedores
+
+    def __str__(self) -> str:
+        return ", ".join(f"{p['provedor']} {p['status']} {p['duracao_ms']:.0f} ms" for p in self.provedores) or "-"
+
+
+class Span:
+    """Uma pesquisa de endereço: regista cada provedor tentado e emite o span no fim."""
+
+    def __init__(self, tipo: str, consulta: str):
+        self.tipo = tipo
+        self.consulta = consulta
+        self.provedores = []
+        self._inicio = time.monotonic()
+        self._lock = threading.Lock()  # no modo "hedged" os provedores terminam noutras threads
+
+    def provedor(self, nome: str, resultado, duracao: float) -> None:
+        """`resultado` é o dict devolvido pelo provedor ou a exceção que lançou."""
+        entrada = {"provedor": nome, "duracao_ms": round(duracao * 1000, 1)}
+        if isinstance(resultado, Exception):
+            entrada["status"] = "EXCEPTION"
+            entrada["erro"] = f"{type(resultado).__name__}: {resultado}"
+        else:
+            entrada["status"] = str((resultado or {}).get("status", "UNKNOWN"))
+        with self._lock:
+            self.provedores.append(entrada)
+
+    def ignorado(self, nome: str, motivo: str = "CIRCUIT_OPEN") -> None:
+        with self._lock:
+            self.provedores.append({"provedor": nome, "status": motivo, "duracao_ms": 0.0})
+
+    def fim(self, resultado: dict, origem: str = "provedores", vencedor: str = None) -> None:
+        """Emite o span: INFO se houve resultado, WARNING se todos os provedores falharam."""
+        status = str((resultado or {}).get("status", "UNKNOWN"))
+        ok = status.startswith("OK")
+        nivel = logging.INFO if ok else logging.WARNING
+        if not logger.isEnabledFor(nivel):
+            return
+        duracao_ms = round((time.monotonic() - self._inicio) * 1000, 1)
+        with self._lock:
+            provedores = list(self.provedores)
+        span = {
+            "tipo": self.tipo, "consulta": self.consulta, "origem": origem, "status": status,
+            "vencedor": vencedor, "duracao_ms": duracao_ms, "provedores": provedores,
+        }
+        logger.log(nivel, "%s '%s' -> %s via %s em %.1f ms [%s]", self.tipo, self.consulta, status,
+                   vencedor or origem, duracao_ms, _Resumo(provedores), extra={"span": span})
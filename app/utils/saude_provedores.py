@@ -0,0 +1,447 @@
+# app/utils/saude_provedores.py
+"""
+Saúde dos provedores de geocodificação e disjuntores (circuit breakers).
+Cada chamada a um provedor é registada como acerto ("OK..."), falha de pesquisa
+(NOT_FOUND, ZERO_RESULTS: o provedor respondeu mas não encontrou) ou erro
+(exceção, timeout, erro HTTP). Com isso mantêm-se, numa janela deslizante,
+latência média, taxa de erro e taxa de acerto por provedor. Respostas de
+configuração (API_KEY_MISSING, REQUEST_DENIED) não contam: o provedor não está
+configurado, não está em baixo.
+
+Disjuntores: um provedor com GEOCODER_BREAKER_FALHAS erros seguidos, ou com taxa de
+erro acima de GEOCODER_BREAKER_TAXA_ERRO na janela, é ignorado durante
+GEOCODER_BREAKER_ESPERA segundos. Terminada a espera, um único pedido (de qualquer
+worker) testa o provedor: se responder, o disjuntor fecha; se falhar, volta a abrir.
+
+Com GEOCODER_ORDEM_ADAPTATIVA=1, as cascatas do geocoder passam a ordenar os
+provedores por taxa de acerto / latência observadas.
+
+O estado é partilhado entre workers (variável GEOCODER_SAUDE_BACKEND):
+  - "sqlite": ficheiro SQLite local (padrão), partilhado pelos workers da máquina;
+  - "redis": o cliente partilhado de `armazenamento.cliente_redis()`, criado a partir
+    de REDIS_URL (o mesmo das sessões quando SESSION_TYPE=redis);
+  - "none": desativa os disjuntores e a ordenação adaptativa.
+Cada processo agrega as contagens localmente e sincroniza-as no máximo a cada
+GEOCODER_SAUDE_SINCRONIZACAO segundos; só a abertura/fecho de um disjuntor é gravada de imediato.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from .armazenamento import ConexoesSQLite, cliente_redis, texto
+
+logger = logging.getLogger(__name__)
+
+GEOCODER_SAUDE_BACKEND = os.environ.get("GEOCODER_SAUDE_BACKEND", "sqlite").lower()
+GEOCODER_SAUDE_PATH = os.environ.get("GEOCODER_SAUDE_PATH", os.path.join(os.getcwd(), "saude_provedores.sqlite3"))
+GEOCODER_SAUDE_JANELA = int(os.environ.get("GEOCODER_SAUDE_JANELA", "300"))  # janela deslizante (s)
+GEOCODER_SAUDE_SINCRONIZACAO = float(os.environ.get("GEOCODER_SAUDE_SINCRONIZACAO", "1.0"))
+GEOCODER_BREAKER_FALHAS = int(os.environ.get("GEOCODER_BREAKER_FALHAS", "5"))
+GEOCODER_BREAKER_TAXA_ERRO = float(os.environ.get("GEOCODER_BREAKER_TAXA_ERRO", "0.5"))
+GEOCODER_BREAKER_MIN_AMOSTRAS = int(os.environ.get("GEOCODER_BREAKER_MIN_AMOSTRAS", "20"))
+GEOCODER_BREAKER_ESPERA = float(os.environ.get("GEOCODER_BREAKER_ESPERA", "30"))
+# Tempo reservado ao pedido de teste: se não terminar, outro worker pode testar
+GEOCODER_BREAKER_SONDA = float(os.environ.get("GEOCODER_BREAKER_SONDA", "15"))
+GEOCODER_ORDEM_ADAPTATIVA = os.environ.get("GEOCODER_ORDEM_ADAPTATIVA", "0") == "1"
+
+ACERTO, FALHA, ERRO = "acerto", "falha", "erro"
+# Respostas em que o provedor funcionou mas não encontrou o endereço. RATE_LIMITED vem
+# do limite de pedidos local (`limite_taxa`) e não indica que o provedor esteja em baixo
+STATUS_FALHA = {"NOT_FOUND", "ZERO_RESULTS", "RATE_LIMITED"}
+# Provedor sem chave de API ou com a chave recusada: não é registado nem abre o disjuntor
+STATUS_CONFIGURACAO = {"API_KEY_MISSING", "REQUEST_DENIED"}
+IGNORADO = "ignorado"
+PREFIXO = "saude:v1:"
+# A janela é dividida em baldes de tempo; expiram baldes inteiros
+_BALDE_SEGUNDOS = 10
+_CAMPOS = ("acertos", "falhas", "erros", "latencia")
+
+
+def _balde(instante: float) -> int:
+    return int(instante // _BALDE_SEGUNDOS)
+
+
+def classificar(resultado) -> str:
+    """Acerto, falha de pesquisa, erro ou ignorado, a partir do dict devolvido por um provedor."""
+    status = str((resultado or {}).get("status", "")) if isinstance(resultado, dict) else ""
+    if status.startswith("OK"):
+        return ACERTO
+    if status in STATUS_FALHA:
+        return FALHA
+    if status in STATUS_CONFIGURACAO:
+        return IGNORADO
+    return ERRO
+
+
+def nome_provedor(funcao: Callable) -> str:
+    """Nome do provedor a partir do módulo da função (geoapi, mapbox, google, ...)."""
+    return funcao.__module__.split('.')[-1]
+
+
+class SQLiteBackend:
+    """Contagens por balde de tempo e fim da espera de cada disjuntor, num ficheiro SQLite."""
+
+    def __init__(self, caminho: str):
+        self._conexao = ConexoesSQLite(caminho, esquema=(
+            "CREATE TABLE IF NOT EXISTS saude_baldes ("
+            " chave TEXT NOT NULL, balde INTEGER NOT NULL, acertos INTEGER NOT NULL DEFAULT 0,"
+            " falhas INTEGER NOT NULL DEFAULT 0, erros INTEGER NOT NULL DEFAULT 0,"
+            " latencia REAL NOT NULL DEFAULT 0, PRIMARY KEY (chave, balde));"
+            "CREATE TABLE IF NOT EXISTS disjuntores ("
+            " provedor TEXT PRIMARY KEY, aberto_ate REAL NOT NULL);"
+        ))
+
+    def acumular(self, contagens: Dict[tuple, list], desde_balde: int) -> None:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO saude_baldes (chave, balde, acertos, falhas, erros, latencia) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(chave, balde) DO UPDATE SET acertos = acertos + excluded.acertos,"
+                " falhas = falhas + excluded.falhas, erros = erros + excluded.erros,"
+                " latencia = latencia + excluded.latencia",
+                [(chave, balde, *valores) for (chave, balde), valores in contagens.items()]
+            )
+            conn.execute("DELETE FROM saude_baldes WHERE balde < ?", (desde_balde,))
+
+    def janela(self, desde_balde: int) -> Dict[str, list]:
+        return {chave: list(valores) for chave, *valores in self._conexao().execute(
+            "SELECT chave, SUM(acertos), SUM(falhas), SUM(erros), SUM(latencia) FROM saude_baldes"
+            " WHERE balde >= ? GROUP BY chave", (desde_balde,)
+        )}
+
+    def disjuntores(self) -> Dict[str, float]:
+        return dict(self._conexao().execute("SELECT provedor, aberto_ate FROM disjuntores"))
+
+    def abrir(self, provedor: str, ate: float) -> None:
+        self._conexao().execute(
+            "INSERT OR REPLACE INTO disjuntores (provedor, aberto_ate) VALUES (?, ?)", (provedor, ate)
+        )
+
+    def fechar(self, provedor: str, chaves: List[str]) -> None:
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM disjuntores WHERE provedor = ?", (provedor,))
+            # Os erros que abriram o disjuntor não voltam a contar depois da recuperação
+            conn.executemany("DELETE FROM saude_baldes WHERE chave = ?", [(c,) for c in chaves])
+
+    def reservar_sonda(self, provedor: str, agora: float, duracao: float) -> bool:
+        cursor = self._conexao().execute(
+            "UPDATE disjuntores SET aberto_ate = ? WHERE provedor = ? AND aberto_ate <= ?",
+            (agora + duracao, provedor, agora)
+        )
+        return cursor.rowcount == 1
+
+
+class RedisBackend:
+    """Contagens num hash por chave e balde (com expiração) e um valor por disjuntor."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    @staticmethod
+    def _chave_balde(chave: str, balde: int) -> str:
+        return f"{PREFIXO}balde:{chave}:{balde}"
+
+    @staticmethod
+    def _chave_disjuntor(provedor: str) -> str:
+        return f"{PREFIXO}disjuntor:{provedor}"
+
+    def acumular(self, contagens: Dict[tuple, list], desde_balde: int) -> None:
+        pipe = self.cliente.pipeline(transaction=False)
+        for (chave, balde), valores in contagens.items():
+            chave_balde = self._chave_balde(chave, balde)
+            for campo, valor in zip(_CAMPOS[:3], valores[:3]):
+                if valor:
+                    pipe.hincrby(chave_balde, campo, valor)
+            pipe.hincrbyfloat(chave_balde, "latencia", valores[3])
+            pipe.expire(chave_balde, GEOCODER_SAUDE_JANELA + 2 * _BALDE_SEGUNDOS)
+            pipe.sadd(PREFIXO + "chaves", chave)
+        pipe.execute()
+
+    def janela(self, desde_balde: int) -> Dict[str, list]:
+        chaves = sorted(texto(c) for c in self.cliente.smembers(PREFIXO + "chaves"))
+        baldes = range(desde_balde, _balde(time.time()) + 1)
+        pipe = self.cliente.pipeline(transaction=False)
+        for chave in chaves:
+            for balde in baldes:
+                pipe.hmget(self._chave_balde(chave, balde), *_CAMPOS)
+        respostas = iter(pipe.execute())
+        janela = {}
+        for chave in chaves:
+            totais = [0, 0, 0, 0.0]
+            for _ in baldes:
+                for i, valor in enumerate(next(respostas)):
+                    if valor is not None:
+                        totais[i] += float(valor) if i == 3 else int(valor)
+            if any(totais):
+                janela[chave] = totais
+        return janela
+
+    def disjuntores(self) -> Dict[str, float]:
+        chaves = [texto(c) for c in self.cliente.scan_iter(match=PREFIXO + "disjuntor:*")]
+        if not chaves:
+            return {}
+        valores = self.cliente.mget(chaves)
+        prefixo = len(PREFIXO + "disjuntor:")
+        return {chave[prefixo:]: float(valor) for chave, valor in zip(chaves, valores) if valor is not None}
+
+    def abrir(self, provedor: str, ate: float) -> None:
+        # Expira bem depois da espera: um disjuntor esquecido não fica aberto para sempre
+        self.cliente.set(self._chave_disjuntor(provedor), ate,
+                         ex=int(GEOCODER_BREAKER_ESPERA + GEOCODER_BREAKER_SONDA + GEOCODER_SAUDE_JANELA))
+
+    def fechar(self, provedor: str, chaves: List[str]) -> None:
+        atual = _balde(time.time())
+        baldes = range(atual - GEOCODER_SAUDE_JANELA // _BALDE_SEGUNDOS - 1, atual + 1)
+        self.cliente.delete(self._chave_disjuntor(provedor),
+                            *[self._chave_balde(c, b) for c in chaves for b in baldes])
+
+    def reservar_sonda(self, provedor: str, agora: float, duracao: float) -> bool:
+        import redis
+        chave = self._chave_disjuntor(provedor)
+        with self.cliente.pipeline() as pipe:
+            try:
+                pipe.watch(chave)
+                valor = pipe.get(chave)
+                if valor is None or float(valor) > agora:
+                    return False
+                pipe.multi()
+                pipe.set(chave, agora + duracao, ex=int(duracao + GEOCODER_BREAKER_ESPERA + GEOCODER_SAUDE_JANELA))
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False  # outro worker reservou o teste primeiro
+
+
+class _Estado:
+    """Estado local do processo: contagens por enviar, erros seguidos e cópia do estado partilhado."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.pendentes = defaultdict(lambda: [0, 0, 0, 0.0])  # (chave, balde) -> contagens
+        self.erros_seguidos = defaultdict(int)
+        self.sondas = set()           # provedores em teste por este processo
+        self.janela = {}              # chave -> [acertos, falhas, erros, latência total]
+        self.disjuntores = {}         # provedor -> fim da espera (timestamp)
+        self.sincronizado = 0.0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_estado = None
+_estado_lock = threading.Lock()
+
+
+def get_backend():
+    """Devolve o backend configurado (criado na primeira utilização), ou None se desativado."""
+    global _backend
+    if _backend is None and GEOCODER_SAUDE_BACKEND != "none":
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    if GEOCODER_SAUDE_BACKEND == "redis":
+                        cliente = cliente_redis()
+                        if cliente is None:
+                            raise RuntimeError("GEOCODER_SAUDE_BACKEND=redis mas nenhuma ligação Redis configurada")
+                        _backend = RedisBackend(cliente)
+                    else:
+                        _backend = SQLiteBackend(GEOCODER_SAUDE_PATH)
+                    logger.info(f"Saúde dos provedores ativa (backend: {type(_backend).__name__}).")
+                except Exception as e:
+                    logger.error(f"Falha ao iniciar a saúde dos provedores: {e}. Disjuntores desativados.")
+                    _backend = False
+    return _backend or None
+
+
+def _get_estado() -> _Estado:
+    """Estado local, recriado após um fork (as contagens do processo pai não são reenviadas)."""
+    global _estado
+    if _estado is None or _estado.pid != os.getpid():
+        with _estado_lock:
+            if _estado is None or _estado.pid != os.getpid():
+                _estado = _Estado()
+    return _estado
+
+
+def _chaves_do_provedor(provedor: str) -> List[str]:
+    return [provedor, provedor + "/reverso"]
+
+
+def _abrir(provedor: str, motivo: str) -> None:
+    backend = get_backend()
+    ate = time.time() + GEOCODER_BREAKER_ESPERA
+    try:
+        backend.abrir(provedor, ate)
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar o disjuntor de {provedor}: {e}")
+    estado = _get_estado()
+    estado.disjuntores[provedor] = ate
+    estado.erros_seguidos[provedor] = 0
+    logger.warning(f"Disjuntor de {provedor} aberto por {GEOCODER_BREAKER_ESPERA:g}s ({motivo}).")
+
+
+def _fechar(provedor: str) -> None:
+    try:
+        get_backend().fechar(provedor, _chaves_do_provedor(provedor))
+    except Exception as e:
+        logger.warning(f"Não foi possível fechar o disjuntor de {provedor}: {e}")
+    estado = _get_estado()
+    estado.disjuntores.pop(provedor, None)
+    for chave in _chaves_do_provedor(provedor):
+        estado.janela.pop(chave, None)
+    logger.info(f"Disjuntor de {provedor} fechado: o provedor voltou a responder.")
+
+
+def _sincronizar(forcar: bool = False) -> None:
+    """Envia as contagens locais, lê a janela e os disjuntores partilhados e avalia a taxa de erro."""
+    estado = _get_estado()
+    agora = time.time()
+    with _estado_lock:
+        if not forcar and agora - estado.sincronizado < GEOCODER_SAUDE_SINCRONIZACAO:
+            return
+        estado.sincronizado = agora
+        pendentes, estado.pendentes = dict(estado.pendentes), defaultdict(lambda: [0, 0, 0, 0.0])
+    backend = get_backend()
+    desde = _balde(agora - GEOCODER_SAUDE_JANELA)
+    try:
+        if pendentes:
+            backend.acumular(pendentes, desde)
+        estado.janela = backend.janela(desde)
+        estado.disjuntores = backend.disjuntores()
+    except Exception as e:
+        logger.warning(f"Falha ao sincronizar a saúde dos provedores: {e}")
+        return
+
+    totais = defaultdict(lambda: [0, 0])  # provedor -> [chamadas, erros]
+    for chave, (acertos, falhas, erros, _) in estado.janela.items():
+        provedor = chave.split("/")[0]
+        totais[provedor][0] += acertos + falhas + erros
+        totais[provedor][1] += erros
+    for provedor, (chamadas, erros) in totais.items():
+        if (provedor not in estado.disjuntores and chamadas >= GEOCODER_BREAKER_MIN_AMOSTRAS
+                and erros / chamadas >= GEOCODER_BREAKER_TAXA_ERRO):
+            _abrir(provedor, f"{erros}/{chamadas} erros na janela de {GEOCODER_SAUDE_JANELA}s")
+
+
+def disponivel(provedor: str) -> bool:
+    """
+    Indica se o provedor pode ser chamado. Com o disjuntor aberto devolve False até ao fim
+    da espera; depois disso, devolve True a um único chamador (o pedido de teste).
+    """
+    if get_backend() is None:
+        return True
+    _sincronizar()
+    estado = _get_estado()
+    ate = estado.disjuntores.get(provedor)
+    if ate is None:
+        return True
+    agora = time.time()
+    if ate > agora:
+        return False
+    try:
+        reservado = get_backend().reservar_sonda(provedor, agora, GEOCODER_BREAKER_SONDA)
+    except Exception as e:
+        logger.warning(f"Falha ao reservar o teste do provedor {provedor}: {e}")
+        return False
+    if reservado:
+        estado.sondas.add(provedor)
+        estado.disjuntores[provedor] = agora + GEOCODER_BREAKER_SONDA
+        logger.info(f"Disjuntor de {provedor}: a testar o provedor com um pedido.")
+    return reservado
+
+
+def registar(provedor: str, resultado, duracao: float, reverso: bool = False) -> None:
+    """Regista o desfecho de uma chamada (`resultado` é o dict devolvido, ou a exceção)."""
+    if get_backend() is None:
+        return
+    desfecho = ERRO if isinstance(resultado, BaseException) else classificar(resultado)
+    estado = _get_estado()
+    if desfecho == IGNORADO:
+        with _estado_lock:
+            estado.sondas.discard(provedor)
+        return
+    chave = provedor + ("/reverso" if reverso else "")
+    with _estado_lock:
+        contagens = estado.pendentes[(chave, _balde(time.time()))]
+        contagens[(ACERTO, FALHA, ERRO).index(desfecho)] += 1
+        contagens[3] += duracao
+        if desfecho == ERRO:
+            estado.erros_seguidos[provedor] += 1
+            erros_seguidos = estado.erros_seguidos[provedor]
+        else:
+            estado.erros_seguidos[provedor] = 0
+            erros_seguidos = 0
+        em_teste = provedor in estado.sondas
+        estado.sondas.discard(provedor)
+
+    if em_teste:
+        if desfecho == ERRO:
+            _abrir(provedor, "o pedido de teste falhou")
+        else:
+            _fechar(provedor)
+    elif erros_seguidos >= GEOCODER_BREAKER_FALHAS and provedor not in estado.disjuntores:
+        _abrir(provedor, f"{erros_seguidos} erros seguidos")
+    _sincronizar()
+
+
+def _indicadores(contagens: list) -> dict:
+    acertos, falhas, erros, latencia = contagens
+    chamadas = acertos + falhas + erros
+    return {
+        "chamadas": chamadas, "acertos": acertos, "falhas": falhas, "erros": erros,
+        "taxa_acerto": round(acertos / chamadas, 4) if chamadas else None,
+        "taxa_erro": round(erros / chamadas, 4) if chamadas else None,
+        "latencia_media_ms": round(1000 * latencia / chamadas, 1) if chamadas else None,
+    }
+
+
+def ordenar(funcoes: list, reverso: bool = False) -> list:
+    """
+    Com GEOCODER_ORDEM_ADAPTATIVA=1, ordena os provedores pela taxa de acerto por segundo
+    de latência observada na janela. Provedores ainda com poucas amostras mantêm a sua
+    posição configurada; só os restantes trocam de lugar entre si.
+    """
+    if not GEOCODER_ORDEM_ADAPTATIVA or get_backend() is None:
+        return list(funcoes)
+    _sincronizar()
+    janela = _get_estado().janela
+    pontuacoes = {}
+    for i, funcao in enumerate(funcoes):
+        chave = nome_provedor(funcao) + ("/reverso" if reverso else "")
+        contagens = janela.get(chave)
+        if contagens and sum(contagens[:3]) >= GEOCODER_BREAKER_MIN_AMOSTRAS:
+            chamadas = sum(contagens[:3])
+            latencia = max(contagens[3] / chamadas, 0.001)
+            pontuacoes[i] = (contagens[0] / chamadas) / latencia
+    posicoes = sorted(pontuacoes)
+    melhores = sorted(posicoes, key=lambda i: -pontuacoes[i])
+    ordem = list(funcoes)
+    for posicao, i in zip(posicoes, melhores):
+        ordem[posicao] = funcoes[i]
+    return ordem
+
+
+def estatisticas() -> dict:
+    """Indicadores da janela (todos os workers) e estado do disjuntor de cada provedor."""
+    if get_backend() is None:
+        return {"ativo": False, "provedores": {}}
+    _sincronizar(forcar=True)
+    estado = _get_estado()
+    agora = time.time()
+    provedores = {}
+    for chave in sorted(set(estado.janela) | set(estado.disjuntores)):
+        info = _indicadores(estado.janela.get(chave, [0, 0, 0, 0.0]))
+        ate = estado.disjuntores.get(chave.split("/")[0])
+        info["disjuntor"] = "fechado" if ate is None else ("aberto" if ate > agora else "semiaberto")
+        info["aberto_ate"] = ate
+        provedores[chave] = info
+    return {
+        "ativo": True, "janela_segundos": GEOCODER_SAUDE_JANELA,
+        "ordem_adaptativa": GEOCODER_ORDEM_ADAPTATIVA, "provedores": provedores,
+    }
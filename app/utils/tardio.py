@@ -0,0 +1,78 @@
+# app/utils/tardio.py
+"""
+Importação tardia dos módulos pesados (pandas, NumPy).
+
+`pd = tardio.modulo("pandas")` devolve um substituto que só importa o módulo no
+primeiro acesso a um atributo (`pd.DataFrame`, `np.nan`, ...). Assim um worker que
+só serve `/`, `/preview` ou `/api/*` arranca sem pagar o carregamento do pandas.
+Os módulos que o usam têm `from __future__ import annotations`, para que anotações
+como `df: pd.DataFrame` não forcem a importação ao definir as funções.
+
+ARRANQUE_TARDIO=0 volta a importar tudo ao carregar os módulos.
+
+Com o gunicorn em modo preload (GUNICORN_PRELOAD=1, ver gunicorn.conf.py), o processo
+principal chama `precarregar()` antes de criar os workers: os módulos e o índice de
+códigos postais ficam carregados uma só vez e são partilhados por cópia-em-escrita.
+"""
+
+import importlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ARRANQUE_TARDIO = os.environ.get("ARRANQUE_TARDIO", "1") == "1"
+
+_registados = {}
+
+
+class ModuloTardio:
+    """Substituto de um módulo, importado no primeiro acesso a um atributo."""
+
+    def __init__(self, nome: str):
+        self._nome = nome
+        self._modulo = None
+
+    def carregar(self):
+        if self._modulo is None:
+            inicio = time.perf_counter()
+            # import_module é seguro entre threads (lock por módulo no importador)
+            self._modulo = importlib.import_module(self._nome)
+            logger.debug("Módulo %s importado em %.0f ms.", self._nome, (time.perf_counter() - inicio) * 1000)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._modulo or self.carregar(), atributo)
+
+    def __repr__(self) -> str:
+        estado = "carregado" if self._modulo is not None else "por carregar"
+        return f"<módulo tardio '{self._nome}' ({estado})>"
+
+
+def modulo(nome: str):
+    """Módulo `nome`, importado já (ARRANQUE_TARDIO=0) ou no primeiro uso."""
+    if not ARRANQUE_TARDIO:
+        return importlib.import_module(nome)
+    substituto = _registados.get(nome)
+    if substituto is None:
+        substituto = _registados[nome] = ModuloTardio(nome)
+    return substituto
+
+
+def precarregar() -> None:
+    """
+    Carrega já tudo o que é adiado: os módulos registados, o openpyxl (leitura e
+    escrita de XLSX) e o índice de códigos postais. Usado antes do fork dos workers.
+    """
+    inicio = time.perf_counter()
+    for substituto in list(_registados.values()):
+        substituto.carregar()
+    for nome in ("openpyxl",):
+        try:
+            importlib.import_module(nome)
+        except ImportError:
+            pass
+    from . import codigos_postais
+    codigos_postais.get_indice()
+    logger.info(f"Módulos pesados pré-carregados em {time.perf_counter() - inicio:.2f}s.")
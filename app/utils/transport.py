@@ -0,0 +1,154 @@
+# app/utils/transport.py
+"""
+Transporte HTTP partilhado pelos provedores de geocodificação (GeoAPI, Mapbox, Google).
+Mantém uma `requests.Session` por provedor, com pool de ligações keep-alive,
+retry com backoff e timeouts (ligação, leitura) configurados por provedor.
+
+Cada parâmetro pode ser ajustado por variável de ambiente, ex.:
+  TRANSPORT_MAPBOX_POOL=20, TRANSPORT_GOOGLE_READ_TIMEOUT=10, TRANSPORT_GEOAPI_RETRIES=0
+
+Falhas de ligação não são repetidas por omissão (TRANSPORT_<PROVEDOR>_CONNECT_RETRIES=0):
+todos os provedores estão atrás da cascata do geocoder, cujos disjuntores e o modo
+"hedged" já passam ao provedor seguinte; repetir aqui só atrasaria essa decisão.
+
+TRANSPORT_<PROVEDOR>_URL substitui o esquema e o anfitrião dos pedidos desse provedor,
+ex.: TRANSPORT_GOOGLE_URL=http://127.0.0.1:8765 para usar o servidor simulado
+(`python -m benchmarks.servidor_provedores`). As respostas podem ainda ser gravadas e
+reproduzidas sem rede (ver `gravacao`).
+"""
+
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import gravacao, limite_taxa
+
+logger = logging.getLogger(__name__)
+
+# O pool acompanha, por omissão, o limite de chamadas simultâneas por provedor do geocoder
+_POOL_PADRAO = int(os.environ.get("GEOCODER_PROVIDER_CONCURRENCY", "8"))
+
+PROVIDERS = {
+    "geoapi": {"pool": _POOL_PADRAO, "connect_timeout": 3, "read_timeout": 6, "retries": 2, "connect_retries": 0},
+    "mapbox": {"pool": _POOL_PADRAO, "connect_timeout": 3, "read_timeout": 7, "retries": 2, "connect_retries": 0},
+    "google": {"pool": _POOL_PADRAO, "connect_timeout": 3, "read_timeout": 7, "retries": 1, "connect_retries": 0},
+}
+BACKOFF_FACTOR = float(os.environ.get("TRANSPORT_BACKOFF", "0.3"))
+# Erros transitórios do lado do servidor; 429 fica de fora do retry imediato:
+# é tratado em `get`, que adia os pedidos seguintes através de `limite_taxa`
+RETRY_STATUS = (500, 502, 503, 504)
+
+_sessoes = {}
+_sessoes_lock = threading.Lock()
+_sessoes_pid = os.getpid()
+
+
+def configuracao(provider: str) -> dict:
+    """Configuração efetiva de um provedor (valores padrão + variáveis de ambiente)."""
+    base = PROVIDERS.get(provider, PROVIDERS["google"])
+    prefixo = f"TRANSPORT_{provider.upper()}_"
+    return {
+        "pool": int(os.environ.get(prefixo + "POOL", base["pool"])),
+        "connect_timeout": float(os.environ.get(prefixo + "CONNECT_TIMEOUT", base["connect_timeout"])),
+        "read_timeout": float(os.environ.get(prefixo + "READ_TIMEOUT", base["read_timeout"])),
+        "retries": int(os.environ.get(prefixo + "RETRIES", base["retries"])),
+        "connect_retries": int(os.environ.get(prefixo + "CONNECT_RETRIES", base["connect_retries"])),
+        "url": os.environ.get(prefixo + "URL", "").rstrip("/"),
+    }
+
+
+def _cria_sessao(provider: str) -> requests.Session:
+    cfg = configuracao(provider)
+    retry = Retry(
+        total=cfg["retries"],
+        connect=cfg["connect_retries"],
+        # Timeouts de leitura não são repetidos: multiplicariam a latência da cascata
+        # e devem continuar a chegar aos provedores como requests.Timeout
+        read=False,
+        status=cfg["retries"],
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, cfg["pool"]), max_retries=retry)
+    sessao = requests.Session()
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    logger.info(f"Sessão HTTP criada para '{provider}' (pool={cfg['pool']}, retries={cfg['retries']}, "
+                f"connect_retries={cfg['connect_retries']}).")
+    return sessao
+
+
+def get_session(provider: str) -> requests.Session:
+    """Devolve a sessão partilhada do provedor, recriando-a após um fork do processo."""
+    global _sessoes_pid
+    if _sessoes_pid != os.getpid():
+        # Ligações herdadas do processo pai não podem ser partilhadas entre workers
+        with _sessoes_lock:
+            if _sessoes_pid != os.getpid():
+                _sessoes.clear()
+                _sessoes_pid = os.getpid()
+    sessao = _sessoes.get(provider)
+    if sessao is None:
+        with _sessoes_lock:
+            sessao = _sessoes.get(provider)
+            if sessao is None:
+                sessao = _sessoes[provider] = _cria_sessao(provider)
+    return sessao
+
+
+def get(provider: str, url: str, params: dict = None) -> requests.Response:
+    """
+    GET através da sessão do provedor, com os timeouts de ligação/leitura configurados.
+    Cada pedido reserva antes um token do limite de pedidos do provedor (`limite_taxa`);
+    uma resposta 429 adia as reservas de todos os workers e o pedido é repetido uma vez.
+    Levanta `limite_taxa.LimiteExcedido` se a fila de espera for demasiado longa.
+    """
+    cfg = configuracao(provider)
+    limite_taxa.aguardar(provider)
+    resposta = _envia(provider, url, params, cfg)
+    if resposta.status_code == 429:
+        limite_taxa.penalizar(provider, limite_taxa.retry_after(resposta))
+        limite_taxa.aguardar(provider)
+        resposta = _envia(provider, url, params, cfg)
+    return resposta
+
+
+def _redireciona(url: str, base: str) -> str:
+    """Troca o esquema e o anfitrião de `url` pelos de `base` (mantém caminho e query)."""
+    destino = urlsplit(base)
+    partes = urlsplit(url)
+    return urlunsplit((destino.scheme, destino.netloc, destino.path + partes.path, partes.query, ""))
+
+
+def _envia(provider: str, url: str, params: dict, cfg: dict) -> requests.Response:
+    """Um pedido GET: reproduzido de uma gravação, ou enviado (e gravado, se pedido)."""
+    modo = gravacao.modo()
+    if modo == gravacao.REPRODUZIR:
+        resposta = gravacao.reproduzir(provider, url, params)
+        if resposta is not None:
+            return resposta
+    destino = _redireciona(url, cfg["url"]) if cfg["url"] else url
+    inicio = time.monotonic()
+    resposta = get_session(provider).get(
+        destino, params=params, timeout=(cfg["connect_timeout"], cfg["read_timeout"])
+    )
+    if modo == gravacao.GRAVAR:
+        # Gravado com o URL original: a reprodução não depende do servidor usado
+        gravacao.gravar(provider, url, params, resposta, time.monotonic() - inicio)
+    return resposta
+
+
+def fechar_sessoes() -> None:
+    """Fecha todas as sessões abertas (útil em testes e no encerramento de workers)."""
+    with _sessoes_lock:
+        for sessao in _sessoes.values():
+            sessao.close()
+        _sessoes.clear()
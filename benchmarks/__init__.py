@@ -0,0 +1,27 @@
+# benchmarks/__init__.py
+"""
+Micro-benchmarks offline do pipeline de importação (parser, normalização,
+deduplicação, geocoder com provedores simulados e exportação CSV).
+
+Uso:
+    python -m benchmarks                          # 100, 1k, 10k e 100k linhas
+    python -m benchmarks --tamanhos 1000 --casos parser,dedup_pipeline
+    python -m benchmarks --latencia-ms 20 --casos geocoder --tamanhos 1000
+    python -m benchmarks --provedores http --casos geocoder   # via servidor_provedores
+    python -m benchmarks --guardar-baseline       # grava benchmarks/baseline.json
+
+Com uma baseline gravada, cada execução compara o débito (linhas/s) e o pico de
+memória com ela e termina com código 1 se algum caso piorar além da tolerância.
+"""
+
+import os
+
+# Tudo em memória e sem estado partilhado: o cache de geocodificação, os disjuntores e o
+# limite de pedidos mediriam o armazenamento local e não o código. Definido antes de
+# importar `app.utils`, que lê estas variáveis ao carregar os módulos.
+_PADROES = {"GEOCACHE_BACKEND": "none", "GEOCODER_SAUDE_BACKEND": "none", "LIMITE_TAXA_BACKEND": "none"}
+# Variáveis definidas aqui (e não pelo utilizador): o teste de carga retira-as do
+# ambiente da aplicação que arranca, que deve correr com a configuração normal
+VARIAVEIS_DEFINIDAS = {nome for nome in _PADROES if nome not in os.environ}
+for _nome in VARIAVEIS_DEFINIDAS:
+    os.environ[_nome] = _PADROES[_nome]
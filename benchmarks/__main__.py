@@ -0,0 +1,167 @@
+# benchmarks/__main__.py
+"""
+Executa os micro-benchmarks e compara com a baseline gravada.
+
+O tempo é medido sem `tracemalloc` (melhor de várias repetições) e o pico de
+memória numa execução à parte com `tracemalloc` ativo, que abranda o código mas
+contabiliza também as alocações do NumPy/pandas.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from . import dados
+from .casos import CASOS
+
+BASELINE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+TAMANHOS_PADRAO = "100,1000,10000,100000"
+# Acima deste tempo por execução não se fazem mais repetições do mesmo caso
+TEMPO_MAX_REPETICOES = 5.0
+# Casos rápidos repetem-se até somarem este tempo (no máximo REPETICOES_MAX vezes),
+# para que o ruído de uma execução de milissegundos não pareça uma regressão
+TEMPO_MIN_TOTAL = 1.0
+REPETICOES_MAX = 200
+
+
+def _mede(funcao, repeticoes: int) -> dict:
+    tempos = []
+    while len(tempos) < REPETICOES_MAX:
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+        if tempos[-1] > TEMPO_MAX_REPETICOES:
+            break
+        if len(tempos) >= max(1, repeticoes) and sum(tempos) >= TEMPO_MIN_TOTAL:
+            break
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"segundos": min(tempos), "pico_bytes": pico}
+
+
+def executar(casos: list, tamanhos: list, opcoes: dict, repeticoes: int) -> dict:
+    resultados = {}
+    for n in tamanhos:
+        linhas = dados.moradas(n)
+        for nome in casos:
+            funcao = CASOS[nome](linhas, opcoes)
+            medida = _mede(funcao, repeticoes)
+            resultados[f"{nome}/{n}"] = {
+                "linhas": n,
+                "segundos": round(medida["segundos"], 6),
+                "linhas_s": round(n / medida["segundos"], 1) if medida["segundos"] > 0 else None,
+                "pico_mb": round(medida["pico_bytes"] / 1024 / 1024, 3),
+            }
+            r = resultados[f"{nome}/{n}"]
+            print(f"{nome:<18} {n:>8} linhas  {r['segundos']:>10.4f}s  "
+                  f"{r['linhas_s'] or 0:>12,.0f} linhas/s  {r['pico_mb']:>9.2f} MB", flush=True)
+    return resultados
+
+
+def comparar(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    """Casos que pioraram além da tolerância: débito abaixo ou pico de memória acima da baseline."""
+    regressoes = []
+    print(f"\nComparação com a baseline de {baseline.get('data', '?')} (tolerância {tolerancia:.0%}):")
+    for chave, atual in resultados.items():
+        base = baseline.get("resultados", {}).get(chave)
+        if not base:
+            print(f"  {chave:<28} sem baseline")
+            continue
+        variacao_debito = (atual["linhas_s"] or 0) / base["linhas_s"] - 1 if base.get("linhas_s") else 0.0
+        variacao_memoria = atual["pico_mb"] / base["pico_mb"] - 1 if base.get("pico_mb") else 0.0
+        problemas = []
+        if variacao_debito < -tolerancia:
+            problemas.append("débito")
+        if variacao_memoria > tolerancia:
+            problemas.append("memória")
+        if problemas:
+            regressoes.append(chave)
+        print(f"  {chave:<28} débito {variacao_debito:>+7.1%}  memória {variacao_memoria:>+7.1%}"
+              f"{'  REGRESSÃO (' + ', '.join(problemas) + ')' if problemas else ''}")
+    return regressoes
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tamanhos", default=TAMANHOS_PADRAO, help=f"número de linhas, separados por vírgula ({TAMANHOS_PADRAO})")
+    ap.add_argument("--casos", default=",".join(CASOS), help=f"casos a executar ({','.join(CASOS)})")
+    ap.add_argument("--repeticoes", type=int, default=3, help="repetições mínimas por caso; conta a mais rápida (3)")
+    ap.add_argument("--latencia-ms", type=float, default=0.0,
+                    help="latência base dos provedores simulados, em ms (0: mede só a cascata)")
+    ap.add_argument("--provedores", choices=("simulados", "http"), default="simulados",
+                    help="geocoder com funções simuladas, ou com os provedores reais contra o servidor local (simulados)")
+    ap.add_argument("--jitter", type=float, default=0.2, help="variação relativa da latência simulada (0.2)")
+    ap.add_argument("--baseline", default=BASELINE_PADRAO, help="ficheiro JSON da baseline")
+    ap.add_argument("--guardar-baseline", action="store_true", help="grava os resultados como nova baseline")
+    ap.add_argument("--tolerancia", type=float, default=0.25, help="piora relativa aceite antes de falhar (0.25)")
+    ap.add_argument("--saida", help="grava também os resultados desta execução neste ficheiro JSON")
+    args = ap.parse_args(argv)
+
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+    desconhecidos = [c for c in casos if c not in CASOS]
+    if desconhecidos:
+        ap.error(f"casos desconhecidos: {', '.join(desconhecidos)}")
+    try:
+        tamanhos = [int(t) for t in args.tamanhos.split(",") if t.strip()]
+    except ValueError:
+        ap.error("--tamanhos deve ser uma lista de inteiros")
+
+    # Os logs por endereço do geocoder (incluindo as falhas simuladas) inundariam a saída
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+
+    opcoes = {"latencia_ms": args.latencia_ms, "jitter": args.jitter, "provedores": args.provedores}
+    resultados = executar(casos, tamanhos, opcoes, args.repeticoes)
+    documento = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "maquina": platform.platform(),
+        "opcoes": opcoes,
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(documento, f, indent=2, ensure_ascii=False)
+
+    regressoes = []
+    if os.path.exists(args.baseline) and not args.guardar_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("opcoes", opcoes) != opcoes:
+            print(f"\nA baseline foi gravada com outras opções ({baseline.get('opcoes')}): comparação ignorada.")
+        else:
+            regressoes = comparar(resultados, baseline, args.tolerancia)
+
+    if args.guardar_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                anteriores = json.load(f).get("resultados", {})
+            # Casos não executados agora mantêm os valores anteriores
+            documento["resultados"] = {**anteriores, **resultados}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(documento, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline gravada em {args.baseline}.")
+
+    if regressoes:
+        print(f"\n{len(regressoes)} regressão(ões): {', '.join(regressoes)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# benchmarks/arranque.py
+"""
+Arranque a frio da aplicação: cada repetição corre num interpretador novo e mede
+  - importar `app` e executar `create_app()` (o que cada worker do gunicorn paga);
+  - o primeiro pedido GET / (sem pandas);
+  - o primeiro parsing de um ficheiro (onde passa a ser pago o pandas adiado);
+  - a memória residente máxima e se o pandas/NumPy ficaram carregados.
+
+Os modos comparados são o arranque tardio (ARRANQUE_TARDIO=1, por omissão) e o
+imediato (ARRANQUE_TARDIO=0, todos os módulos importados ao carregar a aplicação).
+
+Uso:
+    python -m benchmarks.arranque
+    python -m benchmarks.arranque --repeticoes 20 --saida arranque.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import VARIAVEIS_DEFINIDAS
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODOS = {"tardio": "1", "imediato": "0"}
+MEDIDAS = ("create_app_s", "primeiro_pedido_s", "primeiro_parsing_s", "processo_s")
+
+# Executado em cada interpretador novo; escreve as medidas em JSON na última linha
+_FILHO = r"""
+import json, resource, sys, time
+inicio = time.perf_counter()
+from app import create_app
+app = create_app()
+create_app_s = time.perf_counter() - inicio
+carregados = [m for m in ("pandas", "numpy", "openpyxl", "redis") if m in sys.modules]
+
+inicio = time.perf_counter()
+codigo = app.test_client().get("/").status_code
+primeiro_pedido_s = time.perf_counter() - inicio
+
+from app.utils import parser
+inicio = time.perf_counter()
+parser.paack_texto_para_dataframe("Order Number\tEndereço\tCEP\nPT1\tRua Augusta 1, 1100-048 Lisboa\t1100-048\n")
+primeiro_parsing_s = time.perf_counter() - inicio
+
+print(json.dumps({
+    "create_app_s": create_app_s, "primeiro_pedido_s": primeiro_pedido_s, "codigo": codigo,
+    "primeiro_parsing_s": primeiro_parsing_s, "carregados_apos_create_app": carregados,
+    "rss_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def corre(modo: str, diretorio: str) -> dict:
+    env = {k: v for k, v in os.environ.items() if k not in VARIAVEIS_DEFINIDAS}
+    env.update({
+        "ARRANQUE_TARDIO": MODOS[modo],
+        "PYTHONPATH": RAIZ + os.pathsep + env.get("PYTHONPATH", ""),
+        "MAPBOX_TOKEN": env.get("MAPBOX_TOKEN", "stub"),
+        "SESSION_COOKIE_SECURE": "False",
+        "LOG_FICHEIRO": os.path.join(diretorio, "app.log"),
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(diretorio, "metricas"),
+    })
+    inicio = time.perf_counter()
+    saida = subprocess.run([sys.executable, "-c", _FILHO], cwd=diretorio, env=env,
+                           capture_output=True, text=True, timeout=120)
+    processo_s = time.perf_counter() - inicio
+    if saida.returncode != 0:
+        raise RuntimeError(f"Arranque em modo {modo} falhou:\n{saida.stderr[-2000:]}")
+    resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+    resultado["processo_s"] = processo_s
+    return resultado
+
+
+def resumo(amostras: list) -> dict:
+    r = {medida: {
+        "mediana": statistics.median(a[medida] for a in amostras),
+        "min": min(a[medida] for a in amostras),
+        "max": max(a[medida] for a in amostras),
+    } for medida in MEDIDAS}
+    r["rss_max_mb"] = statistics.median(a["rss_max_mb"] for a in amostras)
+    r["carregados_apos_create_app"] = amostras[-1]["carregados_apos_create_app"]
+    return r
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.arranque", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeticoes", type=int, default=10, help="interpretadores por modo (10)")
+    ap.add_argument("--modos", default=",".join(MODOS), help="modos a comparar (tardio,imediato)")
+    ap.add_argument("--saida", help="grava os resultados em JSON")
+    args = ap.parse_args(argv)
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+    desconhecidos = set(modos) - set(MODOS)
+    if desconhecidos:
+        ap.error(f"modos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="drivemaps_arranque_") as diretorio:
+        os.makedirs(os.path.join(diretorio, "metricas"), exist_ok=True)
+        try:
+            corre(modos[0], diretorio)  # aquece a cache de bytecode e do sistema de ficheiros
+            # Modos intercalados: variações da máquina afetam os dois por igual
+            amostras = {modo: [] for modo in modos}
+            for _ in range(args.repeticoes):
+                for modo in modos:
+                    amostras[modo].append(corre(modo, diretorio))
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(e, file=sys.stderr)
+            return 2
+    for modo in modos:
+        resultados[modo] = resumo(amostras[modo])
+
+    print(f"\n{'modo':<10}{'create_app':>12}{'1º pedido':>11}{'1º parsing':>12}{'processo':>10}{'RSS':>9}  carregados")
+    for modo, r in resultados.items():
+        ms = {medida: r[medida]["mediana"] * 1000 for medida in MEDIDAS}
+        print(f"{modo:<10}{ms['create_app_s']:>9.0f} ms{ms['primeiro_pedido_s']:>8.0f} ms{ms['primeiro_parsing_s']:>9.0f} ms"
+              f"{ms['processo_s']:>7.0f} ms{r['rss_max_mb']:>6.0f} MB  {', '.join(r['carregados_apos_create_app']) or '-'}")
+    if "tardio" in resultados and "imediato" in resultados:
+        tardio, imediato = (resultados[m]["create_app_s"]["mediana"] for m in ("tardio", "imediato"))
+        print(f"\ncreate_app() em modo tardio: {tardio * 1000:.0f} ms vs {imediato * 1000:.0f} ms "
+              f"({1 - tardio / imediato:.0%} menos), medianas de {args.repeticoes} arranques.")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"opcoes": vars(args), "modos": resultados}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+# benchmarks/carga.py
+"""
+Teste de carga ponta a ponta: utilizadores simulados percorrem os fluxos reais da
+aplicação, com a concorrência a subir por patamares.
+
+Cada utilizador (um despachante, com a sua sessão) repete o fluxo:
+  1. POST /import_planilha com um CSV Paack ou um XLSX Delnext gerados;
+  2. GET /preview e GET /api/lista;
+  3. arrastos de marcadores (POST /api/reverse-geocode);
+  4. POST /api/add-address;
+  5. POST /generate, a exportação CSV para onde redireciona, e GET /download/<id>.
+
+Por omissão arranca a aplicação com o gunicorn (como no Render) e o servidor de
+provedores simulados, cada um no seu processo e com armazenamento num diretório
+temporário; com --url mede uma aplicação já em execução.
+
+Uso:
+    python -m benchmarks.carga --concorrencia 1,2,4,8 --duracao 30
+    python -m benchmarks.carga --workers 1 --latencia-ms 80 --pausa-ms 2000
+    python -m benchmarks.carga --url http://127.0.0.1:5000 --concorrencia 4
+
+Por patamar são reportados p50/p95/p99 por rota, taxa de erros e débito, e no fim o
+maior patamar que cumpre o objetivo (--slo-ms no p95 das rotas interativas e menos de
+--erros-max de erros).
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+import requests
+
+from . import VARIAVEIS_DEFINIDAS, dados
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Rotas que o despachante espera ver responder de imediato (as restantes processam ficheiros)
+ROTAS_INTERATIVAS = ("preview", "api_lista", "reverse_geocode", "add_address", "generate", "download")
+PERCENTIS = (50, 95, 99)
+
+
+# --- Ficheiros de importação ---------------------------------------------------------
+
+def csv_paack(moradas: list) -> bytes:
+    df = pd.DataFrame({
+        "Order Number": [m["order_number"] for m in moradas],
+        "Endereço": [m["address"] for m in moradas],
+        "CEP": [m["cep"] for m in moradas],
+        "Cidade": [m["localidade"] for m in moradas],
+    })
+    return df.to_csv(index=False, sep=";").encode("utf-8")
+
+
+def xlsx_delnext(moradas: list) -> bytes:
+    """Como as folhas da Delnext: linha de título e o cabeçalho na 2ª linha."""
+    df = pd.DataFrame({
+        "Morada": [m["address"] for m in moradas],
+        "Código Postal": [m["cep"] for m in moradas],
+        "Localidade": [m["localidade"] for m in moradas],
+        "Referência": [m["order_number"] for m in moradas],
+    })
+    saida = io.BytesIO()
+    with pd.ExcelWriter(saida, engine="openpyxl") as escritor:
+        df.to_excel(escritor, index=False, startrow=1)
+        escritor.sheets["Sheet1"]["A1"] = "Delnext - rota do dia"
+    return saida.getvalue()
+
+
+# --- Recolha de resultados -------------------------------------------------------------
+
+class Registo:
+    """Amostras (rota, duração, sucesso) do patamar em curso, partilhadas pelos utilizadores."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.amostras = defaultdict(list)   # rota -> [(duração, ok)]
+        self.fluxos = 0
+
+    def regista(self, rota: str, duracao: float, ok: bool) -> None:
+        with self._lock:
+            self.amostras[rota].append((duracao, ok))
+
+    def fluxo_concluido(self) -> None:
+        with self._lock:
+            self.fluxos += 1
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil pelo método do posto mais próximo (valores ordenados)."""
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, max(0, int(round(p / 100.0 * len(valores) + 0.5)) - 1))]
+
+
+def resumo(registo: Registo, segundos: float) -> dict:
+    rotas = {}
+    for rota, amostras in sorted(registo.amostras.items()):
+        duracoes = sorted(d for d, _ in amostras)
+        erros = sum(1 for _, ok in amostras if not ok)
+        rotas[rota] = {
+            "pedidos": len(amostras),
+            "erros": erros,
+            "taxa_erros": round(erros / len(amostras), 4),
+            "pedidos_s": round(len(amostras) / segundos, 2),
+            **{f"p{p}_ms": round(percentil(duracoes, p) * 1000, 1) for p in PERCENTIS},
+        }
+    total = sum(r["pedidos"] for r in rotas.values())
+    erros = sum(r["erros"] for r in rotas.values())
+    return {
+        "segundos": round(segundos, 2),
+        "pedidos": total,
+        "pedidos_s": round(total / segundos, 2) if segundos else 0.0,
+        "fluxos": registo.fluxos,
+        "fluxos_min": round(registo.fluxos * 60 / segundos, 2) if segundos else 0.0,
+        "taxa_erros": round(erros / total, 4) if total else 0.0,
+        "rotas": rotas,
+    }
+
+
+# --- Utilizador simulado ------------------------------------------------------------
+
+class Utilizador(threading.Thread):
+    def __init__(self, n: int, url: str, moradas: list, registo: Registo, parar: threading.Event, opcoes: dict):
+        super().__init__(name=f"utilizador-{n}", daemon=True)
+        self.url = url.rstrip("/")
+        self.moradas = moradas
+        self.registo = registo
+        self.parar = parar
+        self.opcoes = opcoes
+        self.rng = random.Random(n)
+        self.sessao = requests.Session()
+        self.sessao.trust_env = False  # só pedidos locais: sem proxies do ambiente
+
+    def _pedido(self, rota: str, metodo: str, caminho: str, esperado=(200,), valida=None, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resposta = self.sessao.request(metodo, self.url + caminho, allow_redirects=False,
+                                           timeout=self.opcoes["timeout"], **kwargs)
+            resposta.content  # inclui o tempo de leitura do corpo (exportações em streaming)
+            ok = resposta.status_code in esperado and (valida is None or valida(resposta))
+        except requests.RequestException:
+            resposta, ok = None, False
+        self.registo.regista(rota, time.perf_counter() - inicio, ok)
+        return resposta if ok else None
+
+    def _pausa(self) -> None:
+        pausa = self.opcoes["pausa_ms"] / 1000.0
+        if pausa > 0:
+            self.parar.wait(self.rng.uniform(0.5 * pausa, 1.5 * pausa))
+
+    def _ficheiro(self) -> tuple:
+        n = self.opcoes["linhas"]
+        inicio = self.rng.randrange(0, max(1, len(self.moradas) - n))
+        lote = self.moradas[inicio:inicio + n]
+        if self.rng.random() < 0.5:
+            return "rota.csv", csv_paack(lote), "text/csv"
+        return "rota.xlsx", xlsx_delnext(lote), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    def fluxo(self) -> None:
+        self.sessao.cookies.clear()
+        nome, conteudo, tipo = self._ficheiro()
+        # A importação reporta falhas redirecionando para a página inicial em vez de /preview
+        resposta = self._pedido("import_planilha", "POST", "/import_planilha", esperado=(302,),
+                                valida=lambda r: r.headers.get("Location", "").endswith("/preview"),
+                                files={"planilhas": (nome, conteudo, tipo)})
+        if resposta is None:
+            return
+        self._pausa()
+        if self._pedido("preview", "GET", "/preview") is None:
+            return
+        resposta = self._pedido("api_lista", "GET", "/api/lista")
+        itens = resposta.json().get("itens", []) if resposta is not None else []
+        for _ in range(min(self.opcoes["arrastos"], len(itens))):
+            if self.parar.is_set():
+                return
+            self._pausa()
+            alvo = self.rng.choice(itens)
+            item = alvo["item"]
+            self._pedido("reverse_geocode", "POST", "/api/reverse-geocode", esperado=(200, 404), json={
+                "seq": alvo["seq"],
+                "lat": float(item.get("latitude") or 39.4) + self.rng.uniform(-0.001, 0.001),
+                "lng": float(item.get("longitude") or -8.2) + self.rng.uniform(-0.001, 0.001),
+            })
+        self._pausa()
+        m = self.rng.choice(self.moradas)
+        self._pedido("add_address", "POST", "/api/add-address", json={
+            "id": f"MANUAL-{self.rng.randrange(10 ** 6)}", "endereco": m["address"], "cep": m["cep"],
+        })
+        self._pausa()
+        resposta = self._pedido("generate", "POST", "/generate", esperado=(302,), data={"formato": "csv"})
+        if resposta is not None:
+            self._pedido("exportar_csv", "GET", resposta.headers["Location"].replace(self.url, ""))
+        self._pedido("download", "GET", "/download/ultimo", esperado=(302,))
+        self.registo.fluxo_concluido()
+
+    def run(self) -> None:
+        while not self.parar.is_set():
+            self.fluxo()
+            self._pausa()
+
+
+# --- Processos da aplicação e dos provedores -------------------------------------------
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _aguarda(url: str, processo: subprocess.Popen, limite: float = 60.0) -> None:
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O processo terminou ao arrancar (código {processo.returncode}): {' '.join(processo.args)}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} não respondeu em {limite:.0f}s")
+
+
+def arrancar_servidores(args, diretorio: str, processos: list) -> str:
+    """
+    Arranca o servidor de provedores simulados e a aplicação e devolve o URL da aplicação.
+    Os processos são acrescentados a `processos` à medida que arrancam, para que uma
+    falha a meio não deixe nenhum por terminar.
+    """
+    porta_provedores, porta_app = _porta_livre(), _porta_livre()
+    url_provedores = f"http://127.0.0.1:{porta_provedores}"
+    env = {nome: valor for nome, valor in os.environ.items() if nome not in VARIAVEIS_DEFINIDAS}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [RAIZ, os.environ.get("PYTHONPATH")]))
+    registo_saida = open(os.path.join(diretorio, "servidores.log"), "ab")
+
+    provedores = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.servidor_provedores", "--porta", str(porta_provedores),
+         "--latencia-ms", str(args.latencia_ms), "--taxa-erro", str(args.taxa_erro)],
+        cwd=RAIZ, env=env, stdout=registo_saida, stderr=subprocess.STDOUT,
+    )
+    processos.append(provedores)
+    _aguarda(url_provedores + "/cp/0000000", provedores)
+
+    env_app = {
+        **env,
+        **{f"TRANSPORT_{p.upper()}_URL": url_provedores for p in ("geoapi", "mapbox", "google")},
+        "GOOGLE_API_KEY": "stub", "MAPBOX_TOKEN": "stub", "GEOAPI_KEY": "stub",
+        "SESSION_COOKIE_SECURE": "False",
+        "SECRET_KEY": "teste-de-carga",
+        # Estado de cada execução no diretório temporário (cache, jobs, listas, sessões, métricas)
+        "GEOCACHE_PATH": os.path.join(diretorio, "geocache.sqlite3"),
+        "JOBS_DB_PATH": os.path.join(diretorio, "jobs.sqlite3"),
+        "ENDERECOS_DB_PATH": os.path.join(diretorio, "enderecos.sqlite3"),
+        "GEOCODER_SAUDE_PATH": os.path.join(diretorio, "saude_provedores.sqlite3"),
+        "LIMITE_TAXA_DIR": os.path.join(diretorio, "limite_taxa"),
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(diretorio, "metricas"),
+        "CP_INDEX_DIR": os.environ.get("CP_INDEX_DIR", os.path.join(RAIZ, "data", "cp_index")),
+    }
+    os.makedirs(env_app["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)  # o gunicorn.conf.py só o cria no gunicorn
+    endereco = f"127.0.0.1:{porta_app}"
+    if args.servidor == "gunicorn":
+        comando = [sys.executable, "-m", "gunicorn", "wsgi:app", "-c", os.path.join(RAIZ, "gunicorn.conf.py"),
+                   "--chdir", diretorio, "-b", endereco, "--timeout", str(int(args.timeout) + 30)]
+        if args.workers:
+            comando += ["-w", str(args.workers)]
+        if args.threads:
+            comando += ["--threads", str(args.threads)]
+    else:
+        # Servidor de desenvolvimento (threaded), para máquinas sem gunicorn
+        comando = [sys.executable, "-c",
+                   f"from wsgi import app; app.run(host='127.0.0.1', port={porta_app}, threaded=True)"]
+    aplicacao = subprocess.Popen(comando, cwd=diretorio, env=env_app, stdout=registo_saida, stderr=subprocess.STDOUT)
+    processos.insert(0, aplicacao)
+    url = f"http://{endereco}"
+    _aguarda(url + "/metrics", aplicacao)
+    return url
+
+
+def parar_servidores(processos: list) -> None:
+    for processo in processos:
+        if processo.poll() is None:
+            processo.send_signal(signal.SIGTERM)
+    for processo in processos:
+        try:
+            processo.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+
+# --- Execução ----------------------------------------------------------------------
+
+def patamar(url: str, concorrencia: int, moradas: list, args) -> dict:
+    registo, parar = Registo(), threading.Event()
+    opcoes = {"linhas": args.linhas, "arrastos": args.arrastos, "pausa_ms": args.pausa_ms, "timeout": args.timeout}
+    utilizadores = [Utilizador(n, url, moradas, registo, parar, opcoes) for n in range(concorrencia)]
+    inicio = time.perf_counter()
+    for utilizador in utilizadores:
+        utilizador.start()
+    parar.wait(args.duracao)
+    parar.set()
+    for utilizador in utilizadores:
+        utilizador.join(args.timeout + 5)
+    return {"concorrencia": concorrencia, **resumo(registo, time.perf_counter() - inicio)}
+
+
+def imprime_patamar(resultado: dict) -> None:
+    print(f"\n== {resultado['concorrencia']} utilizador(es): {resultado['pedidos_s']:.1f} pedidos/s, "
+          f"{resultado['fluxos_min']:.1f} fluxos/min, erros {resultado['taxa_erros']:.1%}")
+    print(f"  {'rota':<17}{'pedidos':>8}{'erros':>8}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for rota, r in resultado["rotas"].items():
+        print(f"  {rota:<17}{r['pedidos']:>8}{r['taxa_erros']:>8.1%}{r['pedidos_s']:>8.2f}"
+              f"{r['p50_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['p99_ms']:>10.0f}", flush=True)
+
+
+def cumpre_objetivo(resultado: dict, slo_ms: float, erros_max: float) -> bool:
+    p95 = [r["p95_ms"] for rota, r in resultado["rotas"].items() if rota in ROTAS_INTERATIVAS]
+    return bool(p95) and max(p95) <= slo_ms and resultado["taxa_erros"] <= erros_max
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.carga", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concorrencia", default="1,2,4,8", help="patamares de utilizadores simultâneos (1,2,4,8)")
+    ap.add_argument("--duracao", type=float, default=30.0, help="segundos por patamar (30)")
+    ap.add_argument("--linhas", type=int, default=100, help="linhas de cada ficheiro importado (100)")
+    ap.add_argument("--arrastos", type=int, default=5, help="marcadores arrastados por fluxo (5)")
+    ap.add_argument("--pausa-ms", type=float, default=1000.0, help="pausa média do utilizador entre ações (1000)")
+    ap.add_argument("--timeout", type=float, default=120.0, help="timeout de cada pedido, em segundos (120)")
+    ap.add_argument("--url", help="mede uma aplicação já em execução (não arranca servidores)")
+    ap.add_argument("--servidor", choices=("gunicorn", "werkzeug"), default="gunicorn")
+    ap.add_argument("--workers", type=int, help="workers do gunicorn (padrão: o do gunicorn/WEB_CONCURRENCY)")
+    ap.add_argument("--threads", type=int, help="threads por worker do gunicorn")
+    ap.add_argument("--latencia-ms", type=float, default=50.0, help="latência dos provedores simulados (50)")
+    ap.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas 503 dos provedores (0)")
+    ap.add_argument("--slo-ms", type=float, default=1000.0, help="p95 máximo das rotas interativas (1000)")
+    ap.add_argument("--erros-max", type=float, default=0.01, help="taxa de erros máxima (0.01)")
+    ap.add_argument("--saida", help="grava os resultados neste ficheiro JSON")
+    args = ap.parse_args(argv)
+
+    try:
+        niveis = [int(n) for n in args.concorrencia.split(",") if n.strip()]
+    except ValueError:
+        ap.error("--concorrencia deve ser uma lista de inteiros")
+    moradas = dados.moradas(max(args.linhas * 20, 1000))
+
+    diretorio = tempfile.mkdtemp(prefix="drivemaps_carga_")
+    processos = []
+    try:
+        url = args.url
+        if not url:
+            url = arrancar_servidores(args, diretorio, processos)
+            print(f"Aplicação em {url} ({args.servidor}); registos em {diretorio}/servidores.log")
+        resultados = []
+        for concorrencia in niveis:
+            resultado = patamar(url, concorrencia, moradas, args)
+            imprime_patamar(resultado)
+            resultados.append(resultado)
+    except RuntimeError as e:
+        print(f"Falha ao arrancar os servidores: {e}\nVer {diretorio}/servidores.log", file=sys.stderr)
+        return 2
+    finally:
+        parar_servidores(processos)
+    shutil.rmtree(diretorio, ignore_errors=True)
+
+    aceites = [r["concorrencia"] for r in resultados if cumpre_objetivo(r, args.slo_ms, args.erros_max)]
+    print(f"\n{'utilizadores':>12}{'pedidos/s':>11}{'fluxos/min':>12}{'erros':>8}{'p95 máx (interativas)':>24}")
+    for r in resultados:
+        p95 = max([v["p95_ms"] for k, v in r["rotas"].items() if k in ROTAS_INTERATIVAS] or [0])
+        print(f"{r['concorrencia']:>12}{r['pedidos_s']:>11.1f}{r['fluxos_min']:>12.1f}{r['taxa_erros']:>8.1%}{p95:>21.0f} ms")
+    if aceites:
+        print(f"\nMaior patamar dentro do objetivo (p95 ≤ {args.slo_ms:g} ms, erros ≤ {args.erros_max:.1%}): "
+              f"{max(aceites)} utilizador(es).")
+    else:
+        print(f"\nNenhum patamar cumpriu o objetivo (p95 ≤ {args.slo_ms:g} ms, erros ≤ {args.erros_max:.1%}).")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"opcoes": vars(args), "patamares": resultados}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
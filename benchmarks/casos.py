@@ -0,0 +1,60 @@
+# benchmarks/casos.py
+"""
+Casos de benchmark. Cada caso recebe as moradas geradas e devolve a função a medir:
+a preparação (gerar texto, DataFrames, itens) fica fora do tempo e da memória medidos.
+"""
+
+from app.routes import gerar
+from app.utils import geocoder, helpers, parser, pipeline
+
+from . import dados
+from .stubs import provedores_http, provedores_simulados
+
+
+def parser_paack(linhas: list, opcoes: dict):
+    texto = dados.texto_paack(linhas)
+    return lambda: parser.parse_paack_texto(texto)
+
+
+def normalizar(linhas: list, opcoes: dict):
+    enderecos = [m["address"] for m in linhas]
+    return lambda: [helpers.normalizar(e) for e in enderecos]
+
+
+def normalizar_serie(linhas: list, opcoes: dict):
+    serie = dados.dataframe_itens(dados.itens_geocodificados(linhas))["address"]
+    return lambda: pipeline.normalizar_serie(serie)
+
+
+def dedup_pipeline(linhas: list, opcoes: dict):
+    df = dados.dataframe_itens(dados.itens_geocodificados(linhas))
+    return lambda: pipeline.deduplica(df.copy(), considerar_tipo=True)
+
+
+def geocoder_lote(linhas: list, opcoes: dict):
+    enderecos = [m["address"] for m in linhas]
+    ceps = [m["cep"] for m in linhas]
+
+    provedores = provedores_http if opcoes.get("provedores") == "http" else provedores_simulados
+
+    def executa():
+        with provedores(opcoes["latencia_ms"], opcoes["jitter"]):
+            return geocoder.valida_ruas_em_lote(enderecos, ceps)
+    return executa
+
+
+def exportar_csv(linhas: list, opcoes: dict):
+    itens = dados.itens_geocodificados(linhas)
+    bloco = gerar.EXPORT_BLOCO_LINHAS
+    blocos = [itens[i:i + bloco] for i in range(0, len(itens), bloco)]
+    return lambda: sum(len(pedaco) for pedaco in gerar._stream_csv(iter(blocos)))
+
+
+CASOS = {
+    "parser": parser_paack,
+    "normalizar": normalizar,
+    "normalizar_serie": normalizar_serie,
+    "dedup_pipeline": dedup_pipeline,
+    "geocoder": geocoder_lote,
+    "exportar_csv": exportar_csv,
+}
@@ -0,0 +1,109 @@
+# benchmarks/dados.py
+"""
+Geradores determinísticos de moradas portuguesas sintéticas para os benchmarks.
+A mesma semente produz sempre os mesmos dados, por isso os resultados de duas
+execuções (ou de dois commits) são comparáveis.
+
+Uma fração das linhas é repetida (DUPLICADOS) e outra fração é uma variante
+abreviada de uma morada anterior ("R." em vez de "Rua"), para que a deduplicação
+e o agrupamento de pares únicos do geocoder tenham trabalho realista.
+"""
+
+import random
+
+import pandas as pd
+
+from app.utils.pipeline import COLUNAS_ITEM
+
+SEMENTE = 20240501
+DUPLICADOS = 0.10
+VARIANTES = 0.05
+
+TIPOS_VIA = [
+    ("Rua", "R."), ("Avenida", "Av."), ("Travessa", "Tv."), ("Largo", "Lg."),
+    ("Praça", "Pc."), ("Estrada", "Est."), ("Calçada", "Calç."), ("Alameda", "Al."),
+]
+NOMES_VIA = [
+    "da Liberdade", "de São João", "Dom Afonso Henriques", "do Comércio", "das Flores",
+    "de Santa Catarina", "Dr. António José de Almeida", "da República", "dos Combatentes",
+    "Almirante Reis", "Gago Coutinho", "da Boavista", "de Camões", "do Mercado",
+    "Engenheiro Duarte Pacheco", "Infante Dom Henrique", "da Misericórdia", "25 de Abril",
+    "Conde de Vizela", "Cidade de Lyon",
+]
+# (localidade, prefixo de CEP, latitude, longitude) aproximados
+LOCALIDADES = [
+    ("Lisboa", 1000, 38.7223, -9.1393), ("Porto", 4000, 41.1579, -8.6291),
+    ("Braga", 4700, 41.5454, -8.4265), ("Coimbra", 3000, 40.2033, -8.4103),
+    ("Faro", 8000, 37.0194, -7.9322), ("Aveiro", 3800, 40.6405, -8.6538),
+    ("Setúbal", 2900, 38.5244, -8.8882), ("Viseu", 3500, 40.6566, -7.9125),
+    ("Leiria", 2400, 39.7436, -8.8071), ("Évora", 7000, 38.5714, -7.9135),
+]
+
+
+def _morada_base(rng: random.Random) -> dict:
+    localidade, prefixo, lat, lng = rng.choice(LOCALIDADES)
+    tipo, abreviatura = rng.choice(TIPOS_VIA)
+    nome = rng.choice(NOMES_VIA)
+    numero = rng.randint(1, 300)
+    cep = f"{prefixo + rng.randint(0, 99):04d}-{rng.randint(0, 999):03d}"
+    return {
+        "rua": f"{tipo} {nome}", "rua_abreviada": f"{abreviatura} {nome}", "numero": numero,
+        "cep": cep, "localidade": localidade,
+        "lat": lat + rng.uniform(-0.05, 0.05), "lng": lng + rng.uniform(-0.05, 0.05),
+    }
+
+
+def moradas(n: int, semente: int = SEMENTE) -> list:
+    """
+    Lista de `n` moradas sintéticas: dicts com `address`, `cep`, `order_number`,
+    `localidade`, `lat` e `lng` (coordenadas "verdadeiras", usadas pelos provedores simulados).
+    """
+    rng = random.Random(semente)
+    linhas = []
+    for i in range(n):
+        if linhas and rng.random() < DUPLICADOS:
+            base = dict(rng.choice(linhas))
+        elif linhas and rng.random() < VARIANTES:
+            base = dict(rng.choice(linhas))
+            base["address"] = base["address_abreviada"]
+        else:
+            m = _morada_base(rng)
+            base = {
+                "address": f"{m['rua']}, {m['numero']}, {m['cep']} {m['localidade']}",
+                "address_abreviada": f"{m['rua_abreviada']} {m['numero']}, {m['cep']} {m['localidade']}",
+                "cep": m["cep"], "localidade": m["localidade"], "lat": m["lat"], "lng": m["lng"],
+            }
+        base["order_number"] = f"PAACK{100000 + i}"
+        linhas.append(base)
+    return linhas
+
+
+def texto_paack(linhas: list) -> str:
+    """Texto colado no formato Paack: blocos de 4 linhas (morada, localidade, morada, encomenda)."""
+    return "\n".join(
+        f"{m['address']}\n{m['localidade']}\n{m['address']}\n{m['order_number']}" for m in linhas
+    )
+
+
+def itens_geocodificados(linhas: list, semente: int = SEMENTE) -> list:
+    """Itens com o formato da lista guardada (COLUNAS_ITEM), como se já tivessem sido geocodificados."""
+    rng = random.Random(semente)
+    itens = []
+    for m in linhas:
+        ok = rng.random() < 0.9
+        rua = m["address"].split(",")[0]
+        itens.append({
+            "order_number": m["order_number"], "address": m["address"], "cep": m["cep"],
+            "status_google": "OK" if ok else "NOT_FOUND",
+            "latitude": round(m["lat"], 6), "longitude": round(m["lng"], 6),
+            "importacao_tipo": "paack", "cor": "#0074D9",
+            "postal_code_encontrado": m["cep"] if ok else "",
+            "endereco_formatado": f"{rua}, {m['cep']}" if ok else "",
+            "rua_google": rua if ok else "", "cep_ok": ok, "rua_bate": ok,
+            "freguesia": m["localidade"] if ok else "", "locality": m["localidade"] if ok else "",
+        })
+    return itens
+
+
+def dataframe_itens(itens: list) -> pd.DataFrame:
+    return pd.DataFrame(itens, columns=COLUNAS_ITEM)
@@ -0,0 +1,220 @@
+# benchmarks/servidor_provedores.py
+"""
+Servidor HTTP local que imita os endpoints usados pelos provedores de geocodificação:
+
+  - GeoAPI:  GET /cp/<cep>              e  GET /gps/<lat>,<lng>
+  - Mapbox:  GET /geocoding/v5/mapbox.places/<consulta>.json
+  - Google:  GET /maps/api/geocode/json?address=...  ou  ?latlng=...
+
+As respostas têm o mesmo formato das APIs reais e são determinísticas (dependem só
+do pedido), com uma fração de endereços não encontrados em cada provedor para que a
+cascata GeoAPI → Mapbox → Google seja percorrida. A latência, a variação e a fração de
+erros 503 / 429 injetados são configuráveis.
+
+Uso:
+    python -m benchmarks.servidor_provedores --porta 8765 --latencia-ms 40
+    TRANSPORT_GEOAPI_URL=http://127.0.0.1:8765 TRANSPORT_MAPBOX_URL=http://127.0.0.1:8765 \\
+    TRANSPORT_GOOGLE_URL=http://127.0.0.1:8765 GOOGLE_API_KEY=stub gunicorn app:app
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .dados import LOCALIDADES, NOMES_VIA, TIPOS_VIA
+
+logger = logging.getLogger(__name__)
+
+# Fração de pedidos que cada provedor simulado consegue resolver
+ACERTO_GEOAPI_CEP = 0.90     # CEPs conhecidos (os restantes dão 404)
+ACERTO_GEOAPI_RUA = 0.40     # ruas listadas em cada CEP conhecido
+ACERTO_MAPBOX = 0.80
+ACERTO_GOOGLE = 0.95
+
+_REGEX_CEP = re.compile(r'(\d{4})-?(\d{3})')
+_REGEX_COORDS = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+_RUAS = [f"{tipo} {nome}" for tipo, _ in TIPOS_VIA for nome in NOMES_VIA]
+
+
+def _sorteio(*partes) -> float:
+    """Número em [0, 1) fixo para as mesmas partes."""
+    return zlib.crc32("|".join(str(p) for p in partes).encode("utf-8")) / 2 ** 32
+
+
+def _local(chave: str) -> tuple:
+    """(localidade, lat, lng) determinísticos para uma chave (CEP ou endereço)."""
+    localidade, _, lat, lng = LOCALIDADES[int(_sorteio("local", chave) * len(LOCALIDADES))]
+    return localidade, round(lat + (_sorteio("lat", chave) - 0.5) / 10, 6), round(lng + (_sorteio("lng", chave) - 0.5) / 10, 6)
+
+
+def _cep_de(texto: str) -> str:
+    m = _REGEX_CEP.search(texto or "")
+    return f"{m.group(1)}-{m.group(2)}" if m else ""
+
+
+def geoapi_cp(cep_limpo: str):
+    cep = _cep_de(cep_limpo)
+    if not cep or _sorteio("geoapi", cep) >= ACERTO_GEOAPI_CEP:
+        return 404, {"erro": "CP não encontrado"}
+    localidade, lat, lng = _local(cep)
+    arterias = []
+    for rua in _RUAS:
+        if _sorteio("geoapi", cep, rua) < ACERTO_GEOAPI_RUA:
+            _, a_lat, a_lng = _local(cep + rua)
+            arterias.append({
+                "arteria": rua, "coordenadas": [a_lat, a_lng],
+                "freguesia": localidade, "municipio": localidade,
+            })
+    return 200, {"CP": cep, "Localidade": localidade, "centroide": f"{lat},{lng}", "arterias": arterias}
+
+
+def geoapi_gps(lat: float, lng: float):
+    chave = f"{lat:.4f},{lng:.4f}"
+    cp4, cp3 = 1000 + int(_sorteio("cp4", chave) * 8999), int(_sorteio("cp3", chave) * 999)
+    rua = _RUAS[int(_sorteio("rua", chave) * len(_RUAS))]
+    localidade, _, _ = _local(chave)
+    return 200, {
+        "cp4": f"{cp4:04d}", "cp3": f"{cp3:03d}", "arteria": rua, "freguesia": localidade,
+        "municipio": localidade, "address": f"{rua}, {cp4:04d}-{cp3:03d} {localidade}",
+    }
+
+
+def mapbox(consulta: str):
+    coords = _REGEX_COORDS.match(consulta)
+    if coords:
+        lng, lat = float(coords.group(1)), float(coords.group(2))
+        _, resposta = geoapi_gps(lat, lng)
+        rua, cep, localidade = resposta["arteria"], f"{resposta['cp4']}-{resposta['cp3']}", resposta["municipio"]
+    elif _sorteio("mapbox", consulta) < ACERTO_MAPBOX:
+        cep = _cep_de(consulta)
+        rua = consulta.split(",")[0].strip()
+        localidade, lat, lng = _local(consulta)
+    else:
+        return 200, {"type": "FeatureCollection", "query": consulta.split(), "features": []}
+    return 200, {"type": "FeatureCollection", "query": consulta.split(), "features": [{
+        "id": f"address.{zlib.crc32(consulta.encode('utf-8'))}",
+        "center": [lng, lat],
+        "place_name": f"{rua}, {cep} {localidade}, Portugal",
+        "context": [
+            {"id": "street.1", "text": rua}, {"id": "postcode.1", "text": cep},
+            {"id": "place.1", "text": localidade}, {"id": "country.1", "text": "Portugal"},
+        ],
+    }]}
+
+
+def google(params: dict):
+    if "latlng" in params:
+        coords = _REGEX_COORDS.match(params["latlng"])
+        if not coords:
+            return 200, {"status": "INVALID_REQUEST", "results": [], "error_message": "latlng inválido"}
+        lat, lng = float(coords.group(1)), float(coords.group(2))
+        _, resposta = geoapi_gps(lat, lng)
+        rua, cep, localidade = resposta["arteria"], f"{resposta['cp4']}-{resposta['cp3']}", resposta["municipio"]
+    else:
+        morada = params.get("address", "")
+        if not morada or _sorteio("google", morada) >= ACERTO_GOOGLE:
+            return 200, {"status": "ZERO_RESULTS", "results": []}
+        cep = _cep_de(morada)
+        rua = morada.split(",")[0].strip()
+        localidade, lat, lng = _local(morada)
+    return 200, {"status": "OK", "results": [{
+        "formatted_address": f"{rua}, {cep} {localidade}, Portugal",
+        "geometry": {"location": {"lat": lat, "lng": lng}, "location_type": "ROOFTOP"},
+        "address_components": [
+            {"long_name": rua, "short_name": rua, "types": ["route"]},
+            {"long_name": localidade, "short_name": localidade, "types": ["sublocality", "political"]},
+            {"long_name": localidade, "short_name": localidade, "types": ["locality", "political"]},
+            {"long_name": cep, "short_name": cep, "types": ["postal_code"]},
+        ],
+    }]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como as APIs reais
+    # Cabeçalhos e corpo saem em escritas separadas: sem TCP_NODELAY cada resposta
+    # esperaria pelo ACK atrasado do cliente (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        cfg = self.server.configuracao
+        if cfg["latencia_ms"] > 0:
+            time.sleep(cfg["latencia_ms"] * random.uniform(1 - cfg["jitter"], 1 + cfg["jitter"]) / 1000.0)
+        if random.random() < cfg["taxa_429"]:
+            return self._responde(429, {"message": "Too Many Requests"}, {"Retry-After": "1"})
+        if random.random() < cfg["taxa_erro"]:
+            return self._responde(503, {"message": "Service Unavailable"})
+
+        partes = urlsplit(self.path)
+        caminho = unquote(partes.path)
+        params = {k: v[0] for k, v in parse_qs(partes.query).items()}
+        if caminho.startswith("/cp/"):
+            codigo, corpo = geoapi_cp(caminho[len("/cp/"):])
+        elif caminho.startswith("/gps/") and _REGEX_COORDS.match(caminho[len("/gps/"):]):
+            lat, lng = (float(v) for v in caminho[len("/gps/"):].split(","))
+            codigo, corpo = geoapi_gps(lat, lng)
+        elif caminho.startswith("/geocoding/v5/mapbox.places/") and caminho.endswith(".json"):
+            codigo, corpo = mapbox(caminho[len("/geocoding/v5/mapbox.places/"):-len(".json")])
+        elif caminho == "/maps/api/geocode/json":
+            codigo, corpo = google(params)
+        else:
+            codigo, corpo = 404, {"message": "Not Found"}
+        self._responde(codigo, corpo)
+
+    def _responde(self, codigo: int, corpo: dict, cabecalhos: dict = None):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        logger.debug("%s - %s", self.address_string(), formato % args)
+
+
+def iniciar(porta: int = 0, host: str = "127.0.0.1", latencia_ms: float = 0.0, jitter: float = 0.2,
+            taxa_erro: float = 0.0, taxa_429: float = 0.0) -> ThreadingHTTPServer:
+    """Arranca o servidor numa thread em segundo plano (porta 0: escolhida pelo sistema)."""
+    servidor = ThreadingHTTPServer((host, porta), _Handler)
+    servidor.daemon_threads = True
+    servidor.configuracao = {"latencia_ms": latencia_ms, "jitter": jitter, "taxa_erro": taxa_erro, "taxa_429": taxa_429}
+    threading.Thread(target=servidor.serve_forever, name="servidor-provedores", daemon=True).start()
+    return servidor
+
+
+def url(servidor: ThreadingHTTPServer) -> str:
+    host, porta = servidor.server_address[:2]
+    return f"http://{host}:{porta}"
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.servidor_provedores", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--porta", type=int, default=8765)
+    ap.add_argument("--latencia-ms", type=float, default=0.0, help="latência de cada resposta, em ms (0)")
+    ap.add_argument("--jitter", type=float, default=0.2, help="variação relativa da latência (0.2)")
+    ap.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas 503 (0)")
+    ap.add_argument("--taxa-429", type=float, default=0.0, help="fração de respostas 429 com Retry-After (0)")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    servidor = iniciar(args.porta, args.host, args.latencia_ms, args.jitter, args.taxa_erro, args.taxa_429)
+    logger.info(f"Provedores simulados em {url(servidor)} (latência {args.latencia_ms:g} ms).")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
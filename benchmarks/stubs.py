@@ -0,0 +1,106 @@
+# benchmarks/stubs.py
+"""
+Provedores de geocodificação simulados, sem rede nem índice offline, em dois modos:
+
+  - `provedores_simulados`: funções Python substituem a cascata do geocoder (mede só
+    o geocoder);
+  - `provedores_http`: os módulos reais (GeoAPI, Mapbox, Google) e o `transport` falam
+    com o servidor local `servidor_provedores` (mede também HTTP e parsing das respostas).
+
+Cada provedor dorme `latencia_ms` por chamada (com variação de ±`jitter`) e acerta
+numa fração fixa dos endereços. O desfecho depende só do par (endereço, CEP), por
+isso é o mesmo em todas as execuções: o que não é encontrado por um provedor passa
+ao seguinte, exercitando a cascata completa.
+"""
+
+import contextlib
+import os
+import random
+import time
+import zlib
+
+from app.utils import geoapi, geocoder, google, transport
+
+from . import servidor_provedores
+
+# (nome, fração de endereços encontrados, fator sobre a latência base)
+PROVEDORES = [
+    ("codigos_postais", 0.60, 0.0),   # índice local: sem latência de rede
+    ("geoapi", 0.70, 1.0),
+    ("mapbox", 0.80, 1.5),
+    ("google", 0.95, 2.0),
+]
+
+
+def _sorteio(nome: str, endereco: str, cep: str) -> float:
+    """Número em [0, 1) fixo para cada (provedor, endereço, CEP)."""
+    return zlib.crc32(f"{nome}|{endereco}|{cep}".encode("utf-8")) / 2 ** 32
+
+
+def provedor_simulado(nome: str, taxa_acerto: float, latencia_ms: float, jitter: float = 0.2):
+    """Função com a mesma assinatura e formato de resultado de `valida_rua_<provedor>`."""
+
+    def valida_rua(endereco, cep):
+        if latencia_ms > 0:
+            time.sleep(latencia_ms * random.uniform(1 - jitter, 1 + jitter) / 1000.0)
+        sorteio = _sorteio(nome, endereco, cep)
+        if sorteio >= taxa_acerto:
+            return {"status": "NOT_FOUND", "msg": f"{nome} (simulado) não encontrou o endereço"}
+        rua = str(endereco).split(",")[0]
+        return {
+            "status": "OK",
+            "coordenadas": {"lat": round(37.0 + 5 * sorteio, 6), "lng": round(-9.5 + 3 * sorteio, 6)},
+            "postal_code_encontrado": cep,
+            "endereco_formatado": f"{rua}, {cep}",
+            "route_encontrada": rua,
+            "sublocality": "",
+            "locality": "",
+        }
+
+    # O geocoder identifica o provedor pelo último componente do módulo da função
+    valida_rua.__module__ = f"{__name__}.{nome}"
+    valida_rua.__name__ = f"valida_rua_{nome}"
+    return valida_rua
+
+
+@contextlib.contextmanager
+def provedores_simulados(latencia_ms: float = 0.0, jitter: float = 0.2):
+    """Substitui `geocoder.GEOCODER_PRIORITY` pelos provedores simulados enquanto ativo."""
+    original = geocoder.GEOCODER_PRIORITY
+    geocoder.GEOCODER_PRIORITY = [
+        provedor_simulado(nome, taxa, latencia_ms * fator, jitter) for nome, taxa, fator in PROVEDORES
+    ]
+    try:
+        yield geocoder.GEOCODER_PRIORITY
+    finally:
+        geocoder.GEOCODER_PRIORITY = original
+
+
+@contextlib.contextmanager
+def provedores_http(latencia_ms: float = 0.0, jitter: float = 0.2):
+    """
+    Arranca o servidor de provedores simulados e aponta-lhe os provedores reais
+    (variáveis TRANSPORT_<PROVEDOR>_URL). O índice offline fica de fora da cascata.
+    """
+    servidor = servidor_provedores.iniciar(latencia_ms=latencia_ms, jitter=jitter)
+    variaveis = {f"TRANSPORT_{p.upper()}_URL": servidor_provedores.url(servidor) for p in transport.PROVIDERS}
+    variaveis.setdefault("GOOGLE_API_KEY", os.environ.get("GOOGLE_API_KEY") or "stub")
+    anteriores = {nome: os.environ.get(nome) for nome in variaveis}
+    original = geocoder.GEOCODER_PRIORITY
+    os.environ.update(variaveis)
+    geocoder.GEOCODER_PRIORITY = [f for f in original if f.__module__.split(".")[-1] in transport.PROVIDERS]
+    # Cada execução começa sem as respostas em memória da execução anterior
+    geoapi._cache_ceps.clear()
+    google.valida_rua_google.cache_clear()
+    try:
+        yield geocoder.GEOCODER_PRIORITY
+    finally:
+        geocoder.GEOCODER_PRIORITY = original
+        for nome, valor in anteriores.items():
+            if valor is None:
+                os.environ.pop(nome, None)
+            else:
+                os.environ[nome] = valor
+        servidor.shutdown()
+        servidor.server_close()
+        transport.fechar_sessoes()
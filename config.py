@@ -38,12 +38,9 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
-    # Configuração para Redis (se necessário)
-    if SESSION_TYPE == 'redis':
-        import redis
-        REDIS_URL = os.getenv('REDIS_URL')
-        if REDIS_URL:
-            SESSION_REDIS = redis.from_url(REDIS_URL)
+    # Configuração para Redis (se necessário). O cliente (SESSION_REDIS) é criado por
+    # create_app, no primeiro uso, e não ao definir esta classe
+    REDIS_URL = os.getenv('REDIS_URL')
     
     @property
     def DEBUG(self):
@@ -0,0 +1,58 @@
+# gunicorn.conf.py
+"""
+Configuração lida automaticamente pelo gunicorn (`gunicorn app:app`).
+Ativa o modo multiprocesso do prometheus_client: cada worker grava as suas métricas
+em PROMETHEUS_MULTIPROC_DIR e /metrics agrega os ficheiros de todos os workers.
+
+GUNICORN_PRELOAD=1 carrega a aplicação uma vez no processo principal e cria os
+workers por fork: o pandas, o NumPy e o índice de códigos postais (adiados por
+omissão, ver app/utils/tardio.py) são pré-carregados antes do fork e partilhados.
+
+Os workers são "gthread": cada um atende GUNICORN_THREADS pedidos em simultâneo, para
+que os streams SSE de importação (até IMPORT_SSE_DURACAO_MAX segundos cada) não
+bloqueiem os restantes pedidos do worker.
+"""
+
+import os
+import shutil
+import tempfile
+
+# Definido no processo principal, antes de os workers importarem a aplicação
+METRICAS_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "drivemaps_metricas")
+)
+# Com preload a aplicação (e as métricas) é importada antes de on_starting
+os.makedirs(METRICAS_DIR, exist_ok=True)
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "0") == "1"
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+
+def on_starting(server):
+    """Métricas de uma execução anterior não devem somar-se às novas."""
+    shutil.rmtree(METRICAS_DIR, ignore_errors=True)
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+
+
+def when_ready(server):
+    """Com preload, carrega já o que os workers adiariam, para o partilharem após o fork."""
+    if server.cfg.preload_app:
+        from app.utils import tardio
+        tardio.precarregar()
+
+
+def child_exit(server, worker):
+    """Worker terminado (ou reciclado): os seus ficheiros deixam de contar para os gauges 'live'."""
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
+
+
+def worker_exit(server, worker):
+    """Escreve os registos de log ainda na fila antes de o worker terminar."""
+    from app.logging_config import parar_logging
+    parar_logging()
@@ -0,0 +1,102 @@
+# tests/conftest.py
+"""
+Configuração comum dos testes: isola o estado partilhado (cache, saúde dos provedores,
+limite de pedidos, listas e jobs) num diretório temporário e desliga os backends
+que falariam com serviços externos. As variáveis de ambiente são lidas ao importar
+os módulos da aplicação, por isso têm de ser definidas antes de qualquer `import app`.
+"""
+
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="testes_geocoder_")
+for _nome, _valor in {
+    "MAPBOX_TOKEN": "teste",
+    "SESSION_COOKIE_SECURE": "False",
+    "GEOCACHE_BACKEND": "none",
+    "GEOCODER_SAUDE_BACKEND": "none",
+    "LIMITE_TAXA_BACKEND": "none",
+    "ENDERECOS_BACKEND": "sqlite",
+    "ENDERECOS_DB_PATH": os.path.join(_TMP, "enderecos.sqlite3"),
+    "JOBS_DB_PATH": os.path.join(_TMP, "jobs.sqlite3"),
+    "IMPORT_JOBS_DIR": os.path.join(_TMP, "importacoes"),
+    "LOG_FICHEIRO": os.path.join(_TMP, "app.log"),
+}.items():
+    os.environ[_nome] = _valor
+os.environ.pop("GOOGLE_API_KEY", None)
+
+import pytest  # noqa: E402
+
+from app.utils import geocoder, saude_provedores  # noqa: E402
+
+
+def provedor(nome: str, resposta, latencia: float = 0.0, chamadas: list = None):
+    """
+    Provedor simulado com a assinatura de `valida_rua_<provedor>`. `resposta` é um dict,
+    uma exceção (levantada) ou uma função (endereco, cep) -> dict. O geocoder identifica
+    o provedor pelo último componente do módulo da função.
+    """
+    import time
+
+    def valida_rua(endereco, cep):
+        if chamadas is not None:
+            chamadas.append((nome, endereco, cep))
+        if latencia:
+            time.sleep(latencia)
+        if isinstance(resposta, BaseException):
+            raise resposta
+        return resposta(endereco, cep) if callable(resposta) else dict(resposta)
+
+    valida_rua.__module__ = f"testes.{nome}"
+    valida_rua.__name__ = f"valida_rua_{nome}"
+    return valida_rua
+
+
+def ok(lat: float = 38.7, lng: float = -9.1, **campos) -> dict:
+    """Resultado "OK" de um provedor, no formato devolvido pelos módulos reais."""
+    return {"status": "OK", "coordenadas": {"lat": lat, "lng": lng}, **campos}
+
+
+@pytest.fixture
+def cascata(monkeypatch):
+    """Substitui a cascata direta do geocoder pelos provedores indicados: `cascata(p1, p2, ...)`."""
+    monkeypatch.setattr(geocoder, "_semaforos_provedores", {})
+
+    def define(*provedores):
+        monkeypatch.setattr(geocoder, "GEOCODER_PRIORITY", list(provedores))
+        return list(provedores)
+
+    return define
+
+
+@pytest.fixture
+def saude(monkeypatch, tmp_path):
+    """Saúde dos provedores ativa num SQLite temporário, sincronizada a cada chamada."""
+    monkeypatch.setattr(saude_provedores, "_backend", saude_provedores.SQLiteBackend(str(tmp_path / "saude.sqlite3")))
+    monkeypatch.setattr(saude_provedores, "_estado", None)
+    monkeypatch.setattr(saude_provedores, "GEOCODER_SAUDE_SINCRONIZACAO", 0.0)
+    return saude_provedores
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def lista_backend(request, monkeypatch, tmp_path):
+    """Backend da lista de endereços, em SQLite e em Redis (fakeredis, se instalado)."""
+    from app.utils import lista_enderecos
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        backend = lista_enderecos.RedisBackend(fakeredis.FakeStrictRedis())
+    else:
+        backend = lista_enderecos.SQLiteBackend(str(tmp_path / "enderecos.sqlite3"))
+    monkeypatch.setattr(lista_enderecos, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def cliente_app(monkeypatch, tmp_path, lista_backend):
+    """Cliente de teste da aplicação, com sessões em ficheiros num diretório temporário."""
+    import config
+    from app import create_app
+    monkeypatch.setattr(config.Config, "SESSION_FILE_DIR", str(tmp_path / "sessoes"))
+    app = create_app()
+    app.config["TESTING"] = True
+    return app.test_client()
@@ -0,0 +1,98 @@
+# tests/test_geocoder_hedged.py
+"""Cascata especulativa (GEOCODER_HEDGE_MS): mesmo vencedor da cascata sequencial, menos latência."""
+
+import time
+
+import pytest
+
+from app.utils import geocoder
+
+from conftest import ok, provedor
+
+NAO_ENCONTRADO = {"status": "NOT_FOUND"}
+
+
+@pytest.fixture
+def hedge(monkeypatch):
+    monkeypatch.setattr(geocoder, "HEDGE_DELAY_MS", 50)
+
+
+def _cascata(endereco="Rua A", cep="1000-001"):
+    inicio = time.monotonic()
+    resultado, vencedor = geocoder._valida_rua_cascata(endereco, cep)
+    return resultado, vencedor, time.monotonic() - inicio
+
+
+def test_primeiro_provedor_rapido_nao_arranca_os_outros(cascata, hedge):
+    chamadas = []
+    cascata(provedor("geoapi", ok(lat=1.0), chamadas=chamadas),
+            provedor("mapbox", ok(lat=2.0), chamadas=chamadas))
+
+    resultado, vencedor, _ = _cascata()
+
+    assert (vencedor, resultado["coordenadas"]["lat"]) == ("geoapi", 1.0)
+    assert [nome for nome, _, _ in chamadas] == ["geoapi"]
+
+
+def test_mantem_o_vencedor_de_maior_prioridade(cascata, hedge):
+    # O mapbox arranca pelo orçamento e responde primeiro, mas o geoapi acerta depois
+    cascata(provedor("geoapi", ok(lat=1.0), latencia=0.2),
+            provedor("mapbox", ok(lat=2.0), latencia=0.01))
+
+    resultado, vencedor, duracao = _cascata()
+
+    assert (vencedor, resultado["coordenadas"]["lat"]) == ("geoapi", 1.0)
+    assert duracao >= 0.2
+
+
+def test_usa_o_seguinte_quando_o_preferido_falha(cascata, hedge):
+    cascata(provedor("geoapi", NAO_ENCONTRADO, latencia=0.2),
+            provedor("mapbox", ok(lat=2.0), latencia=0.2))
+
+    resultado, vencedor, duracao = _cascata()
+
+    assert (vencedor, resultado["coordenadas"]["lat"]) == ("mapbox", 2.0)
+    # Sequencial seriam 0.4s; com o mapbox lançado aos 50ms a resposta chega por volta dos 0.25s
+    assert duracao < 0.35
+
+
+def test_nao_espera_por_provedores_de_menor_prioridade(cascata, hedge):
+    cascata(provedor("geoapi", NAO_ENCONTRADO, latencia=0.1),
+            provedor("mapbox", ok(lat=2.0), latencia=0.1),
+            provedor("google", ok(lat=3.0), latencia=0.5))
+
+    resultado, vencedor, duracao = _cascata()
+
+    assert vencedor == "mapbox"
+    assert duracao < 0.4
+
+
+def test_todos_falham(cascata, hedge):
+    cascata(provedor("geoapi", NAO_ENCONTRADO, latencia=0.08),
+            provedor("mapbox", RuntimeError("timeout"), latencia=0.01),
+            provedor("google", {"status": "ZERO_RESULTS"}))
+
+    resultado, vencedor, _ = _cascata()
+
+    assert vencedor is None
+    assert resultado["status"] == "ALL_PROVIDERS_FAILED"
+    assert resultado["erros"] == [
+        {"geoapi": NAO_ENCONTRADO}, {"mapbox": "timeout"}, {"google": {"status": "ZERO_RESULTS"}}
+    ]
+
+
+def test_igual_a_cascata_sequencial(cascata, monkeypatch):
+    def acerta_se(nome, residuo):
+        return provedor(nome, lambda endereco, cep: ok(lat=float(len(endereco)), provedor=nome)
+                        if len(endereco) % 3 == residuo else NAO_ENCONTRADO, latencia=0.005)
+
+    cascata(acerta_se("geoapi", 0), acerta_se("mapbox", 1), acerta_se("google", 2))
+    enderecos = ["Rua " + "x" * i for i in range(9)]
+
+    monkeypatch.setattr(geocoder, "HEDGE_DELAY_MS", 0)
+    sequencial = [geocoder._valida_rua_cascata(e, "1000-001") for e in enderecos]
+    monkeypatch.setattr(geocoder, "HEDGE_DELAY_MS", 1)
+    especulativa = [geocoder._valida_rua_cascata(e, "1000-001") for e in enderecos]
+
+    assert [v for _, v in especulativa] == [v for _, v in sequencial]
+    assert [r["provedor"] for r, _ in especulativa] == [r["provedor"] for r, _ in sequencial]
@@ -0,0 +1,96 @@
+# tests/test_geocoder_lote.py
+"""Geocodificação em lote (`geocoder.valida_ruas_em_lote`)."""
+
+import threading
+import time
+
+from app.utils import geocoder
+
+from conftest import ok, provedor
+
+
+def _por_endereco(endereco, cep):
+    return ok(lat=float(len(endereco)), lng=float(cep.replace("-", "")), route_encontrada=endereco)
+
+
+def test_mantem_a_ordem_da_entrada(cascata):
+    cascata(provedor("geoapi", _por_endereco, latencia=0.01))
+    enderecos = [f"Rua {i}" * (i + 1) for i in range(20)]
+    ceps = [f"{1000 + i}-00{i % 10}" for i in range(20)]
+
+    resultados = geocoder.valida_ruas_em_lote(enderecos, ceps, max_workers=8)
+
+    assert [r["route_encontrada"] for r in resultados] == enderecos
+    assert [r["coordenadas"]["lat"] for r in resultados] == [float(len(e)) for e in enderecos]
+
+
+def test_pares_repetidos_sao_geocodificados_uma_vez(cascata):
+    chamadas = []
+    cascata(provedor("geoapi", _por_endereco, chamadas=chamadas))
+    enderecos = ["Rua A", "Rua B", "Rua A", "Rua A", "Rua B"]
+    ceps = ["1000-001", "1000-001", "1000-001", "2000-002", "1000-001"]
+
+    resultados = geocoder.valida_ruas_em_lote(enderecos, ceps, max_workers=4)
+
+    assert sorted((e, c) for _, e, c in chamadas) == [
+        ("Rua A", "1000-001"), ("Rua A", "2000-002"), ("Rua B", "1000-001")
+    ]
+    assert resultados[0] is resultados[2]
+    assert resultados[1] is resultados[4]
+    assert resultados[3]["coordenadas"]["lng"] == 2000002.0
+
+
+def test_ao_concluir_recebe_as_posicoes_de_cada_par(cascata):
+    cascata(provedor("geoapi", _por_endereco))
+    enderecos = ["Rua A", "Rua B", "Rua A", "Rua C"]
+    ceps = ["1000-001"] * 4
+    recebidos = {}
+    lock = threading.Lock()
+
+    def ao_concluir(posicoes, resultado):
+        with lock:
+            recebidos[tuple(posicoes)] = resultado["route_encontrada"]
+
+    geocoder.valida_ruas_em_lote(enderecos, ceps, max_workers=3, ao_concluir=ao_concluir)
+
+    assert recebidos == {(0, 2): "Rua A", (1,): "Rua B", (3,): "Rua C"}
+
+
+def test_respeita_o_limite_de_concorrencia_por_provedor(cascata, monkeypatch):
+    monkeypatch.setattr(geocoder, "PROVIDER_MAX_CONCURRENCY", 2)
+    em_curso, maximo = [0], [0]
+    lock = threading.Lock()
+
+    def lento(endereco, cep):
+        with lock:
+            em_curso[0] += 1
+            maximo[0] = max(maximo[0], em_curso[0])
+        time.sleep(0.02)
+        with lock:
+            em_curso[0] -= 1
+        return ok()
+
+    cascata(provedor("geoapi", lento))
+    geocoder.valida_ruas_em_lote([f"Rua {i}" for i in range(12)], ["1000-001"] * 12, max_workers=8)
+
+    assert maximo[0] == 2
+
+
+def test_uma_excecao_nao_interrompe_o_lote(cascata, monkeypatch):
+    cascata(provedor("geoapi", _por_endereco))
+    original = geocoder.valida_rua
+
+    def valida_rua(endereco, cep):
+        if endereco == "Rua Partida":
+            raise RuntimeError("falha inesperada")
+        return original(endereco, cep)
+
+    monkeypatch.setattr(geocoder, "valida_rua", valida_rua)
+    resultados = geocoder.valida_ruas_em_lote(["Rua A", "Rua Partida", "Rua B"], ["1000-001"] * 3, max_workers=2)
+
+    assert [r["status"] for r in resultados] == ["OK", "ALL_PROVIDERS_FAILED", "OK"]
+    assert "falha inesperada" in resultados[1]["erros"][0]
+
+
+def test_lista_vazia():
+    assert geocoder.valida_ruas_em_lote([], []) == []
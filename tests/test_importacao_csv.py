@@ -0,0 +1,76 @@
+# tests/test_importacao_csv.py
+"""Importação de CSV em blocos: mesmo resultado que a leitura integral, ids numerados no ficheiro inteiro."""
+
+import io
+
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app.routes import importacao
+from app.utils import parser
+
+from conftest import ok, provedor
+
+
+def _csv(linhas: list, cabecalho: str, titulo: str = None) -> io.BytesIO:
+    texto = ([titulo] if titulo else []) + [cabecalho] + linhas
+    return io.BytesIO(("\n".join(texto) + "\n").encode("utf-8"))
+
+
+@pytest.fixture
+def geocodifica_tudo(cascata):
+    cascata(provedor("geoapi", lambda endereco, cep: ok(
+        lat=38.0 + int(cep[:4]) / 1e4, lng=-9.0, route_encontrada=endereco.split(",")[0]
+    )))
+
+
+@pytest.mark.parametrize("tamanho_bloco", [1, 2, 3, 100])
+def test_blocos_iguais_a_leitura_integral(tamanho_bloco):
+    linhas = [f"Rua {i}, {i};{1000 + i}-001" for i in range(7)]
+    integral = parser.extrair_dataframe(pd.read_csv(_csv(linhas, "Morada;Codigo Postal"), sep=";", dtype=str))
+
+    formato, blocos = parser.iterar_csv_em_blocos(_csv(linhas, "Morada;Codigo Postal"), tamanho_bloco)
+    unidos = pd.concat(list(blocos), ignore_index=True)
+
+    assert formato == "delnext"
+    pd.testing.assert_frame_equal(unidos, integral)
+    assert unidos["order_number"].tolist() == [f"D{i}" for i in range(1, 8)]
+
+
+def test_linha_de_titulo_antes_do_cabecalho():
+    stream = _csv(["Rua A;1000-001;E1", "Rua B;2000-002;E2"], "Endereco;CEP;Order", titulo="Exportação de 01/01")
+
+    assert parser.detectar_csv(stream) == {"sep": ";", "skiprows": 1, "formato": "paack"}
+    assert stream.tell() == 0
+
+
+def test_formato_desconhecido():
+    formato, blocos = parser.iterar_csv_em_blocos(_csv(["a,b"], "coluna1,coluna2"), 10)
+
+    assert formato is None
+    assert list(blocos) == []
+
+
+def test_ids_por_omissao_continuam_entre_blocos(geocodifica_tudo, monkeypatch):
+    monkeypatch.setattr(importacao, "IMPORT_CSV_CHUNK_ROWS", 2)
+    linhas = [f"Rua {i},{1000 + i}-001," for i in range(1, 5)] + ["Rua 5,1005-001,ENC-9"]
+    ficheiro = FileStorage(stream=_csv(linhas, "Endereco,CEP,Order"), filename="paack.csv")
+
+    df = importacao._processar_csv_em_blocos(ficheiro)
+
+    assert df["order_number"].tolist() == ["PAACK-1", "PAACK-2", "PAACK-3", "PAACK-4", "ENC-9"]
+    assert df["address"].tolist() == [f"Rua {i}" for i in range(1, 6)]
+    assert set(df["status_google"]) == {"OK"}
+
+
+def test_blocos_iguais_ao_ficheiro_numa_so_leitura(geocodifica_tudo, monkeypatch):
+    linhas = [f"Rua {i},{1000 + i}-001," for i in range(1, 8)]
+    monkeypatch.setattr(importacao, "IMPORT_CSV_CHUNK_ROWS", 3)
+    em_blocos = importacao._processar_csv_em_blocos(
+        FileStorage(stream=_csv(linhas, "Endereco,CEP,Order"), filename="paack.csv"))
+    monkeypatch.setattr(importacao, "IMPORT_CSV_CHUNK_ROWS", 1000)
+    num_bloco = importacao._processar_csv_em_blocos(
+        FileStorage(stream=_csv(linhas, "Endereco,CEP,Order"), filename="paack.csv"))
+
+    pd.testing.assert_frame_equal(em_blocos, num_bloco)
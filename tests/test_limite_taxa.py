@@ -0,0 +1,149 @@
+# tests/test_limite_taxa.py
+"""Limite de pedidos por provedor (token bucket partilhado entre threads e workers)."""
+
+import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import limite_taxa
+
+CFG = {"qps": 10.0, "rajada": 3.0}
+
+
+def test_reserva_rajada_e_depois_um_pedido_a_cada_intervalo():
+    tokens, agora, esperas = CFG["rajada"], 100.0, []
+    for _ in range(6):
+        tokens, espera = limite_taxa._reserva(tokens, agora, agora, CFG, espera_max=10)
+        esperas.append(espera)
+
+    assert esperas == pytest.approx([0, 0, 0, 0.1, 0.2, 0.3])
+
+
+def test_reserva_repoe_tokens_com_o_tempo_ate_a_rajada():
+    tokens, espera = limite_taxa._reserva(-2.0, 100.0, 100.5, CFG, espera_max=10)
+    assert (tokens, espera) == (pytest.approx(2.0), 0.0)
+
+    tokens, espera = limite_taxa._reserva(0.0, 100.0, 200.0, CFG, espera_max=10)
+    assert tokens == pytest.approx(CFG["rajada"] - 1)
+
+
+def test_reserva_recusada_nao_consome_token():
+    tokens, espera = limite_taxa._reserva(-5.0, 100.0, 100.0, CFG, espera_max=0.5)
+
+    assert espera is None
+    assert tokens == -5.0
+
+
+def test_configuracao_por_variaveis_de_ambiente(monkeypatch):
+    monkeypatch.setenv("LIMITE_TAXA_GEOAPI_QPS", "2.5")
+    monkeypatch.setenv("LIMITE_TAXA_GEOAPI_RAJADA", "0")
+
+    assert limite_taxa.configuracao("geoapi") == {"qps": 2.5, "rajada": 1.0}
+    assert limite_taxa.configuracao("desconhecido") == {"qps": 0.0, "rajada": 1.0}
+
+
+@pytest.fixture(params=["arquivo", "redis"])
+def backend(request, monkeypatch, tmp_path):
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        backend = limite_taxa.RedisBackend(fakeredis.FakeStrictRedis())
+    else:
+        backend = limite_taxa.ArquivoBackend(str(tmp_path))
+    monkeypatch.setattr(limite_taxa, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def relogio_parado(monkeypatch):
+    """Relógio do limite parado: as esperas dependem só da ordem das reservas."""
+    monkeypatch.setattr(limite_taxa, "time", SimpleNamespace(time=lambda: 1000.0, sleep=time.sleep))
+
+
+def test_threads_formam_uma_fila_justa(backend, relogio_parado):
+    cfg = {"qps": 50.0, "rajada": 1.0}
+    esperas = []
+    lock = threading.Lock()
+
+    def reserva():
+        espera, _ = backend.reservar("geoapi", cfg, 10)
+        with lock:
+            esperas.append(espera)
+
+    threads = [threading.Thread(target=reserva) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Cada reserva fica com a sua vez (0, 20ms, 40ms, ...): nenhuma se perde nem se repete
+    assert sorted(esperas) == pytest.approx([i / 50 for i in range(20)])
+
+
+def _reserva_noutro_processo(diretorio, n, fila):
+    backend = limite_taxa.ArquivoBackend(diretorio)
+    fila.put([backend.reservar("geoapi", {"qps": 100.0, "rajada": 1.0}, 10)[0] for _ in range(n)])
+
+
+def test_arquivo_partilhado_entre_processos(tmp_path, relogio_parado):
+    contexto = multiprocessing.get_context("fork")
+    fila = contexto.Queue()
+    processos = [contexto.Process(target=_reserva_noutro_processo, args=(str(tmp_path), 10, fila)) for _ in range(3)]
+    for p in processos:
+        p.start()
+    esperas = sorted(espera for _ in processos for espera in fila.get(timeout=10))
+    for p in processos:
+        p.join()
+
+    # 30 reservas a 100/s vindas de três processos: uma saída a cada 10ms
+    assert esperas == pytest.approx([i / 100 for i in range(30)])
+
+
+def test_aguardar_dorme_ate_a_sua_vez(backend, monkeypatch):
+    monkeypatch.setenv("LIMITE_TAXA_GEOAPI_QPS", "20")
+    monkeypatch.setenv("LIMITE_TAXA_GEOAPI_RAJADA", "1")
+    inicio = time.monotonic()
+
+    esperas = [limite_taxa.aguardar("geoapi") for _ in range(4)]
+
+    assert esperas[0] == 0.0
+    assert time.monotonic() - inicio == pytest.approx(0.15, abs=0.04)
+
+
+def test_aguardar_recusa_fila_longa(backend, monkeypatch):
+    monkeypatch.setenv("LIMITE_TAXA_GEOAPI_QPS", "1")
+    monkeypatch.setenv("LIMITE_TAXA_GEOAPI_RAJADA", "1")
+    limite_taxa.aguardar("geoapi", espera_max=0.5)
+
+    with pytest.raises(limite_taxa.LimiteExcedido) as excinfo:
+        limite_taxa.aguardar("geoapi", espera_max=0.5)
+
+    assert excinfo.value.provider == "geoapi"
+    assert excinfo.value.espera == pytest.approx(1.0, abs=0.05)
+
+
+def test_sem_limite_nao_espera(backend, monkeypatch):
+    monkeypatch.setenv("LIMITE_TAXA_MAPBOX_QPS", "0")
+
+    assert [limite_taxa.aguardar("mapbox") for _ in range(100)] == [0.0] * 100
+
+
+def test_penalizar_adia_as_proximas_reservas(backend, monkeypatch):
+    cfg = {"qps": 10.0, "rajada": 5.0}
+    monkeypatch.setenv("LIMITE_TAXA_GOOGLE_QPS", "10")
+    monkeypatch.setenv("LIMITE_TAXA_GOOGLE_RAJADA", "5")
+
+    limite_taxa.penalizar("google", 2.0)
+    espera, _ = backend.reservar("google", cfg, 10)
+
+    assert espera == pytest.approx(2.1, abs=0.02)
+
+
+def test_retry_after():
+    assert limite_taxa.retry_after(SimpleNamespace(headers={"Retry-After": "3"})) == 3.0
+    assert limite_taxa.retry_after(SimpleNamespace(headers={"Retry-After": "-1"})) == 0.0
+    assert limite_taxa.retry_after(SimpleNamespace(headers={}), padrao=7) == 7
+    assert limite_taxa.retry_after(SimpleNamespace(headers={"Retry-After": "Wed, 21 Oct"}), padrao=2) == 2
+    assert limite_taxa.retry_after(None) == limite_taxa.LIMITE_TAXA_PENALIZACAO
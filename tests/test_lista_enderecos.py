@@ -0,0 +1,115 @@
+# tests/test_lista_enderecos.py
+"""Lista de endereços guardada por linha (SQLite e Redis): cada operação lê e grava só as linhas afetadas."""
+
+import pytest
+
+from app.utils import lista_enderecos
+
+ITENS = [
+    {"order_number": "A1", "address": "Rua A, 1", "cep": "1000-001"},
+    {"order_number": "B2", "address": "Rua B, 2", "cep": "1000-002"},
+    {"order_number": "A1", "address": "Rua A, 1 (repetido)", "cep": "1000-001"},
+    {"order_number": "C3", "address": "Rua C, 3", "cep": "1000-003"},
+]
+
+
+@pytest.fixture
+def lista(lista_backend):
+    lista_enderecos.substituir("lista", ITENS)
+    return "lista"
+
+
+def test_substituir_e_listar(lista):
+    assert lista_enderecos.listar(lista) == ITENS
+    assert lista_enderecos.contar(lista) == 4
+    assert [seq for seq, _ in lista_enderecos.listar_com_seq(lista)[1]] == [1, 2, 3, 4]
+
+    lista_enderecos.substituir(lista, ITENS[:1])
+    assert lista_enderecos.listar(lista) == ITENS[:1]
+
+
+def test_listas_independentes(lista):
+    lista_enderecos.substituir("outra", ITENS[1:2])
+
+    assert lista_enderecos.listar("outra") == ITENS[1:2]
+    assert lista_enderecos.contar(lista) == 4
+    assert lista_enderecos.listar("inexistente") == []
+
+
+def test_iterar_blocos(lista):
+    assert list(lista_enderecos.iterar_blocos(lista, tamanho_bloco=3)) == [ITENS[:3], ITENS[3:]]
+
+
+def test_procurar_por_order_number_usa_a_primeira_linha(lista):
+    assert lista_enderecos.procurar(lista, " A1 ") == (1, ITENS[0])
+    assert lista_enderecos.procurar(lista, "C3") == (4, ITENS[3])
+    assert lista_enderecos.procurar(lista, "Z9") is None
+
+
+def test_obter_e_na_posicao(lista):
+    assert lista_enderecos.obter(lista, 2) == ITENS[1]
+    assert lista_enderecos.obter(lista, 99) is None
+    lista_enderecos.remover(lista, [1])
+
+    assert lista_enderecos.na_posicao(lista, 0) == (2, ITENS[1])
+    assert lista_enderecos.na_posicao(lista, 2) == (4, ITENS[3])
+    assert lista_enderecos.na_posicao(lista, 3) is None
+    assert lista_enderecos.na_posicao(lista, -1) is None
+
+
+def test_atualizar_reindexa_o_order_number(lista):
+    assert lista_enderecos.atualizar(lista, 2, {**ITENS[1], "order_number": "B9"})
+
+    assert lista_enderecos.procurar(lista, "B2") is None
+    assert lista_enderecos.procurar(lista, "B9")[0] == 2
+    assert lista_enderecos.listar(lista)[0] == ITENS[0]
+    assert lista_enderecos.atualizar(lista, 99, ITENS[0]) == 0
+
+
+def test_atualizar_varios_ignora_linhas_removidas(lista):
+    lista_enderecos.remover(lista, [3])
+
+    gravados, _ = lista_enderecos.atualizar_varios(lista, {
+        1: {**ITENS[0], "cep": "9999-999"}, 3: ITENS[2], 4: {**ITENS[3], "cep": "8888-888"},
+    })
+
+    assert gravados == [1, 4]
+    assert [item["cep"] for item in lista_enderecos.listar(lista)] == ["9999-999", "1000-002", "8888-888"]
+
+
+def test_acrescentar_nunca_reutiliza_seqs(lista):
+    lista_enderecos.remover(lista, [4])
+    seq, _ = lista_enderecos.acrescentar(lista, {"order_number": "D4", "address": "Rua D"})
+
+    assert seq == 5
+    assert lista_enderecos.procurar(lista, "D4") == (5, {"order_number": "D4", "address": "Rua D"})
+
+
+def test_remover_por_order_number_remove_todas_as_linhas(lista):
+    removidos, _ = lista_enderecos.remover_por_order_number(lista, "A1")
+
+    assert removidos == 2
+    assert lista_enderecos.procurar(lista, "A1") is None
+    assert lista_enderecos.listar(lista) == [ITENS[1], ITENS[3]]
+    assert lista_enderecos.remover(lista, [1, 3])[0] == 0
+
+
+class _Sessao(dict):
+    """Substituto da sessão Flask (um dict com o atributo `modified`)."""
+    modified = False
+
+
+def test_sessao_guarda_so_o_id(lista_backend):
+    sessao = _Sessao({"lista": ITENS[:2], "outro": 1})
+
+    lista_id = lista_enderecos.id_da_sessao(sessao)
+
+    assert sessao == {lista_enderecos.SESSAO_CHAVE: lista_id, "outro": 1}
+    assert sessao.modified
+    assert lista_enderecos.listar(lista_id) == ITENS[:2]
+
+    novo_id = lista_enderecos.guardar_na_sessao(sessao, ITENS[2:], limpar_sessao=True)
+    assert novo_id != lista_id
+    assert sessao == {lista_enderecos.SESSAO_CHAVE: novo_id}
+    assert lista_enderecos.listar(lista_id) == []
+    assert lista_enderecos.listar(novo_id) == ITENS[2:]
@@ -0,0 +1,138 @@
+# tests/test_lista_versoes.py
+"""Versões e deltas da lista de endereços: `alteracoes(desde)`, escritas concorrentes e ETag/delta na API."""
+
+import threading
+
+import pytest
+
+from app.utils import lista_enderecos
+
+from conftest import ok, provedor
+
+
+def _item(order_number: str, **campos) -> dict:
+    return {"order_number": order_number, "address": f"Rua {order_number}", **campos}
+
+
+def test_cada_escrita_incrementa_a_versao(lista_backend):
+    v1 = lista_enderecos.substituir("l", [_item("A"), _item("B")])
+    v2 = lista_enderecos.atualizar("l", 1, _item("A", cep="1000-001"))
+    _, v3 = lista_enderecos.acrescentar("l", _item("C"))
+    _, v4 = lista_enderecos.remover("l", [2])
+
+    assert [v1, v2, v3, v4] == [1, 2, 3, 4]
+    assert lista_enderecos.versao("l") == 4
+    # Escritas que não encontram nenhuma linha não mudam a versão
+    assert lista_enderecos.remover("l", [2]) == (0, 4)
+    assert lista_enderecos.atualizar_varios("l", {2: _item("B")}) == ([], 4)
+
+
+def test_alteracoes_desde_uma_versao(lista_backend):
+    v1 = lista_enderecos.substituir("l", [_item("A"), _item("B"), _item("C")])
+    lista_enderecos.atualizar("l", 1, _item("A", cep="1000-001"))
+    lista_enderecos.acrescentar("l", _item("D"))
+    lista_enderecos.remover("l", [2])
+    lista_enderecos.atualizar("l", 4, _item("D", cep="4000-004"))
+
+    delta = lista_enderecos.alteracoes("l", v1)
+
+    assert delta["versao"] == 5 and delta["desde"] == v1
+    assert delta["alterados"] == [{"seq": 1, "item": _item("A", cep="1000-001")}]
+    # Um item criado e depois alterado depois de `desde` continua a ser "adicionado"
+    assert delta["adicionados"] == [{"seq": 4, "item": _item("D", cep="4000-004")}]
+    assert delta["removidos"] == [2]
+
+    assert lista_enderecos.alteracoes("l", 5) == {
+        "versao": 5, "desde": 5, "adicionados": [], "alterados": [], "removidos": []
+    }
+
+
+def test_aplicar_o_delta_reconstroi_a_lista(lista_backend):
+    lista_enderecos.substituir("l", [_item(str(i)) for i in range(6)])
+    versao_cliente, linhas = lista_enderecos.listar_com_seq("l")
+    copia = dict(linhas)
+
+    lista_enderecos.atualizar_varios("l", {2: _item("x"), 5: _item("y")})
+    lista_enderecos.remover("l", [1, 6])
+    lista_enderecos.acrescentar("l", _item("z"))
+    delta = lista_enderecos.alteracoes("l", versao_cliente)
+    for linha in delta["adicionados"] + delta["alterados"]:
+        copia[linha["seq"]] = linha["item"]
+    for seq in delta["removidos"]:
+        copia.pop(seq, None)
+
+    assert [copia[seq] for seq in sorted(copia)] == lista_enderecos.listar("l")
+
+
+def test_escritas_concorrentes_nao_se_perdem(lista_backend):
+    lista_enderecos.substituir("l", [])
+    versao_inicial = lista_enderecos.versao("l")
+    seqs, erros = [], []
+
+    def acrescenta(thread):
+        try:
+            for i in range(25):
+                seqs.append(lista_enderecos.acrescentar("l", _item(f"{thread}-{i}"))[0])
+        except Exception as e:  # pragma: no cover - só em caso de falha
+            erros.append(e)
+
+    threads = [threading.Thread(target=acrescenta, args=(t,)) for t in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not erros
+    assert sorted(seqs) == list(range(1, 151))
+    assert lista_enderecos.contar("l") == 150
+    assert lista_enderecos.versao("l") == versao_inicial + 150
+    assert len(lista_enderecos.alteracoes("l", versao_inicial)["adicionados"]) == 150
+    assert lista_enderecos.procurar("l", "5-24")[1] == _item("5-24")
+
+
+@pytest.fixture
+def api(cliente_app, cascata):
+    cascata(provedor("geoapi", lambda endereco, cep: ok(route_encontrada=endereco.split(",")[0])))
+    return cliente_app
+
+
+def _adiciona(api, order_number: str, **extra):
+    resposta = api.post("/api/add-address", json={
+        "id": order_number, "endereco": f"Rua {order_number}, 1", "cep": "1000-001", **extra
+    })
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def test_api_etag_e_304(api):
+    _adiciona(api, "A")
+
+    resposta = api.get("/api/lista")
+    corpo = resposta.get_json()
+    assert [linha["item"]["order_number"] for linha in corpo["itens"]] == ["A"]
+    etag = resposta.headers["ETag"]
+    assert etag == f'"{corpo["lista_id"]}-{corpo["versao"]}"'
+
+    assert api.get("/api/lista", headers={"If-None-Match": etag}).status_code == 304
+    _adiciona(api, "B")
+    assert api.get("/api/lista", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_api_delta_desde_a_versao_do_cliente(api):
+    primeiro = _adiciona(api, "A")
+    lista_id, versao = primeiro["lista_id"], primeiro["versao"]
+
+    segundo = _adiciona(api, "B", versao=versao)
+    assert [linha["item"]["order_number"] for linha in segundo["delta"]["adicionados"]] == ["B"]
+
+    removido = api.post("/api/remover-endereco", json={"seq": primeiro["seq"], "versao": segundo["versao"]}).get_json()
+    assert removido["delta"]["removidos"] == [primeiro["seq"]]
+
+    delta = api.get(f"/api/lista?desde={versao}&lista={lista_id}").get_json()
+    assert delta["versao"] == removido["versao"]
+    assert [linha["seq"] for linha in delta["adicionados"]] == [segundo["seq"]]
+    assert delta["removidos"] == [primeiro["seq"]]
+
+    # Com o id de outra lista (ex.: depois de uma nova importação) a resposta é a lista completa
+    completa = api.get(f"/api/lista?desde={versao}&lista=outra").get_json()
+    assert [linha["seq"] for linha in completa["itens"]] == [segundo["seq"]]
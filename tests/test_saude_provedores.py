@@ -0,0 +1,136 @@
+# tests/test_saude_provedores.py
+"""Disjuntores dos provedores: abertura por erros, pedido de teste único e efeito nas cascatas."""
+
+import time
+
+import pytest
+
+from app.utils import geocoder, google
+
+from conftest import ok, provedor
+
+ERRO = {"status": "ERROR", "msg": "HTTP 500"}
+NAO_ENCONTRADO = {"status": "NOT_FOUND"}
+
+
+def _regista(saude, resultados, provedor_nome="geoapi"):
+    for resultado in resultados:
+        saude.registar(provedor_nome, resultado, 0.05)
+
+
+def _novo_worker(saude, monkeypatch):
+    """Outro processo: estado local vazio, mesmo armazenamento partilhado."""
+    monkeypatch.setattr(saude, "_estado", None)
+
+
+def test_classificar(saude):
+    assert saude.classificar({"status": "OK_CEP"}) == saude.ACERTO
+    assert saude.classificar(NAO_ENCONTRADO) == saude.FALHA
+    assert saude.classificar({"status": "API_KEY_MISSING"}) == saude.IGNORADO
+    assert saude.classificar({"status": "REQUEST_DENIED"}) == saude.IGNORADO
+    assert saude.classificar(ERRO) == saude.ERRO
+    assert saude.classificar(None) == saude.ERRO
+
+
+def test_abre_apos_erros_seguidos(saude, monkeypatch):
+    _regista(saude, [ERRO] * 4)
+    assert saude.disponivel("geoapi")
+
+    saude.registar("geoapi", TimeoutError("timeout"), 5.0)
+
+    assert not saude.disponivel("geoapi")
+    assert saude.disponivel("mapbox")
+    _novo_worker(saude, monkeypatch)
+    assert not saude.disponivel("geoapi")
+
+
+def test_respostas_validas_nao_contam_como_erro(saude):
+    _regista(saude, [ERRO] * 4 + [NAO_ENCONTRADO] + [ERRO] * 4 + [{"status": "ZERO_RESULTS"}] + [ERRO] * 4)
+
+    assert saude.disponivel("geoapi")
+
+
+def test_falta_de_configuracao_nao_abre_o_disjuntor(saude):
+    _regista(saude, [{"status": "API_KEY_MISSING"}, {"status": "REQUEST_DENIED"}] * 10, "google")
+
+    assert saude.disponivel("google")
+    assert "google" not in saude.estatisticas().get("provedores", {})
+
+
+def test_abre_pela_taxa_de_erro_na_janela(saude, monkeypatch):
+    monkeypatch.setattr(saude, "GEOCODER_BREAKER_MIN_AMOSTRAS", 10)
+    # Nunca dois erros seguidos, mas metade das chamadas falha
+    _regista(saude, [ok(), ERRO] * 4)
+    assert saude.disponivel("geoapi")
+
+    _regista(saude, [ok(), ERRO])
+
+    assert not saude.disponivel("geoapi")
+
+
+def test_um_unico_pedido_de_teste_depois_da_espera(saude, monkeypatch):
+    monkeypatch.setattr(saude, "GEOCODER_BREAKER_ESPERA", 0.05)
+    _regista(saude, [ERRO] * 5)
+    assert not saude.disponivel("geoapi")
+    time.sleep(0.06)
+
+    assert saude.disponivel("geoapi")
+    assert not saude.disponivel("geoapi")
+    _novo_worker(saude, monkeypatch)
+    assert not saude.disponivel("geoapi")
+
+
+def test_pedido_de_teste_com_sucesso_fecha(saude, monkeypatch):
+    monkeypatch.setattr(saude, "GEOCODER_BREAKER_ESPERA", 0.05)
+    _regista(saude, [ERRO] * 5)
+    time.sleep(0.06)
+    assert saude.disponivel("geoapi")
+
+    saude.registar("geoapi", NAO_ENCONTRADO, 0.05)
+
+    assert saude.disponivel("geoapi")
+    assert saude.disponivel("geoapi")
+    _novo_worker(saude, monkeypatch)
+    assert saude.disponivel("geoapi")
+
+
+def test_pedido_de_teste_falhado_volta_a_abrir(saude, monkeypatch):
+    monkeypatch.setattr(saude, "GEOCODER_BREAKER_ESPERA", 0.05)
+    _regista(saude, [ERRO] * 5)
+    time.sleep(0.06)
+    assert saude.disponivel("geoapi")
+    monkeypatch.setattr(saude, "GEOCODER_BREAKER_ESPERA", 30)
+
+    saude.registar("geoapi", ERRO, 0.05)
+
+    time.sleep(0.06)
+    assert not saude.disponivel("geoapi")
+
+
+@pytest.mark.parametrize("hedge_ms", [0, 20])
+def test_cascata_salta_o_provedor_com_disjuntor_aberto(saude, cascata, monkeypatch, hedge_ms):
+    monkeypatch.setattr(geocoder, "HEDGE_DELAY_MS", hedge_ms)
+    chamadas = []
+    cascata(provedor("geoapi", ERRO, chamadas=chamadas), provedor("mapbox", ok(lat=2.0), chamadas=chamadas))
+
+    for i in range(5):
+        assert geocoder._valida_rua_cascata(f"Rua {i}", "1000-001")[1] == "mapbox"
+    chamadas.clear()
+    resultado, vencedor = geocoder._valida_rua_cascata("Rua X", "1000-001")
+
+    assert vencedor == "mapbox"
+    assert [nome for nome, _, _ in chamadas] == ["mapbox"]
+
+
+def test_google_sem_chave_fica_fora_da_cascata(saude, cascata, monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    cascata(provedor("geoapi", NAO_ENCONTRADO), google.valida_rua_google)
+
+    resultado, vencedor = geocoder._valida_rua_cascata("Rua A", "1000-001")
+
+    assert vencedor is None
+    assert resultado["erros"] == [{"geoapi": NAO_ENCONTRADO}]
+    assert geocoder._provedores(geocoder.GEOCODER_PRIORITY) == geocoder.GEOCODER_PRIORITY[:1]
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "chave")
+    assert geocoder._provedores(geocoder.GEOCODER_PRIORITY) == geocoder.GEOCODER_PRIORITY